@@ -0,0 +1,265 @@
+"""ASGI entry point: serves the chat engine from an asyncio event loop.
+
+The Flask app in main.py stays the WSGI entry point (python main.py, or
+gunicorn main:app). This module exposes the same routes natively on ASGI, so
+idle keep-alive and streaming connections cost no worker thread:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import secrets
+import time
+from http.cookies import SimpleCookie
+
+import main
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+# Batches can take a while to answer, so they run off the event loop
+OFFLOAD_HANDLERS = {main.handle_chat_batch}
+
+# Identical offloaded requests in flight at the same time share one computation.
+# Other handlers run inline on the loop, so identical ones can't overlap: the
+# second finds the first's answer in the response cache.
+OFFLOAD_INFLIGHT = main.AsyncSingleFlight()
+
+# Conversation id cookie; the Flask app keeps it in its signed session instead
+SESSION_COOKIE = 'chat_sid'
+
+# Routes that take part in a conversation and so need a session id
+CONVERSATION_ROUTES = {'/chat', '/chat/stream'}
+
+POST_ROUTES = {
+    '/chat': main.handle_chat,
+    '/chat/stream': main.handle_chat_stream,
+    '/chat/batch': main.handle_chat_batch,
+    '/clear': main.handle_clear,
+}
+
+# read_body result for a body over main.CHAT_MAX_BODY_BYTES
+BODY_TOO_LARGE = object()
+
+async def read_body(receive, limit):
+    """The request body, None if the client went away, or BODY_TOO_LARGE past limit bytes"""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if len(body) > limit:
+            return BODY_TOO_LARGE
+        more_body = message.get('more_body', False)
+    return body
+
+async def send_response(send, status, body, content_type, headers=(), head=False):
+    """Send a whole response; for a HEAD request only its headers, with the full body's length"""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode('latin-1')),
+                    (b'content-length', str(len(body)).encode('latin-1'))] + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+def request_header(scope, name):
+    """Value of a request header (name in lowercase bytes), or an empty string"""
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+def encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+
+def client_address(scope):
+    """Address the rate limit is keyed on"""
+    if main.CHAT_CLIENT_HEADER:
+        address = request_header(scope, main.CHAT_CLIENT_HEADER.lower().encode('latin-1'))
+        if address:
+            return address
+    client = scope.get('client')
+    return client[0] if client else ''
+
+def request_session_id(scope):
+    """Conversation id from the request cookie, or None"""
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            morsel = SimpleCookie(value.decode('latin-1')).get(SESSION_COOKIE)
+            if morsel is not None:
+                return morsel.value
+    return None
+
+async def send_stream(send, chunks, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8')] + headers,
+    })
+    for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def send_cached(scope, send, handler, *args):
+    """Answer with a handler serving a CachedBody, passing it the negotiation headers"""
+    status, body, headers = handler(*args, request_header(scope, b'accept-encoding'), request_header(scope, b'if-none-match'))
+    content_type = headers.pop('Content-Type')
+    await send_response(send, status, body, content_type, encode_headers(headers), head=scope['method'] == 'HEAD')
+
+async def serve_static(scope, send, path):
+    if path.startswith('/static/dist/'):
+        await send_cached(scope, send, main.handle_asset, path[len('/static/dist/'):])
+        return
+    filename = os.path.normpath(os.path.join(STATIC_DIR, path[len('/static/'):]))
+    if not filename.startswith(STATIC_DIR + os.sep) or not os.path.isfile(filename):
+        await send_response(send, 404, b'Not Found', 'text/plain')
+        return
+    with open(filename, 'rb') as f:
+        body = await asyncio.to_thread(f.read)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    await send_response(send, 200, body, content_type, head=scope['method'] == 'HEAD')
+
+async def http(scope, receive, send):
+    path = scope['path']
+    method = scope['method']
+
+    if path == '/metrics':
+        status, body = main.handle_metrics()
+        await send_response(send, status, body, main.METRICS_CONTENT_TYPE, head=method == 'HEAD')
+        return
+    if path == '/':
+        if method not in ('GET', 'HEAD'):
+            await send_response(send, 405, b'Method Not Allowed', 'text/plain')
+        else:
+            await send_cached(scope, send, main.handle_index)
+        return
+    if path.startswith('/static/'):
+        await serve_static(scope, send, path)
+        return
+
+    tenant, route = split_tenant(path)
+    handler = POST_ROUTES.get(route)
+    if handler is None:
+        await send_response(send, 404, b'Not Found', 'text/plain')
+        return
+    if method != 'POST':
+        await send_response(send, 405, b'Method Not Allowed', 'text/plain')
+        return
+
+    await answer(scope, receive, send, route, handler, tenant, route_label(path) in main.ADMITTED_ROUTES)
+
+def split_tenant(path):
+    """(tenant, route) for /t/<tenant>/<route>, else (None, path)"""
+    if path.startswith('/t/'):
+        tenant, _, route = path[3:].partition('/')
+        if tenant and route:
+            return tenant, '/' + route
+    return None, path
+
+async def answer(scope, receive, send, route, handler, tenant=None, admission=False):
+    """Read a POST route's JSON body and send its handler's response.
+
+    Routes under admission control are admitted once the body is parsed,
+    since a batch costs one rate limit token per message.
+    """
+    length = request_header(scope, b'content-length')
+    if length.isdigit() and int(length) > main.CHAT_MAX_BODY_BYTES:
+        await send_response(send, 413, main.BODY_TOO_LARGE_ERROR, 'application/json')
+        return
+    body = await read_body(receive, main.CHAT_MAX_BODY_BYTES)
+    if body is None:
+        return
+    if body is BODY_TOO_LARGE:
+        await send_response(send, 413, main.BODY_TOO_LARGE_ERROR, 'application/json')
+        return
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        if handler is not main.handle_clear:
+            await send_response(send, 400, main.json_body({"success": False, "error": "Invalid JSON body."}), 'application/json')
+            return
+        data = None
+
+    if not admission:
+        await respond(scope, send, route, handler, tenant, body, data)
+        return
+    rejection = main.admit(client_address(scope), main.request_cost(data))
+    if rejection is not None:
+        status, payload, headers = rejection
+        await send_response(send, status, payload, 'application/json', encode_headers(headers))
+        return
+    started = time.perf_counter()
+    try:
+        await respond(scope, send, route, handler, tenant, body, data)
+    finally:
+        main.release(time.perf_counter() - started)
+
+async def respond(scope, send, route, handler, tenant, body, data):
+    """Pick the chatbot answering the request and send its handler's response"""
+    if tenant is None and not main.tenants.names():
+        bot = main.chatbot
+    else:
+        # Loading a tenant's knowledge base reads and indexes a file, so it runs off the loop
+        bot = await asyncio.to_thread(main.select_bot, tenant, request_header(scope, b'host'))
+    if bot is None:
+        await send_response(send, 404, main.UNKNOWN_TENANT_ERROR, 'application/json')
+        return
+
+    headers = []
+    session_id = request_session_id(scope)
+    if session_id is None and route in CONVERSATION_ROUTES:
+        session_id = secrets.token_urlsafe(12)
+        headers.append((b'set-cookie', f'{SESSION_COOKIE}={session_id}; HttpOnly; Path=/; SameSite=Lax'.encode('latin-1')))
+
+    accept_encoding = request_header(scope, b'accept-encoding')
+    if handler in OFFLOAD_HANDLERS:
+        status, payload, extra_headers = await OFFLOAD_INFLIGHT.do(
+            (bot.tenant, route, body, accept_encoding),
+            lambda: asyncio.to_thread(handler, data, session_id, accept_encoding, bot))
+    else:
+        status, payload, extra_headers = handler(data, session_id, accept_encoding, bot)
+
+    headers += encode_headers(extra_headers)
+    if isinstance(payload, bytes):
+        await send_response(send, status, payload, 'application/json', headers)
+    else:
+        await send_stream(send, payload, headers)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            logging.info("ASGI chat app started.")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+def route_label(path):
+    """Same route labels as the Flask app, so metrics line up across serving modes"""
+    if path in POST_ROUTES or path in ('/', '/metrics'):
+        return path
+    tenant, route = split_tenant(path)
+    if tenant is not None and route in POST_ROUTES:
+        return '/t/<tenant>' + route
+    if path.startswith('/static/'):
+        return '/static/<path:filename>'
+    return 'unmatched'
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http':
+        started = time.perf_counter()
+
+        async def send_and_record(message):
+            if message['type'] == 'http.response.start':
+                main.record_request(route_label(scope['path']), message['status'], time.perf_counter() - started)
+            await send(message)
+
+        await http(scope, receive, send_and_record)
+    elif scope['type'] == 'lifespan':
+        await lifespan(receive, send)
@@ -0,0 +1,171 @@
+"""Microbenchmarks for the AdvancedChatbot pipeline stages.
+
+Times tokenize, extract_intent, get_contextual_response and
+generate_response separately over a realistic query corpus, and reports
+ns/op, memory allocated per op (peak traced bytes, and blocks still held
+afterwards) and throughput for each stage and corpus group.
+
+    python bench.py                              # print a table
+    python bench.py --output results.json        # also save the results
+    python bench.py --compare results.json       # diff against an earlier run
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from main import AdvancedChatbot, QUICK_QUESTIONS
+
+def build_corpus(seed=0):
+    """Query groups: quick questions, intent keywords, fallback-only and pathological inputs"""
+    rnd = random.Random(seed)
+    chatbot = AdvancedChatbot()
+    knowledge = chatbot.knowledge
+    keywords = [keyword for keywords in knowledge.intent_keywords.values() for keyword in keywords]
+    keyword_queries = [f"Tell me about {keyword} please" for keyword in keywords]
+
+    # Words from the knowledge base that hit no intent keyword go through the fallback
+    vocabulary = sorted({word for data in knowledge.knowledge_base.values() for value in data.values()
+                         for word in chatbot.tokenize(str(value))})
+    fallback_words = [word for word in vocabulary if chatbot.extract_intent([word]) == ['general']]
+    fallback_queries = [' '.join(rnd.sample(fallback_words, 3)) for _ in range(50)]
+    fallback_queries += ['xyzzy', 'qwerty asdf', 'lorem ipsum dolor sit amet']
+
+    pathological = [
+        'a' * 4000,
+        '!?' * 2000,
+        ' '.join(rnd.choice(fallback_words) for _ in range(500)),
+        ' '.join(keywords) * 5,
+        'hello ' * 800,
+    ]
+    return {
+        'quick_questions': list(QUICK_QUESTIONS),
+        'keywords': keyword_queries,
+        'fallback': fallback_queries,
+        'pathological': pathological,
+    }
+
+def stage_calls(chatbot, queries):
+    """Per-stage callables over prepared inputs, so each stage is timed on its own"""
+    processed = [chatbot.tokenize(query) for query in queries]
+    intents = [chatbot.extract_intent(query) for query in processed]
+    cold = AdvancedChatbot()
+    cold.response_cache.max_size = 0
+
+    return {
+        'tokenize': lambda: [chatbot.tokenize(query) for query in queries],
+        'extract_intent': lambda: [chatbot.extract_intent(query) for query in processed],
+        'get_contextual_response': lambda: [chatbot.get_contextual_response(query, found)
+                                            for query, found in zip(processed, intents)],
+        'generate_response': lambda: [cold.generate_response(query) for query in queries],
+        'generate_response_cached': lambda: [chatbot.generate_response(query) for query in queries],
+    }
+
+def measure(fn, ops, min_time):
+    """Run fn until min_time has passed; return ns/op, peak allocated bytes/op and retained blocks/op"""
+    fn()
+    rounds = 0
+    gc.disable()
+    try:
+        start = time.perf_counter_ns()
+        while True:
+            fn()
+            rounds += 1
+            elapsed = time.perf_counter_ns() - start
+            if elapsed >= min_time * 1e9:
+                break
+    finally:
+        gc.enable()
+    ns_per_op = elapsed / (rounds * ops)
+
+    # Allocations are counted in a separate run so tracing doesn't skew the timings
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    start_size = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1] - start_size
+    del result
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, 'filename'))
+    return ns_per_op, peak / ops, retained / ops
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(min_time, groups=None):
+    corpus = build_corpus()
+    chatbot = AdvancedChatbot()
+    results = []
+    for group, queries in corpus.items():
+        if groups and group not in groups:
+            continue
+        for stage, fn in stage_calls(chatbot, queries).items():
+            ns_per_op, peak_bytes_per_op, retained_blocks_per_op = measure(fn, len(queries), min_time)
+            results.append({
+                'group': group,
+                'stage': stage,
+                'queries': len(queries),
+                'ns_per_op': round(ns_per_op, 1),
+                'peak_bytes_per_op': round(peak_bytes_per_op, 1),
+                'retained_blocks_per_op': round(retained_blocks_per_op, 2),
+                'ops_per_sec': round(1e9 / ns_per_op, 1),
+            })
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results,
+    }
+
+def print_table(report, baseline=None):
+    previous = {}
+    if baseline:
+        previous = {(row['group'], row['stage']): row for row in baseline['results']}
+    header = f"{'group':<16} {'stage':<26} {'ns/op':>12} {'peak B/op':>10} {'kept/op':>8} {'ops/s':>12}"
+    if previous:
+        header += f" {'vs base':>9}"
+    print(header)
+    print('-' * len(header))
+    for row in report['results']:
+        line = (f"{row['group']:<16} {row['stage']:<26} {row['ns_per_op']:>12,.1f} "
+                f"{row['peak_bytes_per_op']:>10.1f} {row['retained_blocks_per_op']:>8.2f} {row['ops_per_sec']:>12,.0f}")
+        base = previous.get((row['group'], row['stage']))
+        if base:
+            line += f" {(row['ns_per_op'] / base['ns_per_op'] - 1) * 100:>+8.1f}%"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to run each benchmark (default 0.2)')
+    parser.add_argument('--group', action='append', help='only run this corpus group (repeatable)')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    report = run(args.min_time, args.group)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Comparing {report['revision']} against {baseline.get('revision')}")
+    print_table(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Build fingerprinted, precompressed static assets for the landing page.
+
+Pulls the inline CSS and JS out of templates/index.html, minifies them and
+writes them, with the favicons, to static/dist under content-hashed names
+(app.3f2a9c0d1e.css), each next to .gz and, when the brotli package is
+installed, .br variants. static/dist/manifest.json maps the plain names to
+the hashed ones, and templates/dist/index.html is the page rewritten to
+reference them. The app serves that template and these files whenever they
+exist; rerun this after editing the page:
+
+    python build_assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped without the brotli package
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE = os.path.join(ROOT, 'templates', 'index.html')
+STATIC_DIR = os.path.join(ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+TEMPLATE_DIST_DIR = os.path.join(ROOT, 'templates', 'dist')
+
+STYLE_RE = re.compile(r'<style>(.*?)</style>', re.S)
+SCRIPT_RE = re.compile(r'<script>(.*?)</script>', re.S)
+FAVICONS = ('favicon.ico', 'favicon.png')
+
+def minify_css(css):
+    """Drop comments and the whitespace around CSS punctuation"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    # Only after colons: a space before one can be a descendant selector (".a :hover")
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+def minify_js(js):
+    """Drop indentation, blank lines and whole-line comments.
+
+    Line breaks are kept, so automatic semicolon insertion and the page's
+    single-line template literals behave exactly as before.
+    """
+    lines = (line.strip() for line in js.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+def fingerprint(name, data):
+    """name with a short content hash before its extension"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+def write_asset(name, data):
+    """Write data under its hashed name plus the compressed variants that are smaller"""
+    hashed = fingerprint(name, data)
+    path = os.path.join(DIST_DIR, hashed)
+    with open(path, 'wb') as f:
+        f.write(data)
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+    return hashed
+
+def static_url(filename):
+    return "{{ url_for('static', filename='dist/%s') }}" % filename
+
+def build():
+    with open(TEMPLATE, encoding='utf-8') as f:
+        page = f.read()
+    style = STYLE_RE.search(page)
+    script = SCRIPT_RE.search(page)
+    if style is None or script is None:
+        raise ValueError(f"{TEMPLATE} has no inline <style> or <script> block to extract")
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+    manifest = {
+        'app.css': write_asset('app.css', minify_css(style.group(1)).encode('utf-8')),
+        'app.js': write_asset('app.js', minify_js(script.group(1)).encode('utf-8')),
+    }
+    for name in FAVICONS:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            manifest[name] = write_asset(name, f.read())
+    with open(os.path.join(DIST_DIR, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Replace the script first: its offsets come after the style block
+    page = (page[:script.start()] + f'<script src="{static_url(manifest["app.js"])}"></script>'
+            + page[script.end():])
+    page = (page[:style.start()] + f'<link rel="stylesheet" href="{static_url(manifest["app.css"])}">'
+            + page[style.end():])
+    for name in FAVICONS:
+        page = page.replace(f"url_for('static', filename='{name}')", f"url_for('static', filename='dist/{manifest[name]}')")
+    os.makedirs(TEMPLATE_DIST_DIR, exist_ok=True)
+    with open(os.path.join(TEMPLATE_DIST_DIR, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(page)
+    return manifest
+
+def main():
+    manifest = build()
+    for name, hashed in manifest.items():
+        path = os.path.join(DIST_DIR, hashed)
+        sizes = [f"{os.path.getsize(path)} B"]
+        sizes += [f"{os.path.getsize(path + suffix)} B {suffix[1:]}" for suffix in ('.gz', '.br')
+                  if os.path.exists(path + suffix)]
+        print(f"{name:<12} -> dist/{hashed:<24} {', '.join(sizes)}")
+    if brotli is None:
+        print("brotli is not installed; no .br variants were written")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
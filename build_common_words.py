@@ -0,0 +1,70 @@
+"""Regenerate common_words.txt, the English words the typo corrector leaves alone.
+
+The list is the 25,000 most frequent words of the English word frequency
+list shipped with pyspellchecker 0.9.1 (https://github.com/barrust/pyspellchecker,
+MIT License, Copyright (c) 2018-2021 Tyler Barrus), whose counts come from
+the OpenSubtitles2018 corpus (P. Lison and J. Tiedemann, "OpenSubtitles2016:
+Extracting Large Parallel Corpora from Movie and TV Subtitles", LREC 2016),
+keeping lowercase ASCII words of 5 to 24 letters: the lengths the corrector
+works on. Only this script needs pyspellchecker; the app just reads the
+text file:
+
+    pip install pyspellchecker==0.9.1
+    python build_common_words.py                     # its en.json.gz -> common_words.txt
+    python build_common_words.py path/to/en.json.gz --top 30000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = os.path.join(ROOT, 'common_words.txt')
+
+HEADER = """\
+# Common English words of five letters or more, which the typo corrector never rewrites.
+# The {top:,} most frequent words of the English frequency list of pyspellchecker
+# (https://github.com/barrust/pyspellchecker, MIT License, Copyright (c) 2018-2021 Tyler Barrus).
+# Its counts come from OpenSubtitles2018 (P. Lison and J. Tiedemann, LREC 2016).
+# Generated by build_common_words.py; rerun it rather than editing this file.
+"""
+
+MIN_LENGTH = 5
+MAX_LENGTH = 24
+
+def default_frequency_list():
+    """en.json.gz of the installed pyspellchecker, or None"""
+    try:
+        import spellchecker
+    except ImportError:
+        return None
+    return os.path.join(os.path.dirname(spellchecker.__file__), 'resources', 'en.json.gz')
+
+def common_words(frequencies, top):
+    """The top most frequent words (ties alphabetical), filtered to the corrector's lengths, sorted"""
+    ranked = sorted(frequencies.items(), key=lambda item: (-item[1], item[0]))[:top]
+    return sorted({word for word, _ in ranked
+                   if word.isascii() and word.isalpha() and word.islower() and MIN_LENGTH <= len(word) <= MAX_LENGTH})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('frequency_list', nargs='?', help="pyspellchecker's en.json.gz (default: the installed one's)")
+    parser.add_argument('--top', type=int, default=25000, help='most frequent words to consider (default 25000)')
+    parser.add_argument('--output', default=OUTPUT, help='file to write (default common_words.txt)')
+    args = parser.parse_args(argv)
+
+    path = args.frequency_list or default_frequency_list()
+    if path is None:
+        print("pyspellchecker is not installed: pip install pyspellchecker==0.9.1, or pass the path of en.json.gz")
+        return 1
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        words = common_words(json.load(f), args.top)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(HEADER.format(top=args.top))
+        f.write(''.join(word + '\n' for word in words))
+    print(f"{len(words)} words -> {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Production gunicorn profile for the chat app.
+
+gunicorn picks this file up automatically from the working directory:
+
+    gunicorn                         # or: gunicorn -c gunicorn.conf.py main:app
+
+The app is preloaded in the master, so the intent automaton, knowledge index,
+response table and warmed cache are built once and shared copy-on-write by
+every worker. Send HUP for a graceful worker reload; since code is preloaded,
+deploy new code with USR2 (start a new master) followed by QUIT to the old one.
+"""
+import gc
+import os
+
+def cpu_count():
+    """CPUs this process may run on, honouring affinity masks and cgroup pinning"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+wsgi_app = 'main:app'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Answering is CPU-bound under the GIL, so one process per core does the work
+# and a few threads per worker absorb slow clients and socket writes.
+workers = int(os.environ.get('GUNICORN_WORKERS', cpu_count() + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = 1000
+
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't build up; jitter avoids
+# restarting them all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 20000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+def on_starting(server):
+    """Start /metrics aggregation from a clean slate"""
+    import main
+
+    if main.METRICS.directory:
+        os.makedirs(main.METRICS.directory, exist_ok=True)
+        main.METRICS.clear_directory()
+
+def when_ready(server):
+    """Finish building shared state in the master before any worker is forked"""
+    import main
+
+    main.chatbot.warm()
+    # Move everything built so far out of the collector's reach: later
+    # collections in the workers then won't touch (and copy) these pages.
+    gc.collect()
+    gc.freeze()
+    server.log.info("Chat engine preloaded; %d objects frozen for copy-on-write sharing.", gc.get_freeze_count())
+
+def child_exit(server, worker):
+    """Keep an exited worker's counts in the /metrics totals"""
+    import main
+
+    if main.METRICS.directory:
+        main.METRICS.archive_process(worker.pid)
+
+def worker_exit(server, worker):
+    """Write the final snapshot of a worker that is shutting down"""
+    import main
+
+    main.METRICS.flush()
@@ -0,0 +1,313 @@
+"""Concurrent HTTP load generator comparing the app's serving modes.
+
+Starts the app locally in each requested serving mode, ramps up concurrent
+keep-alive clients against /chat, / and /clear with a weighted request mix,
+and reports throughput, error rate and p50/p95/p99/max latency per
+concurrency level. Everything runs on this machine over the loopback
+interface; clients are plain asyncio streams, so nothing beyond the app's
+own requirements is needed.
+
+    python loadgen.py                                   # all modes, default ramp
+    python loadgen.py --mode gunicorn-gthread --mode uvicorn --concurrency 1,16,64
+    python loadgen.py --mix chat=8,index=1,clear=1 --messages traffic.jsonl --output load.json
+
+Modes: dev (Flask's threaded dev server), gunicorn-sync, gunicorn-gthread
+(gunicorn.conf.py as in production), uvicorn (asgi.py). The load generator
+is a single Python process; at high concurrency on few cores it competes
+with the server for CPU, so compare modes at the same settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from replay import percentile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    'dev': [sys.executable, '-c',
+            "import os, main; main.app.run(host='127.0.0.1', port=int(os.environ['LOADGEN_PORT']), "
+            "threaded=True, debug=False)"],
+    # gunicorn switches a sync worker with threads > 1 to gthread, so the config's threads are overridden
+    'gunicorn-sync': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-k', 'sync', '--threads', '1'],
+    'gunicorn-gthread': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-k', 'gthread'],
+    'uvicorn': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--log-level', 'warning'],
+}
+
+# Default messages: the landing page's quick questions plus a few that take the fallback path
+DEFAULT_MESSAGES = [
+    'What services does ECO Matrix offer?',
+    'How does the platform work?',
+    'Tell me about the company',
+    'How can I contact ECO Matrix?',
+    'What are the benefits of using ECO Matrix?',
+    'What is energy modeling?',
+    'hi',
+    'tell me more about it',
+    'Where are you based?',
+    'Do you support code compliance reports for winnipeg projects?',
+]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def server_log(mode):
+    return os.path.join(tempfile.gettempdir(), f'loadgen-{mode}.log')
+
+def start_server(mode, port, workers):
+    """Launch the app in a serving mode; its output goes to loadgen-<mode>.log in the temp directory"""
+    command = list(MODES[mode])
+    if mode == 'uvicorn':
+        command += ['--port', str(port)]
+    env = dict(os.environ)
+    env.update({
+        'LOADGEN_PORT': str(port),
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        # Everything comes from one address, and request logs would cost the server as much as the work
+        'CHAT_RATE_LIMIT': '0',
+        'CHAT_LOG_SAMPLE_RATE': env.get('CHAT_LOG_SAMPLE_RATE', '0'),
+        'CHAT_KB_POLL_INTERVAL': '0',
+        'CHAT_RECORD_PATH': '',
+    })
+    if workers:
+        env['GUNICORN_WORKERS'] = str(workers)
+    log = open(server_log(mode), 'wb')
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+async def wait_ready(port, process, timeout=60):
+    """Wait until the server answers GET /"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            client = Client('127.0.0.1', port)
+            status, _ = await client.request('GET', '/')
+            await client.close()
+            if status == 200:
+                return
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"server not ready after {timeout}s")
+
+class Client:
+    """One keep-alive HTTP/1.1 connection speaking just enough of the protocol"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.cookies = {}
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Accept-Encoding: gzip']
+        if body:
+            head += ['Content-Type: application/json', f'Content-Length: {len(body)}']
+        if self.cookies:
+            head.append('Cookie: ' + '; '.join(f'{name}={value}' for name, value in self.cookies.items()))
+        self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'set-cookie':
+                cookie_name, _, cookie_value = value.split(';', 1)[0].partition('=')
+                self.cookies[cookie_name] = cookie_value
+            else:
+                headers[name] = value
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = b''
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                data += chunk[:-2]
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            data = await self.reader.read()
+            await self.close()
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, data
+
+def build_mix(spec, messages):
+    """Weighted list of (route label, method, path, body factory) from 'chat=7,index=2,clear=1'"""
+    routes = {
+        'chat': ('POST', '/chat', lambda: json.dumps({"message": random.choice(messages)}).encode('utf-8')),
+        'index': ('GET', '/', lambda: b''),
+        'clear': ('POST', '/clear', lambda: b'{}'),
+    }
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in routes:
+            raise SystemExit(f"unknown route '{name}' in --mix (use chat, index, clear)")
+        mix.append((name,) + routes[name] + (float(weight or 1),))
+    return mix
+
+async def virtual_user(port, mix, deadline, samples):
+    client = Client('127.0.0.1', port)
+    weights = [entry[4] for entry in mix]
+    try:
+        while time.perf_counter() < deadline:
+            name, method, path, make_body, _ = random.choices(mix, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, _ = await asyncio.wait_for(client.request(method, path, make_body()), timeout=30)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                status = None
+                await client.close()
+            samples.append((name, status, time.perf_counter() - started))
+    finally:
+        await client.close()
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency * 1000 for _, _, latency in samples)
+    errors = sum(1 for _, status, _ in samples if status is None or status >= 400)
+    return {
+        'requests': len(samples),
+        'throughput': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+async def run_stage(port, mix, concurrency, duration):
+    samples = []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(virtual_user(port, mix, deadline, samples) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    result = summarize(samples, elapsed)
+    result['concurrency'] = concurrency
+    result['routes'] = {name: summarize([s for s in samples if s[0] == name], elapsed)
+                        for name in sorted({s[0] for s in samples})}
+    return result
+
+async def run_mode(mode, args, mix):
+    port = free_port()
+    process = start_server(mode, port, args.workers)
+    try:
+        await wait_ready(port, process)
+        # Let workers finish booting and warm up before measuring
+        await run_stage(port, mix, 4, args.warmup)
+        return [await run_stage(port, mix, concurrency, args.duration) for concurrency in args.concurrency]
+    finally:
+        stop_server(process)
+
+def load_messages(path):
+    """Messages from a replay recording (JSONL) or a plain text file, one per line"""
+    messages = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = line
+            if isinstance(entry, dict):
+                entry = entry.get('message')
+            if isinstance(entry, str) and entry.strip():
+                messages.append(entry)
+    return messages
+
+def print_report(report):
+    header = (f"{'mode':<18} {'clients':>7} {'req/s':>9} {'errors':>7} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    print(header)
+    print('-' * len(header))
+    for mode, stages in report['modes'].items():
+        if isinstance(stages, str):
+            print(f"{mode:<18} failed: {stages}")
+            continue
+        for stage in stages:
+            print(f"{mode:<18} {stage['concurrency']:>7} {stage['throughput']:>9,.1f} {stage['error_rate']:>7.2%} "
+                  f"{stage['p50_ms']:>8.2f} {stage['p95_ms']:>8.2f} {stage['p99_ms']:>8.2f} {stage['max_ms']:>8.2f}")
+            for name, route in stage['routes'].items():
+                print(f"{'  ' + name:<18} {'':>7} {route['throughput']:>9,.1f} {route['error_rate']:>7.2%} "
+                      f"{route['p50_ms']:>8.2f} {route['p95_ms']:>8.2f} {route['p99_ms']:>8.2f} {route['max_ms']:>8.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', action='append', choices=sorted(MODES), help='serving mode to test (repeatable; default all)')
+    parser.add_argument('--concurrency', default='1,8,32,64', help='comma-separated client counts to ramp through')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per concurrency level (default 5)')
+    parser.add_argument('--warmup', type=float, default=1, help='seconds of warm-up load before measuring (default 1)')
+    parser.add_argument('--mix', default='chat=7,index=2,clear=1', help='route weights (default chat=7,index=2,clear=1)')
+    parser.add_argument('--messages', help='file of /chat messages: text lines or a replay recording')
+    parser.add_argument('--workers', type=int, help='gunicorn worker count (default from gunicorn.conf.py)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args(argv)
+    args.concurrency = [int(level) for level in args.concurrency.split(',')]
+
+    random.seed(args.seed)
+    messages = load_messages(args.messages) if args.messages else DEFAULT_MESSAGES
+    mix = build_mix(args.mix, messages)
+    report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'cpus': os.cpu_count(),
+              'duration': args.duration, 'mix': args.mix, 'modes': {}}
+    for mode in args.mode or list(MODES):
+        print(f"Testing {mode}...", file=sys.stderr)
+        try:
+            report['modes'][mode] = asyncio.run(run_mode(mode, args, mix))
+        except RuntimeError as e:
+            report['modes'][mode] = f"{e} (see {server_log(mode)})"
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
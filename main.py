@@ -1,757 +1,2408 @@
-from flask import Flask, render_template, render_template_string, request, jsonify
+from flask import Flask, render_template, request, g, session
 import re
 import random
 import secrets
 import os
+import json
 import logging
-
-# Configure logging to log to console
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import threading
+import time
+import glob
+import gzip
+import hashlib
+import mimetypes
+import queue
+import sys
+import asyncio
+import atexit
+import zlib
+import logging.handlers
+from bisect import bisect_left
+from collections import OrderedDict
+from math import ceil, log
+
+try:
+    import numpy as np
+except ImportError:  # BM25 ranking is optional; the substring index answers without it
+    np = None
+
+try:
+    import brotli
+except ImportError:  # responses are gzip-compressed only without it
+    brotli = None
+
+# Request log tuning: fraction of requests logged, records per write, seconds between writes
+CHAT_LOG_SAMPLE_RATE = float(os.environ.get('CHAT_LOG_SAMPLE_RATE', 1.0))
+CHAT_LOG_BATCH_SIZE = int(os.environ.get('CHAT_LOG_BATCH_SIZE', 256))
+CHAT_LOG_FLUSH_INTERVAL = float(os.environ.get('CHAT_LOG_FLUSH_INTERVAL', 0.5))
+CHAT_LOG_QUEUE_SIZE = int(os.environ.get('CHAT_LOG_QUEUE_SIZE', 10000))
+CHAT_LOG_MESSAGE_CHARS = int(os.environ.get('CHAT_LOG_MESSAGE_CHARS', 200))
+
+# Traffic recording for replay.py: JSONL file to append to (unset disables) and fraction of sessions recorded
+CHAT_RECORD_PATH = os.environ.get('CHAT_RECORD_PATH', '')
+CHAT_RECORD_SAMPLE_RATE = float(os.environ.get('CHAT_RECORD_SAMPLE_RATE', 1.0))
+# Key for hashing session ids in recordings; generated once per server (shared by forked workers) if unset
+CHAT_RECORD_SALT = os.environ.get('CHAT_RECORD_SALT') or secrets.token_hex(16)
+
+class JSONFormatter(logging.Formatter):
+    """One compact JSON object per record, with any structured 'fields' merged in"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks the caller: records are formatted later
+    by the writer thread, and dropped (and counted) when the queue is full."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+class BatchingLogWriter:
+    """Background thread draining the log queue and writing records in batches.
+
+    Each wake-up formats up to CHAT_LOG_BATCH_SIZE records and writes them
+    with a single write and flush, so request threads never wait on stdout.
+    """
+
+    def __init__(self, log_queue, stream, formatter, batch_size=CHAT_LOG_BATCH_SIZE,
+                 flush_interval=CHAT_LOG_FLUSH_INTERVAL):
+        self.queue = log_queue
+        self.stream = stream
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write out everything still queued, then stop the thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._stopping.set()
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                lines.append(json.dumps({"level": "ERROR", "msg": f"Unformattable log record from {record.name}"}))
+        if DroppingQueueHandler.dropped:
+            lines.append(json.dumps({"level": "WARNING", "msg": f"Dropped {DroppingQueueHandler.dropped} log records (queue full)"}))
+            DroppingQueueHandler.dropped = 0
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+
+def setup_logging():
+    """Route all logging through a bounded queue drained by a batching writer thread"""
+    log_queue = queue.Queue(CHAT_LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    writer = BatchingLogWriter(log_queue, sys.stderr, JSONFormatter())
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
+    writer.start()
+    atexit.register(writer.stop)
+
+    def restart_in_child():
+        # A forked worker has no writer thread and may inherit a locked queue
+        handler.queue = writer.queue = queue.Queue(CHAT_LOG_QUEUE_SIZE)
+        writer.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+    return writer
+
+# Configure logging to log to console, off the request path
+LOG_WRITER = setup_logging()
+REQUEST_LOG = logging.getLogger('chat.requests')
+
+def log_request(event, started, **fields):
+    """Log one compact, sampled record per request: never the full response body"""
+    if CHAT_LOG_SAMPLE_RATE < 1.0 and random.random() >= CHAT_LOG_SAMPLE_RATE:
+        return
+    fields['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    REQUEST_LOG.info(event, extra={'fields': fields})
+
+# Personal details are masked before a message is recorded
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+NUMBER_RE = re.compile(r'\+?\d[\d ().-]{5,}\d')
+
+def anonymise(message):
+    """Mask email addresses and phone-like numbers, keeping the message's length and shape"""
+    message = EMAIL_RE.sub(lambda m: 'x' * len(m.group()), message)
+    return NUMBER_RE.sub(lambda m: re.sub(r'\d', '0', m.group()), message)
+
+class TrafficRecorder(BatchingLogWriter):
+    """Appends sampled, anonymised chat requests to a JSONL file for replay.py.
+
+    Requests are queued and written in batches by the writer thread, and
+    dropped rather than waited on when the queue is full. Sampling is per
+    session, so recorded conversations stay whole; session ids are replaced
+    by a keyed hash and messages pass through anonymise().
+    """
+
+    def __init__(self, path, sample_rate=CHAT_RECORD_SAMPLE_RATE, salt=CHAT_RECORD_SALT):
+        super().__init__(queue.Queue(CHAT_LOG_QUEUE_SIZE), open(path, 'a', encoding='utf-8'), None)
+        self.sample_rate = sample_rate
+        self.salt = salt.encode('utf-8')
+        self.dropped = 0
+
+    def record(self, route, message, session_id=None):
+        if session_id is None:
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return
+            session = None
+        else:
+            digest = hashlib.blake2b(session_id.encode('utf-8'), key=self.salt, digest_size=8).hexdigest()
+            if self.sample_rate < 1.0 and int(digest, 16) / 2 ** 64 >= self.sample_rate:
+                return
+            session = digest
+        entry = {"ts": round(time.time(), 3), "route": route, "session": session, "message": anonymise(message)}
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self, batch):
+        lines = [json.dumps(entry, ensure_ascii=False) for entry in batch]
+        if self.dropped:
+            logging.warning(f"Traffic recorder dropped {self.dropped} requests (queue full)")
+            self.dropped = 0
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+
+def setup_recorder():
+    """Start the traffic recorder if CHAT_RECORD_PATH is set"""
+    if not CHAT_RECORD_PATH:
+        return None
+    recorder = TrafficRecorder(CHAT_RECORD_PATH)
+    recorder.start()
+    atexit.register(recorder.stop)
+
+    def restart_in_child():
+        recorder.queue = queue.Queue(CHAT_LOG_QUEUE_SIZE)
+        recorder.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+    return recorder
+
+TRAFFIC_RECORDER = setup_recorder()
 
 app = Flask(__name__)
 
 # Set secret key for session management
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', secrets.token_hex(16))
 
-# Comprehensive knowledge base
-KNOWLEDGE_BASE = {
-    "company_info": {
-        "name": "ECO Matrix",
-        "location": "Winnipeg, Canada",
-        "industry": "Energy Modeling Consultancy",
-        "specialization": "Architectural, Engineering, and Construction (AEC) industry",
-        "mission": "Optimizing building decision metrics and KPIs through advanced parametric modeling",
-        "founded": "Established energy modeling consultancy",
-        "team": "Expert energy modeling professionals and engineers"
-    },
+# Largest number of messages accepted by one /chat/batch request
+CHAT_BATCH_MAX_MESSAGES = int(os.environ.get('CHAT_BATCH_MAX_MESSAGES', 5000))
+
+# Admission control: request body and message size limits
+CHAT_MAX_BODY_BYTES = int(os.environ.get('CHAT_MAX_BODY_BYTES', 1024 * 1024))
+CHAT_MAX_MESSAGE_CHARS = int(os.environ.get('CHAT_MAX_MESSAGE_CHARS', 2000))
+# Per-client token bucket: sustained messages per second and burst size (off unless a rate is set)
+CHAT_RATE_LIMIT = float(os.environ.get('CHAT_RATE_LIMIT', 0))
+CHAT_RATE_BURST = float(os.environ.get('CHAT_RATE_BURST', 20))
+CHAT_RATE_MAX_CLIENTS = int(os.environ.get('CHAT_RATE_MAX_CLIENTS', 100000))
+# Header set by a trusted proxy with the real client address (e.g. X-Real-IP); the peer address otherwise
+CHAT_CLIENT_HEADER = os.environ.get('CHAT_CLIENT_HEADER', '')
+# Load shedding: chat requests in progress per process, and smoothed latency in ms (0 disables either)
+CHAT_MAX_IN_FLIGHT = int(os.environ.get('CHAT_MAX_IN_FLIGHT', 256))
+CHAT_SHED_LATENCY_MS = float(os.environ.get('CHAT_SHED_LATENCY_MS', 0))
+
+# Directory shared by all worker processes for /metrics aggregation (unset: this process only)
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Conversation memory: total budget in MB, turns kept per session, seconds before an idle session is dropped
+CHAT_MEMORY_MAX_MB = float(os.environ.get('CHAT_MEMORY_MAX_MB', 64))
+CHAT_MEMORY_TURNS = int(os.environ.get('CHAT_MEMORY_TURNS', 8))
+CHAT_MEMORY_IDLE_TTL = float(os.environ.get('CHAT_MEMORY_IDLE_TTL', 1800))
+
+# Response cache bounds (entries, seconds); a size of 0 disables the cache
+CHAT_CACHE_SIZE = int(os.environ.get('CHAT_CACHE_SIZE', 1024))
+CHAT_CACHE_TTL = float(os.environ.get('CHAT_CACHE_TTL', 300))
+# Longest wait, in seconds, for an identical query already being answered before computing it again
+CHAT_COALESCE_TIMEOUT = float(os.environ.get('CHAT_COALESCE_TIMEOUT', 1.0))
+
+# Knowledge base, intent keyword table and response texts
+KNOWLEDGE_BASE_PATH = os.environ.get('KNOWLEDGE_BASE_PATH',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledge_base.json'))
+# Seconds between checks of the knowledge base file for changes; 0 disables hot reload
+CHAT_KB_POLL_INTERVAL = float(os.environ.get('CHAT_KB_POLL_INTERVAL', 2))
+
+# Build outputs of build_assets.py; served when present, the inline page is used otherwise
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_DIST_DIR = os.path.join(BASE_DIR, 'static', 'dist')
+INDEX_TEMPLATE = 'dist/index.html' if os.path.isfile(os.path.join(BASE_DIR, 'templates', 'dist', 'index.html')) else 'index.html'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Tenants: tenants/<name>.json knowledge bases (same format as knowledge_base.json), picked
+# by the /t/<name>/ path prefix or the first label of the Host header
+CHAT_TENANTS_DIR = os.environ.get('CHAT_TENANTS_DIR', os.path.join(BASE_DIR, 'tenants'))
+# Tenants kept loaded at once, seconds an unused one stays loaded, and each one's response cache size
+CHAT_TENANTS_MAX_LOADED = int(os.environ.get('CHAT_TENANTS_MAX_LOADED', 32))
+CHAT_TENANT_IDLE_TTL = float(os.environ.get('CHAT_TENANT_IDLE_TTL', 900))
+CHAT_TENANT_CACHE_SIZE = int(os.environ.get('CHAT_TENANT_CACHE_SIZE', 256))
+
+# Smallest JSON body worth compressing when the client accepts gzip or brotli
+CHAT_COMPRESS_MIN_BYTES = int(os.environ.get('CHAT_COMPRESS_MIN_BYTES', 512))
+
+# Typo tolerance: largest edit distance for correcting query words (0 disables)
+CHAT_TYPO_MAX_DISTANCE = int(os.environ.get('CHAT_TYPO_MAX_DISTANCE', 2))
+# Real English words that are never taken for typos ("contracts" is not a misspelt "contacts")
+COMMON_WORDS_PATH = os.path.join(BASE_DIR, 'common_words.txt')
+
+# Intent classifier written by train_intents.py; used when the file exists and NumPy is installed
+CHAT_INTENT_MODEL = os.environ.get('CHAT_INTENT_MODEL', os.path.join(BASE_DIR, 'intent_model.npz'))
+
+# Quick-question buttons on the landing page; the most common /chat messages
+QUICK_QUESTIONS = [
+    'What services does ECO Matrix offer?',
+    'How does the platform work?',
+    'Tell me about the company',
+    'How can I contact ECO Matrix?',
+    'What are the benefits of using ECO Matrix?',
+    'What is energy modeling?'
+]
+
+# Words that point back at an earlier topic ("tell me more about it")
+FOLLOW_UP_WORDS = frozenset(['it', 'its', 'that', 'this', 'they', 'them', 'those', 'these', 'more'])
+
+# Intents that close or open a conversation rather than name a topic
+SOCIAL_INTENTS = ('greeting', 'farewell')
+
+# Query words: runs of letters, digits and underscores; everything else separates them
+TOKEN_RE = re.compile(r'\w+')
+
+def plural(word):
+    """Regular English plural of word, or None if it already looks plural or is too short"""
+    if len(word) < 3 or (word.endswith('s') and not word.endswith('ss')):
+        return None
+    if word.endswith(('ss', 'x', 'z', 'ch', 'sh')):
+        return word + 'es'
+    if word.endswith('y') and word[-2] not in 'aeiou':
+        return word[:-1] + 'ies'
+    return word + 's'
+
+# (suffix, replacement) pairs undoing regular inflections, tried in order
+INFLECTIONS = (('ies', 'y'), ('ied', 'y'), ('es', ''), ('s', ''), ('ing', ''), ('ing', 'e'),
+               ('ed', ''), ('ed', 'e'), ('ers', ''), ('er', ''), ('ly', ''))
+
+def inflection_base(token, words):
+    """The word in words that token regularly inflects ("costly" -> "cost", "pricing" -> "price"), or None.
+
+    Stems shorter than three letters are never tried, so "his" isn't "hi".
+    """
+    for suffix, replacement in INFLECTIONS:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            base = token[:-len(suffix)] + replacement
+            if base in words:
+                return base
+    return None
+
+class IntentMatcher:
+    """Aho-Corasick automaton over all intent keywords, matched word by word.
+
+    Keywords are split into words and compiled once into a DFA whose
+    alphabet is words, so a query's token list is scanned a single time,
+    whatever the number of intents and keywords. A keyword word matches
+    the same word or a regular inflection of it ("emailed", "pricing",
+    "costly", "services"), but never text inside another word ("hi" doesn't
+    fire inside "which"). Each state carries a bitmask of the intents whose
+    keywords end there (bit i is the i-th intent of the table).
+    """
+
+    def __init__(self, intent_keywords):
+        self.intents = [sys.intern(intent) for intent in intent_keywords]
+        self.bits = {intent: 1 << bit for bit, intent in enumerate(self.intents)}
+        self.all_mask = (1 << len(self.intents)) - 1
+
+        phrases = []
+        for bit, keywords in enumerate(intent_keywords.values()):
+            for keyword in keywords:
+                words = [sys.intern(word) for word in TOKEN_RE.findall(keyword.lower())]
+                if not words:
+                    continue
+                phrases.append((words, bit))
+        self.words = frozenset(word for words, _ in phrases for word in words)
+
+        # Build the keyword trie
+        goto = [{}]
+        output = [0]
+        for words, bit in phrases:
+            state = 0
+            for word in words:
+                nxt = goto[state].get(word)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][word] = nxt
+                    goto.append({})
+                    output.append(0)
+                state = nxt
+            output[state] |= 1 << bit
+
+        # Breadth-first pass: failure links, merged outputs and full transitions
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = list(goto[0].values())
+        for state in queue:
+            delta[state] = dict(delta[fail[state]])
+            delta[state].update(goto[state])
+            output[state] |= output[fail[state]]
+            for word, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(word, 0)
+                queue.append(nxt)
+
+        self.delta = delta
+        self.output = output
+
+    def match_mask(self, tokens):
+        """Return the bitmask of every intent whose keywords occur in the token list"""
+        delta = self.delta
+        output = self.output
+        words = self.words
+        all_mask = self.all_mask
+        state = 0
+        found = 0
+        for token in tokens:
+            if token not in words:
+                token = inflection_base(token, words) or token
+            state = delta[state].get(token, 0)
+            if output[state]:
+                found |= output[state]
+                if found == all_mask:
+                    break
+        return found
+
+    def match_masks(self, token_lists):
+        """Intent bitmasks for many token lists"""
+        return [self.match_mask(tokens) for tokens in token_lists]
+
+    def intents_for(self, mask):
+        """Expand an intent bitmask into intent names, in table order"""
+        return [intent for bit, intent in enumerate(self.intents) if mask >> bit & 1]
+
+    def mask_for(self, intents):
+        """Fold intent names into a bitmask; names outside the table (e.g. 'general') are ignored"""
+        mask = 0
+        for intent in intents:
+            mask |= self.bits.get(intent, 0)
+        return mask
+
+class KnowledgeIndex:
+    """Inverted index over the knowledge base for the fallback search.
+
+    Every entry's key and value are lowercased once and split into word runs.
+    Each substring of each run maps to the entries containing it, so a query
+    word is resolved with a single dict lookup while keeping the original
+    "word in key or value" substring semantics.
+    """
+
+    WORD_RE = re.compile(r'\w+')
+
+    def __init__(self, knowledge_base):
+        self.entries = []
+        self.texts = []
+        self.lines = []
+        token_entries = {}
+        for category, data in knowledge_base.items():
+            if isinstance(data, dict):
+                for key, value in data.items():
+                    entry_id = len(self.entries)
+                    text = (key.lower(), str(value).lower())
+                    self.entries.append((category, key))
+                    self.texts.append(text)
+                    self.lines.append(f"**{key.replace('_', ' ').title()}**: {value}")
+                    for token in self.WORD_RE.findall(' '.join(text)):
+                        token_entries.setdefault(token, set()).add(entry_id)
+
+        postings = {}
+        for token, entry_ids in token_entries.items():
+            for start in range(len(token)):
+                for end in range(start + 1, len(token) + 1):
+                    postings.setdefault(token[start:end], set()).update(entry_ids)
+        # Keys are interned so tenants share their common words; equal id tuples are stored once
+        shared = {}
+        self.postings = {}
+        for part, ids in postings.items():
+            ids = tuple(sorted(ids))
+            self.postings[sys.intern(part)] = shared.setdefault(ids, ids)
+
+    def lookup(self, word):
+        """Return ids of the entries whose key or value contains word"""
+        if self.WORD_RE.fullmatch(word):
+            return self.postings.get(word, ())
+        # Words spanning punctuation can't be served by the index
+        return tuple(i for i, (key, value) in enumerate(self.texts) if word in key or word in value)
+
+    def search(self, words, limit=3):
+        """Formatted entries matching the query words, in query-word then KB order"""
+        found = []
+        for word in words:
+            for entry_id in self.lookup(word):
+                found.append(self.lines[entry_id])
+                if len(found) == limit:
+                    return found
+        return found
+
+def osa_distance(a, b, max_distance):
+    """Optimal string alignment distance (edits plus adjacent swaps), or max_distance + 1 if larger"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+def load_word_list(path):
+    """Words of a one-word-per-line file ('#' lines are comments); empty if it's missing"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return frozenset(sys.intern(line.strip()) for line in f if line.strip() and not line.startswith('#'))
+    except OSError as e:
+        logging.warning(f"Could not read word list {path}: {e}")
+        return frozenset()
+
+COMMON_WORDS = load_word_list(COMMON_WORDS_PATH)
+
+class SpellingIndex:
+    """Symmetric-delete (SymSpell) index for correcting misspelt query words.
+
+    Every known word is stored under each string obtained by deleting up to
+    max_distance of its characters. A query word's own deletions are then
+    looked up directly, so candidates come from a few dict probes instead of
+    a scan of the vocabulary, and only those are checked with a bounded edit
+    distance. Words already in the vocabulary, and common English words
+    outside it ("teach", "coast", "contracts"), are never rewritten: only
+    words that can't be spelt right are taken for typos.
+
+    Short words are one edit away from many other words, so below
+    SHORT_LENGTH letters only the commonest slips are corrected, keeping the
+    first letter: a missing letter ("pricng"), a swapped pair ("emial") or
+    a doubled letter ("cosst"). A replaced or added letter is more often
+    another word ("brice", "toole") than a typo for "price" or "tool".
+    """
+
+    MIN_LENGTH = 5
+    SHORT_LENGTH = 7
+    MAX_LENGTH = 24
+
+    def __init__(self, keywords, vocabulary, max_distance=CHAT_TYPO_MAX_DISTANCE, common_words=COMMON_WORDS):
+        self.keywords = {sys.intern(word) for word in keywords}
+        self.words = self.keywords | {sys.intern(word) for word in vocabulary}
+        self.common_words = common_words
+        self.max_distance = max_distance
+        self.deletes = {}
+        if max_distance <= 0:
+            return
+        for word in self.words:
+            if self.MIN_LENGTH - max_distance <= len(word) <= self.MAX_LENGTH + max_distance:
+                for variant in self.variants(word, max_distance):
+                    self.deletes.setdefault(sys.intern(variant), []).append(word)
+
+    def variants(self, word, distance):
+        """word and every string made by deleting up to distance characters from it"""
+        found = {word}
+        frontier = {word}
+        for _ in range(distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+            found |= frontier
+        return found
+
+    def correct(self, word):
+        """Closest known word within the edit budget for word's length, or None.
+
+        Short words get one edit, words of nine letters or more two. Ties go
+        to intent keywords, then alphabetical order, so answers are stable.
+        """
+        if word in self.words or word in self.common_words or not self.MIN_LENGTH <= len(word) <= self.MAX_LENGTH:
+            return None
+        max_distance = min(self.max_distance, 1 if len(word) < 9 else 2)
+        if max_distance <= 0:
+            return None
+        best = None
+        seen = set()
+        for variant in self.variants(word, max_distance):
+            for candidate in self.deletes.get(variant, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if len(word) < self.SHORT_LENGTH and not self.plausible_short(word, candidate):
+                    continue
+                distance = osa_distance(word, candidate, max_distance)
+                if distance <= max_distance:
+                    key = (distance, candidate not in self.keywords, candidate)
+                    if best is None or key < best:
+                        best = key
+        return best[2] if best is not None else None
+
+    def plausible_short(self, word, candidate):
+        """Whether a short word one edit from candidate is a likely slip for it:
+        same first letter, and a letter left out, two swapped or one doubled"""
+        if word[0] != candidate[0]:
+            return False
+        if len(candidate) == len(word) + 1:
+            return True
+        if len(candidate) == len(word):
+            return sorted(word) == sorted(candidate)
+        return any(word[i] == word[i - 1] and word[:i] + word[i + 1:] == candidate for i in range(1, len(word)))
+
+    def correct_tokens(self, tokens):
+        """tokens with misspelt words replaced; the same list if nothing changed"""
+        corrected = None
+        for i, token in enumerate(tokens):
+            fixed = self.correct(token)
+            if fixed is not None:
+                if corrected is None:
+                    corrected = list(tokens)
+                corrected[i] = fixed
+        return corrected if corrected is not None else tokens
+
+def json_body(obj):
+    """Encode a response object as compact UTF-8 JSON bytes"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def chat_payload(text):
+    """Encode a successful /chat answer as UTF-8 JSON bytes"""
+    return json_body({"success": True, "response": text})
+
+def pick_sections(sections):
+    """Pick one variant per section"""
+    return [section[0] if len(section) == 1 else random.choice(section) for section in sections]
+
+def join_sections(sections):
+    """Pick one variant per section and join them into the final text"""
+    return "\n\n".join(pick_sections(sections))
+
+def sse_event(event, data):
+    """Encode one server-sent event with a JSON data line"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Content codings we can send, preferred first
+CONTENT_CODINGS = ('br', 'gzip')
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows (q=0 entries excluded)"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        coding = coding.strip().lower()
+        if coding:
+            accepted.add(coding)
+    return accepted
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header covers etag (weak comparison, as RFC 9110 asks)"""
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+class CachedBody:
+    """A fixed response body kept in memory with its compressed variants.
+
+    Every variant has its own strong ETag derived from the content hash, so
+    conditional requests are answered 304 without sending anything, and
+    other requests get the best encoding the client accepts.
+    """
+
+    __slots__ = ('content_type', 'cache_control', 'variants', 'etags')
+
+    def __init__(self, body, content_type, cache_control, variants=None):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.variants = {'identity': body}
+        self.variants.update(variants or {})
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.etags = {coding: f'"{digest}"' if coding == 'identity' else f'"{digest}-{coding}"'
+                      for coding in self.variants}
+
+    def respond(self, accept_encoding='', if_none_match=''):
+        """(status, body, headers) for a GET carrying these request headers"""
+        coding = 'identity'
+        if accept_encoding and len(self.variants) > 1:
+            accepted = accepted_encodings(accept_encoding)
+            for candidate in CONTENT_CODINGS:
+                if candidate in self.variants and (candidate in accepted or '*' in accepted):
+                    coding = candidate
+                    break
+        headers = {'Content-Type': self.content_type, 'ETag': self.etags[coding], 'Cache-Control': self.cache_control}
+        if len(self.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+        if if_none_match and etag_matches(if_none_match, self.etags[coding]):
+            return 304, b'', headers
+        if coding != 'identity':
+            headers['Content-Encoding'] = coding
+        return 200, self.variants[coding], headers
+
+def compressed_variants(body):
+    """gzip and, if available, brotli encodings of body, keeping only those that are smaller"""
+    variants = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    return {coding: data for coding, data in variants.items() if len(data) < len(body)}
+
+def compress(body, coding):
+    """Compress a response body on the request path: fast settings, still most of the gain"""
+    if coding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+def pick_encoding(accept_encoding, size):
+    """Coding to send a size-byte JSON body in: 'identity' if small or nothing usable is accepted"""
+    if size < CHAT_COMPRESS_MIN_BYTES or not accept_encoding:
+        return 'identity'
+    accepted = accepted_encodings(accept_encoding)
+    for coding in CONTENT_CODINGS:
+        if (coding in accepted or '*' in accepted) and (coding != 'br' or brotli is not None):
+            return coding
+    return 'identity'
+
+def encoding_headers(coding):
+    if coding == 'identity':
+        return {'Vary': 'Accept-Encoding'}
+    return {'Content-Encoding': coding, 'Vary': 'Accept-Encoding'}
+
+def encode_body(body, accept_encoding):
+    """(body, headers) for a JSON body, compressed if worthwhile and accepted"""
+    coding = pick_encoding(accept_encoding, len(body))
+    if coding != 'identity':
+        body = compress(body, coding)
+    return body, encoding_headers(coding)
+
+def load_assets(dist_dir):
+    """Fingerprinted files written by build_assets.py, keyed by hashed name; empty if never built"""
+    try:
+        with open(os.path.join(dist_dir, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    assets = {}
+    for hashed in manifest.values():
+        path = os.path.join(dist_dir, hashed)
+        with open(path, 'rb') as f:
+            body = f.read()
+        variants = {}
+        for coding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if os.path.exists(path + suffix):
+                with open(path + suffix, 'rb') as f:
+                    variants[coding] = f.read()
+        content_type = mimetypes.guess_type(hashed)[0] or 'application/octet-stream'
+        if content_type.startswith('text/'):
+            content_type += '; charset=utf-8'
+        assets[hashed] = CachedBody(body, content_type, IMMUTABLE_CACHE_CONTROL, variants)
+    return assets
+
+class ResponsePlan:
+    """An answer ready to render: its sections and, when only one text is
+    possible, that text, its encoded /chat JSON body and that body's
+    compressed forms (made on first use, then kept)."""
+
+    __slots__ = ('sections', 'text', 'payload', 'encoded', 'id')
+
+    def __init__(self, sections):
+        self.sections = sections
+        # Short stable id for logs, so records can name an answer without carrying it
+        self.id = format(zlib.crc32('\x00'.join('\x01'.join(section) for section in sections).encode('utf-8')), '08x')
+        if all(len(section) == 1 for section in sections):
+            self.text = join_sections(sections)
+            self.payload = chat_payload(self.text)
+        else:
+            self.text = None
+            self.payload = None
+        self.encoded = {}
+
+    def render(self):
+        return self.text if self.text is not None else join_sections(self.sections)
+
+    def render_sections(self):
+        return pick_sections(self.sections)
+
+    def chat_body(self, accept_encoding=''):
+        """(body, headers) of the /chat answer, compressed once per coding for fixed answers"""
+        if self.payload is None:
+            return encode_body(chat_payload(self.render()), accept_encoding)
+        coding = pick_encoding(accept_encoding, len(self.payload))
+        if coding == 'identity':
+            return self.payload, encoding_headers(coding)
+        body = self.encoded.get(coding)
+        if body is None:
+            body = self.encoded[coding] = compress(self.payload, coding)
+        return body, encoding_headers(coding)
+
+class ResponseTable:
+    """Response plans for intent combinations, looked up by intent bitmask.
+
+    Each intent maps to the bitmask of the response sections it triggers, so
+    a query's sections are the OR of its intents' masks, and combinations
+    triggering the same sections share one plan. The plans of every section
+    combination intents can trigger are built with the table (511 for the
+    default knowledge base's 4096 intent combinations), and it is never
+    changed afterwards. A knowledge base reaching more than MAX_PLANS
+    combinations gets those of the fewest intents, with a warning, and the
+    rest are built per call. Masks that trigger no section map to None and
+    need the query-dependent fallback.
+    """
+
+    MAX_PLANS = 4096
+
+    def __init__(self, intent_matcher, response_sections):
+        self.response_sections = response_sections
+        self.section_masks = [sum(1 << index for index, (intents, _) in enumerate(response_sections) if intent in intents)
+                              for intent in intent_matcher.intents]
+        self.plans = {}
+        # Breadth first: the combinations of one intent, then of two, and so on
+        intent_masks = sorted(set(self.section_masks) - {0})
+        frontier = intent_masks
+        while frontier and len(self.plans) < self.MAX_PLANS:
+            for fired in frontier[:self.MAX_PLANS - len(self.plans)]:
+                self.plans[fired] = self.build(fired)
+            frontier = sorted({fired | mask for fired in frontier for mask in intent_masks} - self.plans.keys())
+        self.complete = not frontier
+        if not self.complete:
+            logging.warning(f"Over {self.MAX_PLANS} response section combinations: "
+                            f"the rest are built for each answer that needs them")
+
+    def build(self, fired):
+        return ResponsePlan(tuple(variants for index, (_, variants) in enumerate(self.response_sections)
+                                  if fired >> index & 1))
+
+    def fired(self, mask):
+        """Bitmask of the response sections an intent mask triggers"""
+        section_masks = self.section_masks
+        fired = 0
+        while mask:
+            low = mask & -mask
+            bit = low.bit_length() - 1
+            if bit < len(section_masks):
+                fired |= section_masks[bit]
+            mask ^= low
+        return fired
+
+    def plan(self, mask):
+        """The plan of an intent mask, or None if it triggers no section"""
+        fired = self.fired(mask)
+        if not fired:
+            return None
+        plan = self.plans.get(fired)
+        return plan if plan is not None else self.build(fired)
+
+    def sections(self, mask):
+        plan = self.plan(mask)
+        return plan.sections if plan else ()
+
+class ResponseCache:
+    """Thread-safe LRU cache with TTL eviction for generated responses.
+
+    Values are (intent mask, response plan) pairs rather than final text, so
+    answers with several phrasings keep being picked at random on a hit.
+    Hits, misses and evictions are counted in METRICS, which outlives the
+    cache of each knowledge base snapshot.
+    """
+
+    def __init__(self, max_size=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        expired = False
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[0] < time.monotonic():
+                    del self._data[key]
+                    expired = True
+                else:
+                    self._data.move_to_end(key)
+        if item is None or expired:
+            if expired:
+                METRICS.inc('chat_cache_evictions_total')
+            METRICS.inc('chat_cache_misses_total')
+            return None
+        METRICS.inc('chat_cache_hits_total')
+        return item[1]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted:
+            METRICS.inc('chat_cache_evictions_total', value=evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        """Unexpired keys, least recently used first"""
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (expires, _) in self._data.items() if expires >= now]
+
+    def stats(self):
+        """Current size and capacity; the hit, miss and eviction counts are in METRICS"""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+            }
+
+class SingleFlight:
+    """Coalesces concurrent computations of the same key into one.
+
+    The first caller for a key (the leader) runs the computation; callers
+    arriving while it runs wait for its result instead of repeating the
+    work. A waiter gives up after the timeout, or if the leader fails, and
+    computes the value itself, so a stuck key never stalls everyone else.
+    """
+
+    def __init__(self, timeout=CHAT_COALESCE_TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """Return fn()'s result, sharing one call among concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                # [done event, result, failed]
+                call = self._calls[key] = [threading.Event(), None, False]
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            METRICS.inc('chat_coalesced_total')
+            if call[0].wait(self.timeout if timeout is None else timeout) and not call[2]:
+                return call[1]
+            return fn()
+        try:
+            call[1] = fn()
+        except BaseException:
+            call[2] = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+        return call[1]
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop: waiters await the leader's future"""
+
+    def __init__(self, timeout=CHAT_COALESCE_TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}
+
+    async def do(self, key, fn, timeout=None):
+        """Await fn()'s result, sharing one call among concurrent callers with the same key"""
+        future = self._calls.get(key)
+        if future is not None:
+            METRICS.inc('chat_coalesced_total')
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                # The leader failed; re-raise only if it's this waiter being cancelled
+                if not future.done():
+                    raise
+            return await fn()
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # Waiters fall back to their own call; nobody else needs to see this exception
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+# Latency buckets in seconds, from 10µs up to 1s
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0)
+
+METRIC_HELP = {
+    'chat_request_duration_seconds': ('histogram', 'Time to answer an HTTP request, by route.'),
+    'chat_stage_duration_seconds': ('histogram', 'Time spent in each response pipeline stage.'),
+    'chat_requests_total': ('counter', 'HTTP requests answered, by route and status code.'),
+    'chat_intents_total': ('counter', 'Intents detected in answered messages.'),
+    'chat_fallback_total': ('counter', 'Messages answered by the knowledge base fallback.'),
+    'chat_cache_hits_total': ('counter', 'Response cache hits.'),
+    'chat_cache_misses_total': ('counter', 'Response cache misses.'),
+    'chat_cache_evictions_total': ('counter', 'Response cache evictions, by size bound or TTL.'),
+    'chat_cache_entries': ('gauge', 'Entries held in the response cache.'),
+    'chat_coalesced_total': ('counter', 'Cache misses that waited for an identical query already being answered.'),
+    'chat_conversations': ('gauge', 'Sessions held in conversation memory.'),
+    'chat_rejected_total': ('counter', 'Chat requests turned away by admission control, by reason.'),
+    'chat_tenant_messages_total': ('counter', 'Messages answered from a tenant knowledge base, by tenant.'),
+    'chat_tenants_loaded': ('gauge', 'Tenant knowledge bases currently loaded.'),
+}
+
+class Metrics:
+    """In-process counters and latency histograms, exported in Prometheus text format.
+
+    Recording only takes a lock and bumps a few numbers. When METRICS_DIR is
+    set, every process that records metrics writes its snapshot there at most
+    every METRICS_FLUSH_INTERVAL seconds, and /metrics merges the snapshots of
+    all processes, so any gunicorn worker can be scraped for server totals.
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.collectors = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        self.histograms = {}
+        self.intent_masks = {}
+        self.flushed_at = time.monotonic()
+
+    def _check_process(self):
+        # A forked worker starts from a copy of the master's numbers; drop them
+        if self.pid != os.getpid():
+            with self._lock:
+                if self.pid != os.getpid():
+                    self.reset()
+
+    def _maybe_flush(self):
+        if self.directory and time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flushed_at = time.monotonic()
+            try:
+                self.flush()
+            except OSError as e:
+                logging.warning(f"Could not write metrics snapshot: {e}")
+
+    def _observe(self, name, labels, value):
+        counts = self.histograms.get((name, labels))
+        if counts is None:
+            # Bucket counts, then sum and count
+            counts = self.histograms[(name, labels)] = [0] * (len(LATENCY_BUCKETS) + 3)
+        counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def observe(self, name, labels, value):
+        self._check_process()
+        with self._lock:
+            self._observe(name, labels, value)
+        self._maybe_flush()
+
+    def observe_stages(self, stages):
+        """Record (stage, seconds) pairs of one pipeline run under a single lock"""
+        self._check_process()
+        with self._lock:
+            for stage, seconds in stages:
+                self._observe('chat_stage_duration_seconds', f'stage="{stage}"', seconds)
+        self._maybe_flush()
+
+    def inc(self, name, labels='', value=1):
+        self._check_process()
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+        self._maybe_flush()
+
+    def count_intents(self, mask, version=None):
+        """Count an answered intent mask; it is expanded into intent names at export time.
+
+        Masks are positional, so each is kept with the version of the
+        knowledge base whose intent table it was matched against.
+        """
+        self._check_process()
+        key = (version, mask)
+        with self._lock:
+            self.intent_masks[key] = self.intent_masks.get(key, 0) + 1
+
+    def take_intents(self, keep_version):
+        """Remove the intent mask counts of every version but keep_version: {(version, mask): count}"""
+        self._check_process()
+        with self._lock:
+            taken = {key: count for key, count in self.intent_masks.items() if key[0] != keep_version}
+            for key in taken:
+                del self.intent_masks[key]
+        return taken
+
+    def snapshot(self):
+        """This process's metrics as plain JSON-serialisable data"""
+        self._check_process()
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: list(counts) for key, counts in self.histograms.items()}
+            intent_masks = dict(self.intent_masks)
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, {})[labels] = value
+        for collect in self.collectors:
+            for name, labels, value in collect(intent_masks):
+                samples.setdefault(name, {})[labels] = samples.get(name, {}).get(labels, 0) + value
+        hist = {}
+        for (name, labels), counts in histograms.items():
+            hist.setdefault(name, {})[labels] = counts
+        return {'samples': samples, 'histograms': hist}
+
+    def flush(self):
+        """Write this process's snapshot to the shared directory"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+
+    def clear_directory(self):
+        """Remove snapshots left over from an earlier server run"""
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            os.remove(path)
+
+    def archive_process(self, pid):
+        """Fold the snapshot of an exited process into the archive so its counts survive"""
+        path = os.path.join(self.directory, f'{pid}.json')
+        archive = os.path.join(self.directory, 'archive.json')
+        snapshots = [self._load(path), self._load(archive)]
+        merged = self.merge([snapshot for snapshot in snapshots if snapshot], keep_gauges=False)
+        with open(archive + '.tmp', 'w') as f:
+            json.dump(merged, f)
+        os.replace(archive + '.tmp', archive)
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def merge(snapshots, keep_gauges=True):
+        merged = {'samples': {}, 'histograms': {}}
+        for snapshot in snapshots:
+            for name, series in snapshot['samples'].items():
+                if not keep_gauges and METRIC_HELP.get(name, ('gauge',))[0] == 'gauge':
+                    continue
+                target = merged['samples'].setdefault(name, {})
+                for labels, value in series.items():
+                    target[labels] = target.get(labels, 0) + value
+            for name, series in snapshot['histograms'].items():
+                target = merged['histograms'].setdefault(name, {})
+                for labels, counts in series.items():
+                    if labels in target:
+                        target[labels] = [a + b for a, b in zip(target[labels], counts)]
+                    else:
+                        target[labels] = list(counts)
+        return merged
+
+    def collect(self):
+        """Snapshot of every process sharing the metrics directory, or just this one"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            snapshot = self._load(path)
+            if snapshot:
+                snapshots.append(snapshot)
+        return self.merge(snapshots)
+
+    def render(self):
+        """Prometheus text exposition of the collected metrics"""
+        data = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            series = data['histograms'].get(name) if kind == 'histogram' else data['samples'].get(name)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series.items()):
+                selector = f'{{{labels}}}' if labels else ''
+                if kind != 'histogram':
+                    lines.append(f'{name}{selector} {value}')
+                    continue
+                prefix = labels + ',' if labels else ''
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{selector} {value[-2]}')
+                lines.append(f'{name}_count{selector} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+class ConversationStore:
+    """Bounded server-side memory of recent turns per session.
+
+    A turn is packed into one int: the intent mask in the high bits and a
+    CRC32 of the message in the low 32, and a session holds a short tuple of
+    them, so no response text is kept. Sessions are evicted least recently
+    used first, when idle past the TTL, or when the memory budget (turned into
+    a session count from the measured size of a full session) is exceeded.
+
+    Intent masks are positional, so a session also keeps the version of the
+    knowledge base its turns were matched against; after a reload, turns of
+    the old version are ignored and then replaced, never read with the new
+    intent table.
+
+    The store lives in one process's memory. With several worker processes
+    (the gunicorn profile runs one per CPU plus one), a follow-up usually
+    reaches a worker that never saw the session and is answered as a new
+    question.
+    """
+
+    def __init__(self, max_bytes=int(CHAT_MEMORY_MAX_MB * 2 ** 20), max_turns=CHAT_MEMORY_TURNS,
+                 idle_ttl=CHAT_MEMORY_IDLE_TTL):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max(1, max_bytes // self.session_bytes())
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def session_bytes(self):
+        """Estimated footprint of one full session, including the dict entry"""
+        session_id = secrets.token_urlsafe(12)
+        turns = tuple((1 << 40) + turn for turn in range(self.max_turns))
+        entry = [time.monotonic(), turns, None]
+        return (sys.getsizeof(session_id) + sys.getsizeof(entry) + sys.getsizeof(entry[0])
+                + sys.getsizeof(turns) + sum(sys.getsizeof(turn) for turn in turns) + 104)
+
+    def _evict(self, now):
+        sessions = self._sessions
+        while sessions:
+            session_id, (last_seen, _, _) = next(iter(sessions.items()))
+            if len(sessions) <= self.max_sessions and now - last_seen < self.idle_ttl:
+                break
+            del sessions[session_id]
+
+    def turns(self, session_id, version):
+        """Packed turns of a session recorded under a knowledge base version, oldest first"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[2] != version or time.monotonic() - entry[0] >= self.idle_ttl:
+                return ()
+            return entry[1]
+
+    def context_mask(self, session_id, version, skip_mask=0):
+        """Intent mask of the most recent turn that had intents beyond skip_mask"""
+        for turn in reversed(self.turns(session_id, version)):
+            mask = (turn >> 32) & ~skip_mask
+            if mask:
+                return mask
+        return 0
+
+    def record(self, session_id, mask, message, version):
+        now = time.monotonic()
+        turn = (mask << 32) | zlib.crc32(message.encode('utf-8'))
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self._sessions[session_id] = [now, (turn,), version]
+            else:
+                entry[0] = now
+                if entry[2] != version:
+                    entry[1] = (turn,)
+                    entry[2] = version
+                else:
+                    entry[1] = entry[1][1 - self.max_turns:] + (turn,) if self.max_turns > 1 else (turn,)
+                self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+class RateLimiter:
+    """Per-client token buckets held in process memory.
+
+    Each client earns rate tokens per second up to burst, and every message
+    spends one. A client holding a token is let in even when its request
+    costs more (a batch), leaving the bucket in debt until it refills, so
+    batches count at the same rate as single messages. Buckets are kept in
+    LRU order and the least recently seen clients are dropped beyond
+    max_clients, so a flood of distinct addresses can't grow the store
+    without bound.
+    """
+
+    def __init__(self, rate=CHAT_RATE_LIMIT, burst=CHAT_RATE_BURST, max_clients=CHAT_RATE_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, client, cost=1):
+        """Spend cost tokens for client: 0 if allowed, else the seconds until the next token"""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= cost
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+class LoadShedder:
+    """Turns chat requests away early while this process is overloaded.
+
+    Overload is too many requests in progress at once, or a smoothed
+    (exponentially weighted) handling latency above the threshold. Under
+    latency overload a growing share of requests is shed, but never all of
+    them, so the latency estimate keeps being refreshed and recovers.
+    """
+
+    def __init__(self, max_in_flight=CHAT_MAX_IN_FLIGHT, latency_ms=CHAT_SHED_LATENCY_MS, alpha=0.1):
+        self.max_in_flight = max_in_flight
+        self.latency = latency_ms / 1000
+        self.alpha = alpha
+        self.in_flight = 0
+        self.average = 0.0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        """Admit a request (and count it in flight), or return the reason to shed it"""
+        with self._lock:
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                return 'in_flight'
+            if self.latency > 0 and self.average > self.latency:
+                if random.random() < min(0.9, self.average / self.latency - 1):
+                    return 'latency'
+            self.in_flight += 1
+            return None
+
+    def exit(self, seconds):
+        """Finish an admitted request that took seconds to handle"""
+        with self._lock:
+            self.in_flight -= 1
+            self.average += self.alpha * (seconds - self.average)
+
+METRICS = Metrics()
+
+def file_stamp(path):
+    """Cheap change marker for a file: modification time and size"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def load_knowledge_data(path):
+    """Read and validate a knowledge base file"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("knowledge base file must hold a JSON object")
+    for key in ('knowledge_base', 'intents', 'responses', 'fallback'):
+        if key not in data:
+            raise ValueError(f"knowledge base file is missing '{key}'")
+    intents = data['intents']
+    if not all(isinstance(keywords, list) and all(isinstance(k, str) and k for k in keywords)
+               for keywords in intents.values()):
+        raise ValueError("every intent must map to a list of non-empty keyword strings")
+    for section in data['responses']:
+        unknown = set(section['intents']) - set(intents)
+        if unknown:
+            raise ValueError(f"response section refers to unknown intents: {sorted(unknown)}")
+        if not section['variants']:
+            raise ValueError("every response section needs at least one variant")
+    for key in ('found_prefix', 'menu'):
+        if not isinstance(data['fallback'].get(key), str):
+            raise ValueError(f"fallback.{key} must be a string")
+    return data
+
+class Knowledge:
+    """Everything derived from one version of the knowledge base file.
+
+    A snapshot is fully built (intent automaton, KB and spelling indexes, response table and
+    its own response cache) before it is published, and is never changed
+    afterwards. Requests read the chatbot's current snapshot once, so a
+    reload swapping in a new one can never produce mixed-version answers.
+    """
+
+    def __init__(self, data, version=None, cache_size=CHAT_CACHE_SIZE):
+        self.version = version
+        self.knowledge_base = data['knowledge_base']
+        self.intent_keywords = data['intents']
+        self.response_sections = [(tuple(section['intents']), tuple(section['variants']))
+                                  for section in data['responses']]
+        self.fallback_found_prefix = data['fallback']['found_prefix']
+        self.fallback_menu = data['fallback']['menu']
+        self.intent_matcher = IntentMatcher(self.intent_keywords)
+        self.knowledge_index = KnowledgeIndex(self.knowledge_base)
+        self.spelling = self.build_spelling()
+        self.retriever = KnowledgeRetriever(self.knowledge_index.texts) if np is not None else None
+        self.response_table = ResponseTable(self.intent_matcher, self.response_sections)
+        self.classifier = INTENT_MODEL.bind(self.intent_matcher.intents) if INTENT_MODEL is not None else None
+        self.response_cache = ResponseCache(cache_size)
+        # Concurrent cache misses for the same query share one computation
+        self.inflight = SingleFlight()
+        self.social_mask = self.intent_matcher.mask_for(SOCIAL_INTENTS)
+
+    def build_spelling(self):
+        """Spelling index over the keyword words and every word the bot knows or says"""
+        keywords = [word for keywords in self.intent_keywords.values() for keyword in keywords
+                    for word in TOKEN_RE.findall(keyword.lower())]
+        keywords += [plural(word) for word in keywords if plural(word) is not None]
+        texts = [' '.join(text) for text in self.knowledge_index.texts]
+        texts += [variant for _, variants in self.response_sections for variant in variants]
+        texts += [self.fallback_found_prefix, self.fallback_menu]
+        vocabulary = {word for text in texts for word in TOKEN_RE.findall(text.lower())}
+        return SpellingIndex(keywords, vocabulary)
+
+    def intent_masks(self, token_lists):
+        """Intent masks of corrected token lists: the keyword matcher's, and the classifier's
+        for those with no keyword at all, so it only adds paraphrases the keywords miss"""
+        masks = self.intent_matcher.match_masks(token_lists)
+        if self.classifier is None:
+            return masks
+        unmatched = [index for index, mask in enumerate(masks) if not mask]
+        if unmatched:
+            for index, mask in zip(unmatched, self.classifier.masks([token_lists[index] for index in unmatched])):
+                masks[index] = mask
+        return masks
+
+    @classmethod
+    def from_file(cls, path, cache_size=CHAT_CACHE_SIZE):
+        # Stamp first: a change landing while we load is then seen as a new version
+        version = file_stamp(path)
+        return cls(load_knowledge_data(path), version, cache_size)
+
+class KnowledgeWatcher:
+    """Polls the knowledge base file and hot-swaps a rebuilt snapshot into the chatbot.
+
+    The new snapshot is built on this background thread and its cache warmed
+    with the queries the old one had cached; requests keep using the old
+    one until the single reference assignment publishes it. A file that
+    fails to load is logged and the old version kept.
+    """
+
+    def __init__(self, chatbot, path, interval=CHAT_KB_POLL_INTERVAL):
+        self.chatbot = chatbot
+        self.path = path
+        self.interval = interval
+        # Called with each newly published snapshot
+        self.listeners = []
+        # Stamp of the last version of the file that failed to load
+        self.failed_stamp = None
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='kb-watcher', daemon=True)
+        self._thread.start()
+
+    def check(self):
+        """Reload if the file changed since the current snapshot was loaded"""
+        try:
+            stamp = file_stamp(self.path)
+        except OSError:
+            return False
+        if stamp == self.chatbot.knowledge.version or stamp == self.failed_stamp:
+            return False
+        try:
+            knowledge = Knowledge.from_file(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error(f"Knowledge base reload failed, keeping the current version: {e}")
+            # Don't retry the same broken file on every poll
+            self.failed_stamp = stamp
+            return False
+        self.chatbot.swap(knowledge)
+        for listener in self.listeners:
+            listener(knowledge)
+        logging.info(f"Knowledge base reloaded from {self.path}")
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+class KnowledgeRetriever:
+    """BM25 ranking of knowledge base entries, vectorized with NumPy.
+
+    Term weights are computed once into a term-major sparse matrix (CSR
+    arrays: indptr, doc_ids, weights). Scoring gathers the postings of every
+    query term and sums them per (query, entry) with one np.bincount, so a
+    whole batch of queries is scored against all entries in a single
+    vectorized operation.
+    """
+
+    TERM_RE = re.compile(r'[^\W_]+')
+
+    def __init__(self, texts, k1=1.2, b=0.75):
+        docs = [self.TERM_RE.findall(' '.join(text)) for text in texts]
+        self.n_docs = len(docs)
+        self.vocabulary = {}
+        term_counts = []
+        for doc_id, terms in enumerate(docs):
+            for term in terms:
+                term_id = self.vocabulary.setdefault(sys.intern(term), len(self.vocabulary))
+                if term_id == len(term_counts):
+                    term_counts.append({})
+                term_counts[term_id][doc_id] = term_counts[term_id].get(doc_id, 0) + 1
+
+        lengths = [len(terms) for terms in docs]
+        average_length = sum(lengths) / len(lengths) if lengths else 0.0
+        indptr = [0]
+        doc_ids = []
+        weights = []
+        for counts in term_counts:
+            idf = log(1 + (self.n_docs - len(counts) + 0.5) / (len(counts) + 0.5))
+            for doc_id, tf in sorted(counts.items()):
+                norm = k1 * (1 - b + b * lengths[doc_id] / average_length)
+                doc_ids.append(doc_id)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+            indptr.append(len(doc_ids))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.doc_ids = np.array(doc_ids, dtype=np.int64)
+        self.weights = np.array(weights, dtype=np.float64)
+
+    def term_ids(self, words):
+        """Vocabulary ids of the query words' terms; unknown terms are dropped"""
+        ids = []
+        for word in words:
+            for term in self.TERM_RE.findall(word):
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    ids.append(term_id)
+        return ids
+
+    def score_many(self, queries):
+        """BM25 scores of every entry for each query (a list of words): shape (queries, entries)"""
+        query_index = []
+        term_ids = []
+        for index, words in enumerate(queries):
+            ids = self.term_ids(words)
+            term_ids.extend(ids)
+            query_index.extend([index] * len(ids))
+        if not term_ids or not self.n_docs:
+            return np.zeros((len(queries), self.n_docs))
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        starts = self.indptr[term_ids]
+        counts = self.indptr[term_ids + 1] - starts
+        # Positions of every posting of every query term, laid end to end
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        positions = np.arange(counts.sum()) + offsets
+        cells = np.repeat(np.array(query_index, dtype=np.int64), counts) * self.n_docs + self.doc_ids[positions]
+        scores = np.bincount(cells, weights=self.weights[positions], minlength=len(queries) * self.n_docs)
+        return scores.reshape(len(queries), self.n_docs)
+
+    def top_k_many(self, queries, k=3, chunk_size=256):
+        """Best k (entry id, score) pairs per query, highest score first, ties in KB order"""
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            scores = self.score_many(queries[start:start + chunk_size])
+            order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+            for row, entry_ids in zip(scores, order):
+                results.append([(int(entry_id), float(row[entry_id])) for entry_id in entry_ids if row[entry_id] > 0])
+        return results
+
+    def top_k(self, words, k=3):
+        return self.top_k_many([words], k)[0]
+
+class IntentClassifier:
+    """One-vs-rest logistic regression over hashed word and character n-grams.
+
+    A query's features are its words, word bigrams and the character
+    trigrams of each word, hashed with crc32 into a fixed number of
+    dimensions, so the model needs no vocabulary and a new phrasing or typo
+    still shares features with the training data. Scoring a batch gathers
+    the weight rows of every query's features and sums them per query with
+    one np.add.reduceat: the product of the sparse feature matrix with the
+    (dims, intents) weight matrix, without building either densely. An
+    intent is predicted when its probability reaches its own threshold,
+    tuned by train_intents.py; thresholds are compared as logits, so
+    predicting needs no exp.
+    """
+
+    # Words whose hashed unigram and trigram features are kept, per model
+    WORD_CACHE_SIZE = 65536
+
+    def __init__(self, intents, weights, bias, thresholds):
+        self.intents = [sys.intern(str(intent)) for intent in intents]
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        clipped = np.clip(self.thresholds, 1e-6, 1 - 1e-6)
+        self.logit_thresholds = np.log(clipped / (1 - clipped))
+        self.dims = self.weights.shape[0]
+        # Intent mask bit of each weight column; set by bind
+        self.bits = [1 << index for index in range(len(self.intents))]
+        self._word_features = {}
+
+    @staticmethod
+    def word_feature_names(word):
+        padded = '<' + word + '>'
+        return ['w:' + word] + ['c:' + padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    @classmethod
+    def feature_names(cls, tokens):
+        names = [name for token in tokens for name in cls.word_feature_names(token)]
+        return names + ['b:' + first + ' ' + second for first, second in zip(tokens, tokens[1:])]
+
+    @classmethod
+    def hashed_features(cls, tokens, dims):
+        """Hashed feature indices of a token list, repeats included; each one weighs 1/sqrt(len)"""
+        return [zlib.crc32(name.encode('utf-8')) % dims for name in cls.feature_names(tokens)]
+
+    def features(self, tokens):
+        """hashed_features(tokens, self.dims), with each word's own features hashed once"""
+        cache = self._word_features
+        indices = []
+        for token in tokens:
+            hashed = cache.get(token)
+            if hashed is None:
+                if len(cache) >= self.WORD_CACHE_SIZE:
+                    cache.clear()
+                hashed = cache[token] = [zlib.crc32(name.encode('utf-8')) % self.dims
+                                         for name in self.word_feature_names(token)]
+            indices += hashed
+        indices += [zlib.crc32(('b:' + first + ' ' + second).encode('utf-8')) % self.dims
+                    for first, second in zip(tokens, tokens[1:])]
+        return indices
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as model:
+            return cls(model['intents'].tolist(), model['weights'], model['bias'], model['thresholds'])
+
+    def save(self, path):
+        np.savez_compressed(path, intents=np.array(self.intents), weights=self.weights,
+                            bias=self.bias, thresholds=self.thresholds)
+
+    def bind(self, intents):
+        """A view of the model answering in the bit layout of an IntentMatcher's intents.
+
+        Intents the matcher doesn't know are dropped, so a model trained on
+        an older knowledge base keeps working after intents are removed.
+        """
+        columns = [index for index, intent in enumerate(self.intents) if intent in intents]
+        missing = [intent for intent in self.intents if intent not in intents]
+        if missing:
+            logging.warning(f"Intent model has intents the knowledge base doesn't: {', '.join(missing)}")
+        bound = IntentClassifier([self.intents[index] for index in columns], self.weights[:, columns],
+                                 self.bias[columns], self.thresholds[columns])
+        bound.bits = [1 << intents.index(intent) for intent in bound.intents]
+        return bound
+
+    def scores(self, token_lists):
+        """Logit of each intent per token list: shape (queries, intents)"""
+        feature_lists = [self.features(tokens) for tokens in token_lists]
+        if len(feature_lists) == 1:
+            features = feature_lists[0]
+            if not features:
+                return self.bias[None, :].copy()
+            return (self.bias + self.weights[features].sum(axis=0) * len(features) ** -0.5)[None, :]
+        counts = np.array([len(features) for features in feature_lists], dtype=np.int64)
+        scores = np.tile(self.bias, (len(feature_lists), 1))
+        if counts.sum():
+            present = counts > 0
+            starts = (np.cumsum(counts) - counts)[present]
+            gathered = self.weights[np.fromiter((index for features in feature_lists for index in features),
+                                                dtype=np.int64, count=int(counts.sum()))]
+            # reduceat sums each query's rows; queries without features keep only the bias
+            scores[present] += np.add.reduceat(gathered, starts, axis=0) / np.sqrt(counts[present])[:, None]
+        return scores
+
+    def probabilities(self, token_lists):
+        """Probability of each intent per token list: shape (queries, intents)"""
+        return 1.0 / (1.0 + np.exp(-self.scores(token_lists)))
+
+    def masks(self, token_lists):
+        """Intent mask per token list, 0 where no intent reaches its threshold"""
+        if not token_lists:
+            return []
+        confident = self.scores(token_lists) >= self.logit_thresholds
+        bits = self.bits
+        return [sum(bits[column] for column in np.flatnonzero(row)) for row in confident]
+
+def load_intent_model(path):
+    """The trained intent classifier at path, or None without NumPy or a model file"""
+    if np is None or not path or not os.path.isfile(path):
+        return None
+    try:
+        model = IntentClassifier.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Could not load intent model {path}: {e}")
+        return None
+    logging.info(f"Intent model loaded from {path} ({len(model.intents)} intents, {model.dims} dims)")
+    return model
+
+INTENT_MODEL = load_intent_model(CHAT_INTENT_MODEL)
+
+class AdvancedChatbot:
+    def __init__(self, knowledge=None, tenant=None):
+        self.knowledge = knowledge if knowledge is not None else Knowledge.from_file(KNOWLEDGE_BASE_PATH)
+        # None for the default knowledge base, else the tenant's name
+        self.tenant = tenant
     
-    "services": {
-        "primary": "SaaS application for building design optimization",
-        "energy_modeling": "Advanced parametric energy modeling protocols",
-        "cost_analysis": "Capital and operational cost minimization",
-        "compliance": "Building code compliance verification",
-        "benchmarking": "Energy performance benchmarking",
-        "consulting": "Expert energy modeling consultation",
-        "design_optimization": "Building design solution identification",
-        "load_analysis": "Detailed building load analysis"
-    },
+    # The current snapshot's parts; code answering a request should read
+    # self.knowledge once instead, so it sees a single version throughout
+    @property
+    def intent_matcher(self):
+        return self.knowledge.intent_matcher
     
-    "platform_features": {
-        "3d_modeling": "Generate 3D, project-specific building models",
-        "energy_simulation": "Perform energy simulations for various design combinations",
-        "comparison_engine": "Compare thousands of design options",
-        "cost_optimization": "Identify cost-effective solutions",
-        "efficiency_analysis": "Maximize energy efficiency analysis",
-        "reporting": "Detailed performance reports and analytics",
-        "integration": "Integration with existing AEC workflows"
-    },
+    @property
+    def knowledge_index(self):
+        return self.knowledge.knowledge_index
     
-    "contact": {
-        "email": "anup@ecomatrix.io",
-        "phone": "+1 (204) 894 0387",
-        "website": "https://ecomatrix.io"
-    },
+    @property
+    def response_table(self):
+        return self.knowledge.response_table
+    
+    @property
+    def response_cache(self):
+        return self.knowledge.response_cache
+    
+    def swap(self, knowledge):
+        """Warm a new snapshot's cache, then publish it atomically.
+
+        The queries cached by the current snapshot are answered again by the
+        new one first, in the same recency order, so hot queries keep
+        hitting the cache across a reload.
+        """
+        old = self.knowledge
+        self.warm(QUICK_QUESTIONS + old.response_cache.keys(), knowledge)
+        self.knowledge = knowledge
+        if self.tenant is None:
+            # Name the old version's intent counts while its intent table is at hand;
+            # counts of older versions still left are dropped
+            retired = METRICS.take_intents(knowledge.version)
+            masks = {mask: count for (version, mask), count in retired.items() if version == old.version}
+            for name, labels, value in self.intent_samples(masks, old):
+                METRICS.inc(name, labels, value)
+        
+    def tokenize(self, query):
+        """Split the user query into lowercase words, dropping punctuation and spacing"""
+        return TOKEN_RE.findall(query.lower())
     
-    "technical_specs": {
-        "technology": "Proprietary SaaS application",
-        "modeling_type": "Parametric energy modeling",
-        "output_formats": "3D models, energy reports, cost analysis",
-        "industries_served": "Architecture, Engineering, Construction",
-        "compliance_standards": "Building energy codes and standards"
-    }
-}
-
-class AdvancedChatbot:
-    def __init__(self):
-        pass
-        
     def preprocess_query(self, query):
         """Clean and normalize the user query"""
-        query = query.lower().strip()
-        # Remove extra spaces and punctuation
-        query = re.sub(r'[^\w\s]', ' ', query)
-        query = re.sub(r'\s+', ' ', query)
-        return query
+        return ' '.join(self.tokenize(query))
     
-    def extract_intent(self, query):
-        """Determine user intent from the query"""
-        intents = {
-            'greeting': ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening'],
-            'services': ['service', 'offering', 'what do you do', 'capabilities', 'help with'],
-            'product': ['product', 'platform', 'software', 'application', 'tool', 'saas'],
-            'company': ['company', 'about', 'who are you', 'business', 'organization'],
-            'contact': ['contact', 'reach', 'phone', 'email', 'address', 'location'],
-            'technical': ['how does it work', 'technical', 'specification', 'technology'],
-            'pricing': ['price', 'cost', 'pricing', 'fee', 'subscription', 'payment'],
-            'comparison': ['vs', 'versus', 'compare', 'difference', 'better than'],
-            'benefits': ['benefit', 'advantage', 'why choose', 'value proposition'],
-            'industry': ['construction', 'architecture', 'engineering', 'aec', 'building'],
-            'energy': ['energy', 'efficiency', 'modeling', 'simulation', 'optimization'],
-            'farewell': ['bye', 'goodbye', 'thank you', 'thanks', 'see you']
-        }
-        
-        detected_intents = []
-        for intent, keywords in intents.items():
-            if any(keyword in query for keyword in keywords):
-                detected_intents.append(intent)
-        
+    def extract_intent(self, tokens):
+        """Determine user intent from the query's tokens (a query string is tokenized first)"""
+        if isinstance(tokens, str):
+            tokens = self.tokenize(tokens)
+        knowledge = self.knowledge
+        tokens = knowledge.spelling.correct_tokens(tokens)
+        detected_intents = knowledge.intent_matcher.intents_for(knowledge.intent_masks([tokens])[0])
         return detected_intents if detected_intents else ['general']
     
-    def get_contextual_response(self, query, intents):
-        """Generate contextual responses based on intents and query analysis"""
-        responses = []
-        
-        if 'greeting' in intents:
-            greetings = [
-                "Hello! I'm your ECO Matrix AI Assistant. How can I help you today?",
-                "Hi there! Welcome to ECO Matrix. What would you like to know?",
-                "Greetings! I'm here to help you with all your energy modeling questions."
-            ]
-            responses.append(random.choice(greetings))
-        
-        if 'services' in intents:
-            responses.append("""**ECO Matrix Services:**
-
- **Core Offering**: Our innovative SaaS application helps Architectural, Engineering, and Construction firms identify building design solutions that maximize energy efficiency while minimizing costs.
-
- **Key Services**:
-- Advanced parametric energy modeling protocols
-- Building design optimization and analysis
-- Capital and operational cost minimization strategies
-- Energy performance benchmarking
-- Building code compliance verification
-- Detailed building load analysis
-- Expert energy modeling consultation
-
- **Value Proposition**: We enable you to compare thousands of design options with detailed analysis, ensuring you get the most cost-effective and energy-efficient solutions for your projects.""")
-        
-        if 'product' in intents or 'technical' in intents:
-            responses.append("""**ECO Matrix Platform Features:**
-
- **3D Modeling**: Generate project-specific 3D building models tailored to your requirements
-
- **Energy Simulation**: Perform comprehensive energy simulations for various design combinations
-
- **Comparison Engine**: Compare thousands of design options simultaneously
-
- **Cost Optimization**: Identify solutions that outperform benchmarks in cost-effectiveness
-
- **Performance Analytics**: Detailed reporting and energy benchmarking capabilities
-
- **Integration**: Seamlessly integrates with existing AEC industry workflows
-
-The platform uses proprietary algorithms to help you make data-driven decisions for optimal building performance.""")
-        
-        if 'company' in intents:
-            responses.append("""**About ECO Matrix:**
-
- **Company**: ECO Matrix is a specialized energy modeling consultancy based in Winnipeg, Canada
-
- **Mission**: We focus on optimizing building decision metrics and KPIs for the AEC industry through advanced parametric modeling protocols
-
- **Expertise**: Our team consists of expert energy modeling professionals and engineers
-
- **Industry Focus**: We serve the Architectural, Engineering, and Construction industries
-
- **Innovation**: We're committed to providing cutting-edge solutions that drive energy efficiency and cost optimization in building design""")
-        
-        if 'contact' in intents:
-            responses.append("""**Contact ECO Matrix:**
-
- **Email**: anup@ecomatrix.io
- **Phone**: +1 (204) 894 0387
- **Website**: https://ecomatrix.io
- **Location**: Winnipeg, Canada
-
-Feel free to reach out for consultations, demos, or any questions about our energy modeling services!""")
-        
-        if 'energy' in intents:
-            responses.append("""**Energy Modeling & Optimization:**
-
- **Energy Efficiency**: Our platform maximizes building energy efficiency through advanced modeling techniques
-
- **Parametric Modeling**: We use sophisticated parametric protocols to analyze multiple design scenarios
-
- **Performance Benchmarking**: Compare your building's performance against industry standards and codes
-
- **Load Analysis**: Detailed analysis of building energy loads and consumption patterns
-
- **Optimization Reports**: Comprehensive reports showing energy savings potential and cost implications
-
-Our energy modeling approach ensures your buildings meet or exceed efficiency standards while staying within budget.""")
-        
-        if 'benefits' in intents:
-            responses.append("""**Why Choose ECO Matrix:**
-
- **Cost Savings**: Minimize both capital and operational costs through optimized design
-
- **Energy Efficiency**: Maximize building performance and energy savings
-
- **Data-Driven Decisions**: Make informed choices based on comprehensive analysis
-
-⏱ **Time Efficiency**: Quickly compare thousands of design options
-
- **Compliance Assurance**: Ensure building code compliance from the design phase
-
- **Competitive Advantage**: Stay ahead with cutting-edge energy modeling technology
-
- **Expert Support**: Access to experienced energy modeling professionals""")
-        
-        if 'pricing' in intents:
-            responses.append("""**Pricing Information:**
-
-For detailed pricing information and subscription options, please contact us directly:
-
- Email: anup@ecomatrix.io
- Phone: +1 (204) 894 0387
-
-We offer flexible pricing models tailored to your project needs and company size. Our team will be happy to discuss options that work best for your specific requirements.""")
-        
-        if 'farewell' in intents:
-            farewells = [
-                "Thank you for your interest in ECO Matrix! Feel free to reach out anytime.",
-                "Goodbye! Don't hesitate to contact us for your energy modeling needs.",
-                "Thanks for chatting! We're here whenever you need energy modeling expertise."
-            ]
-            responses.append(random.choice(farewells))
+    def get_response_sections(self, tokens, intents):
+        """Build the response as a tuple of sections, each a tuple of interchangeable variants"""
+        if isinstance(tokens, str):
+            tokens = self.tokenize(tokens)
+        knowledge = self.knowledge
+        sections = knowledge.response_table.sections(knowledge.intent_matcher.mask_for(intents))
         
         # Fallback for general queries
-        if not responses or 'general' in intents:
-            # Try to find relevant information based on keywords
-            keywords = query.split()
-            relevant_info = []
-            
-            for keyword in keywords:
-                for category, data in KNOWLEDGE_BASE.items():
-                    if isinstance(data, dict):
-                        for key, value in data.items():
-                            if keyword in key.lower() or keyword in str(value).lower():
-                                relevant_info.append(f"**{key.replace('_', ' ').title()}**: {value}")
-            
-            if relevant_info:
-                responses.append("Here's what I found relevant to your query:\n\n" + "\n".join(relevant_info[:3]))
-            else:
-                responses.append("""I'd be happy to help you with information about ECO Matrix! Here are some topics I can assist with:
-
- **Company Information** - Learn about ECO Matrix and our mission
- **Services** - Discover our energy modeling and optimization services
- **Platform Features** - Explore our SaaS application capabilities
- **Contact Details** - Get in touch with our team
- **Energy Modeling** - Understand our technical approach
- **Benefits** - See why ECO Matrix is the right choice
-
-Please feel free to ask about any of these topics or anything specific about energy modeling and building optimization!""")
+        if not sections or 'general' in intents:
+            sections += (self.fallback_section(tokens, knowledge),)
         
-        return "\n\n".join(responses)
+        return sections
+    
+    def fallback_section(self, words, knowledge, ranked=None):
+        """Search the knowledge base for the query words, or offer the topic menu.
+
+        Entries are ranked by BM25 when NumPy is available (ranked may carry
+        the (entry id, score) pairs already computed for a batch); queries
+        sharing no whole term with the KB fall back to substring matching.
+        """
+        if ranked is None and knowledge.retriever is not None:
+            ranked = knowledge.retriever.top_k(words)
+        if ranked:
+            relevant_info = [knowledge.knowledge_index.lines[entry_id] for entry_id, _ in ranked]
+        else:
+            relevant_info = knowledge.knowledge_index.search(words)
+        if relevant_info:
+            return (knowledge.fallback_found_prefix + "\n".join(relevant_info),)
+        return (knowledge.fallback_menu,)
+    
+    def render_sections(self, sections):
+        """Pick one variant per section and join them into the final text"""
+        return join_sections(sections)
+    
+    def get_contextual_response(self, tokens, intents):
+        """Generate contextual responses based on intents and query analysis"""
+        return self.render_sections(self.get_response_sections(tokens, intents))
+    
+    def plan_response(self, query):
+        """Resolve a user message to its ResponsePlan, via the cache and the intent table"""
+        return self.resolve(query)[1]
+    
+    def resolve(self, query, previous_mask=0, knowledge=None):
+        """Resolve a user message to its (intent mask, ResponsePlan) pair.
+
+        previous_mask holds the intents of the conversation's last topical
+        turn; it answers follow-ups like "tell me more about it" that name no
+        topic of their own. It must come from the same knowledge snapshot,
+        which is the current one unless given.
+        """
+        if knowledge is None:
+            knowledge = self.knowledge
+        started = time.perf_counter()
+        tokens = self.tokenize(query)
+        processed_query = ' '.join(tokens)
+        preprocessed = time.perf_counter()
+        entry = knowledge.response_cache.get(processed_query)
+        looked_up = time.perf_counter()
+        stages = [('preprocess', preprocessed - started), ('cache', looked_up - preprocessed)]
+        if entry is None:
+            entry = knowledge.inflight.do(processed_query,
+                                          lambda: self.compute_entry(tokens, processed_query, knowledge, stages))
+        if previous_mask and not knowledge.response_table.fired(entry[0]):
+            entry = self.resolve_follow_up(tokens, previous_mask, knowledge) or entry
+        METRICS.observe_stages(stages)
+        self.count_answer(entry[0], knowledge)
+        return entry
+    
+    def compute_entry(self, tokens, processed_query, knowledge, stages):
+        """Answer a cache miss and cache it, adding the intent and response stage timings to stages"""
+        started = time.perf_counter()
+        # Misspelt words are corrected first; the cache stays keyed by what was typed
+        corrected = knowledge.spelling.correct_tokens(tokens)
+        mask = knowledge.intent_masks([corrected])[0]
+        matched = time.perf_counter()
+        plan = knowledge.response_table.plan(mask)
+        if plan is None:
+            plan = ResponsePlan((self.fallback_section(corrected, knowledge),))
+        entry = (mask, plan)
+        knowledge.response_cache.put(processed_query, entry)
+        stages += [('intent', matched - started), ('response', time.perf_counter() - matched)]
+        return entry
+    
+    def resolve_follow_up(self, tokens, previous_mask, knowledge):
+        """Answer a topic-less follow-up with the previous turn's topics, if it refers back to them"""
+        if FOLLOW_UP_WORDS.isdisjoint(tokens):
+            return None
+        mask = previous_mask & ~knowledge.social_mask & knowledge.intent_matcher.all_mask
+        plan = knowledge.response_table.plan(mask)
+        return (mask, plan) if plan is not None else None
+    
+    def plan_responses(self, queries, knowledge=None):
+        """Resolve many user messages at once, computing each distinct normalized query only once"""
+        if knowledge is None:
+            knowledge = self.knowledge
+        token_lists = [self.tokenize(query) for query in queries]
+        processed_queries = [' '.join(tokens) for tokens in token_lists]
+        plans = {}
+        pending = {}
+        for processed_query, tokens in zip(processed_queries, token_lists):
+            if processed_query in plans or processed_query in pending:
+                continue
+            entry = knowledge.response_cache.get(processed_query)
+            if entry is None:
+                pending[processed_query] = knowledge.spelling.correct_tokens(tokens)
+            else:
+                plans[processed_query] = entry
+        for processed_query, entry in self.compute_entries(pending, knowledge).items():
+            knowledge.response_cache.put(processed_query, entry)
+            plans[processed_query] = entry
+        for processed_query in processed_queries:
+            self.count_answer(plans[processed_query][0], knowledge)
+        return [plans[processed_query][1] for processed_query in processed_queries]
+    
+    def compute_entries(self, pending, knowledge):
+        """(intent mask, ResponsePlan) entries for corrected token lists keyed by normalized query.
+
+        Nothing is cached or counted here. Intents are matched for the whole
+        batch at once, and all its fallback queries are ranked in one go.
+        """
+        masks = knowledge.intent_masks(list(pending.values()))
+        fallbacks = [processed_query for processed_query, mask in zip(pending, masks)
+                     if not knowledge.response_table.fired(mask)]
+        ranked = {}
+        if fallbacks and knowledge.retriever is not None:
+            ranked = dict(zip(fallbacks, knowledge.retriever.top_k_many([pending[query] for query in fallbacks])))
+        entries = {}
+        for (processed_query, corrected), mask in zip(pending.items(), masks):
+            plan = knowledge.response_table.plan(mask)
+            if plan is None:
+                plan = ResponsePlan((self.fallback_section(corrected, knowledge, ranked.get(processed_query)),))
+            entries[processed_query] = (mask, plan)
+        return entries
+    
+    def count_answer(self, mask, knowledge):
+        """Count an answered message; intent masks only mean something for the default intent table"""
+        if self.tenant is None:
+            METRICS.count_intents(mask, knowledge.version)
+        else:
+            METRICS.inc('chat_tenant_messages_total', f'tenant="{self.tenant}"')
+    
+    def collect_metrics(self, intent_masks):
+        """Metric samples derived from this chatbot's state: intent and fallback counts, cache size.
+
+        Only masks counted against the current knowledge base version are
+        expanded; swap() turns the previous version's into named counters.
+        """
+        knowledge = self.knowledge
+        samples = self.intent_samples({mask: count for (version, mask), count in intent_masks.items()
+                                       if version == knowledge.version}, knowledge)
+        samples.append(('chat_cache_entries', '', knowledge.response_cache.stats()['size']))
+        return samples
+    
+    def intent_samples(self, intent_masks, knowledge):
+        """chat_intents_total and chat_fallback_total samples for counts of one version's intent masks"""
+        intent_counts = {}
+        fallbacks = 0
+        for mask, count in intent_masks.items():
+            for intent in knowledge.intent_matcher.intents_for(mask) or ['general']:
+                intent_counts[intent] = intent_counts.get(intent, 0) + count
+            if not knowledge.response_table.fired(mask):
+                fallbacks += count
+        samples = [('chat_intents_total', f'intent="{intent}"', count) for intent, count in intent_counts.items()]
+        samples.append(('chat_fallback_total', '', fallbacks))
+        return samples
+    
+    def warm(self, queries=QUICK_QUESTIONS, knowledge=None):
+        """Cache the answers to queries before serving traffic, later ones as more recently used.
+
+        Warming isn't traffic, so nothing is recorded in METRICS, and at
+        most the cache's size of queries (the last ones) are answered.
+        """
+        if knowledge is None:
+            knowledge = self.knowledge
+        cache = knowledge.response_cache
+        if cache.max_size <= 0:
+            return
+        token_lists = {}
+        for query in queries:
+            tokens = self.tokenize(query)
+            processed_query = ' '.join(tokens)
+            # Keep each query at its last position
+            token_lists.pop(processed_query, None)
+            token_lists[processed_query] = tokens
+        pending = {processed_query: knowledge.spelling.correct_tokens(tokens)
+                   for processed_query, tokens in list(token_lists.items())[-cache.max_size:]}
+        for processed_query, entry in self.compute_entries(pending, knowledge).items():
+            cache.put(processed_query, entry)
     
     def generate_response(self, query):
         """Main method to generate intelligent responses"""
-        processed_query = self.preprocess_query(query)
-        intents = self.extract_intent(processed_query)
-        response = self.get_contextual_response(processed_query, intents)
-        return response
+        return self.plan_response(query).render()
+    
+    def generate_responses(self, queries):
+        """Generate responses for many queries, in order"""
+        return [plan.render() for plan in self.plan_responses(queries)]
 
 # Initialize chatbot instance
 chatbot = AdvancedChatbot()
-
-# HTML Template
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>ECO Matrix AI Assistant</title>
-    <link rel="shortcut icon" href="{{ url_for('static', filename='favicon.ico') }}">
-    <link rel="icon" type="image/png" href="{{ url_for('static', filename='favicon.png') }}">
-
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Arial', sans-serif;
-            background-color: #f5f5f5;
-            min-height: 100vh;
-            display: flex;
-            flex-direction: column;
-        }
-        
-        .main-header {
-            background: linear-gradient(90deg, #2E8B57, #4682B4);
-            color: white;
-            padding: 2rem;
-            text-align: center;
-            margin-bottom: 2rem;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        }
-        
-        .main-header h1 {
-            font-size: 2.5rem;
-            margin-bottom: 0.5rem;
-        }
-        
-        .main-header p {
-            font-size: 1.2rem;
-            opacity: 0.9;
-        }
-        
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 0 2rem;
-            flex: 1;
-            display: flex;
-            gap: 2rem;
-        }
-        
-        .chat-section {
-            flex: 3;
-            background: white;
-            border-radius: 10px;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-            overflow: hidden;
-            display: flex;
-            flex-direction: column;
-            height: 600px;
-        }
-        
-        .chat-header {
-            background: #f8f9fa;
-            padding: 1rem;
-            border-bottom: 1px solid #e9ecef;
-            font-weight: bold;
-            font-size: 1.1rem;
-            color: #2E8B57;
-        }
-        
-        .chat-messages {
-            flex: 1;
-            overflow-y: auto;
-            padding: 1rem;
-            display: flex;
-            flex-direction: column;
-            gap: 1rem;
-        }
-        
-        .message {
-            padding: 1rem;
-            border-radius: 10px;
-            max-width: 80%;
-            word-wrap: break-word;
-        }
-        
-        .user-message {
-            background-color: #e3f2fd;
-            border-left: 4px solid #4682B4;
-            align-self: flex-end;
-            margin-left: auto;
-        }
-        
-        .bot-message {
-            background-color: #f1f8e9;
-            border-left: 4px solid #2E8B57;
-            align-self: flex-start;
-        }
-        
-        .message-content {
-            white-space: pre-wrap;
-            line-height: 1.5;
-        }
-        
-        .message-header {
-            font-weight: bold;
-            margin-bottom: 0.5rem;
-            color: #333;
-        }
-        
-        .input-section {
-            border-top: 1px solid #e9ecef;
-            padding: 1rem;
-            background: #f8f9fa;
-        }
-        
-        .input-form {
-            display: flex;
-            gap: 0.5rem;
-        }
-        
-        .message-input {
-            flex: 1;
-            padding: 0.75rem;
-            border: 1px solid #ddd;
-            border-radius: 25px;
-            font-size: 1rem;
-            outline: none;
-            transition: border-color 0.3s;
-        }
-        
-        .message-input:focus {
-            border-color: #2E8B57;
-        }
-        
-        .send-button {
-            background: linear-gradient(90deg, #2E8B57, #4682B4);
-            color: white;
-            border: none;
-            padding: 0.75rem 1.5rem;
-            border-radius: 25px;
-            cursor: pointer;
-            font-size: 1rem;
-            transition: transform 0.2s;
-        }
-        
-        .send-button:hover {
-            transform: translateY(-1px);
-        }
-        
-        .send-button:disabled {
-            opacity: 0.6;
-            cursor: not-allowed;
-            transform: none;
-        }
-        
-        .sidebar {
-            flex: 1;
-            display: flex;
-            flex-direction: column;
-            gap: 1rem;
-        }
-        
-        .quick-actions, .contact-info {
-            background: white;
-            border-radius: 10px;
-            padding: 1.5rem;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        }
-        
-        .section-title {
-            font-size: 1.2rem;
-            font-weight: bold;
-            margin-bottom: 1rem;
-            color: #2E8B57;
-        }
-        
-        .quick-button {
-            width: 100%;
-            padding: 0.75rem;
-            margin-bottom: 0.5rem;
-            background: #f8f9fa;
-            border: 1px solid #e9ecef;
-            border-radius: 8px;
-            cursor: pointer;
-            font-size: 0.9rem;
-            text-align: left;
-            transition: all 0.3s;
-        }
-        
-        .quick-button:hover {
-            background: #e9ecef;
-            border-color: #2E8B57;
-        }
-        
-        .clear-button {
-            background: #dc3545;
-            color: white;
-            border: none;
-            padding: 0.75rem 1rem;
-            border-radius: 8px;
-            cursor: pointer;
-            font-size: 1rem;
-            width: 100%;
-            margin-top: 1rem;
-            transition: background-color 0.3s;
-        }
-        
-        .clear-button:hover {
-            background: #c82333;
-        }
-        
-        .contact-details {
-            line-height: 1.8;
-            color: #555;
-        }
-        
-        .contact-details strong {
-            color: #2E8B57;
-        }
-        
-        .contact-details a {
-            color: #2E8B57;
-            text-decoration: none;
-        }
-        
-        .contact-details a:hover {
-            text-decoration: underline;
-        }
-        
-        .footer {
-            text-align: center;
-            color: #666;
-            padding: 2rem;
-            margin-top: 2rem;
-            border-top: 1px solid #e9ecef;
-        }
-        
-        .loading {
-            display: none;
-            text-align: center;
-            padding: 1rem;
-            color: #666;
-        }
-        
-        .spinner {
-            display: inline-block;
-            width: 20px;
-            height: 20px;
-            border: 3px solid #f3f3f3;
-            border-top: 3px solid #2E8B57;
-            border-radius: 50%;
-            animation: spin 1s linear infinite;
-            margin-right: 10px;
-        }
-        
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-        
-        @media (max-width: 768px) {
-            .container {
-                flex-direction: column;
-                padding: 0 1rem;
-            }
-            
-            .main-header h1 {
-                font-size: 2rem;
-            }
-            
-            .main-header p {
-                font-size: 1rem;
-            }
-            
-            .chat-section {
-                height: 500px;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="main-header">
-        <h1>🤖 ECO Matrix AI Assistant</h1>
-        <p>Your intelligent companion for energy modeling and building optimization</p>
-    </div>
-    
-    <div class="container">
-        <div class="chat-section">
-            <div class="chat-header">
-                💬 Chat with ECO Matrix AI
-            </div>
-            
-            <div class="chat-messages" id="chatMessages">
-            </div>
-            
-            <div class="loading" id="loading">
-                <div class="spinner"></div>
-                <span>ECO Matrix AI is thinking...</span>
-            </div>
-            
-            <div class="input-section">
-                <form class="input-form" id="messageForm">
-                    <input type="text" class="message-input" id="messageInput" 
-                           placeholder="Ask me anything about ECO Matrix..." required>
-                    <button type="submit" class="send-button" id="sendButton">Send </button>
-                </form>
-            </div>
-        </div>
-        
-        <div class="sidebar">
-            <div class="quick-actions">
-                <div class="section-title">🚀 Quick Actions</div>
-                <button class="quick-button" onclick="sendQuickMessage('What services does ECO Matrix offer?')">
-                    What services does ECO Matrix offer?
-                </button>
-                <button class="quick-button" onclick="sendQuickMessage('How does the platform work?')">
-                    How does the platform work?
-                </button>
-                <button class="quick-button" onclick="sendQuickMessage('Tell me about the company')">
-                    Tell me about the company
-                </button>
-                <button class="quick-button" onclick="sendQuickMessage('How can I contact ECO Matrix?')">
-                    How can I contact ECO Matrix?
-                </button>
-                <button class="quick-button" onclick="sendQuickMessage('What are the benefits of using ECO Matrix?')">
-                    What are the benefits of using ECO Matrix?
-                </button>
-                <button class="quick-button" onclick="sendQuickMessage('What is energy modeling?')">
-                    What is energy modeling?
-                </button>
-                <button class="clear-button" onclick="clearConversation()">
-                    🗑️ Clear Conversation
-                </button>
-            </div>
-            
-            <div class="contact-info">
-                <div class="section-title">📞 Contact Info</div>
-                <div class="contact-details">
-                    <strong>Email:</strong> anup@ecomatrix.io<br>
-                    <strong>Phone:</strong> +1 (204) 894 0387<br>
-                    <strong>Website:</strong> <a href="https://ecomatrix.io" target="_blank">ecomatrix.io</a>
-                </div>
-            </div>
-        </div>
-    </div>
-    
-    <div class="footer">
-        Powered by ECO Matrix AI Assistant | Advanced Energy Modeling Solutions | © 2025 All Rights Reserved.
-    </div>
-    
-<  <script>
-    let isLoading = false;
-    const messageForm = document.getElementById('messageForm');
-    const messageInput = document.getElementById('messageInput');
-    const chatMessages = document.getElementById('chatMessages');
-    const loading = document.getElementById('loading');
-    const sendButton = document.getElementById('sendButton');
-
-    function formatMessage(content) {
-      return content
-        .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
-        .replace(/\*(.*?)\*/g, '<em>$1</em>')
-        .replace(/\n/g, '<br>');
+METRICS.collectors.append(chatbot.collect_metrics)
+
+# Reload the knowledge base when its file changes; each forked worker runs its own watcher
+knowledge_watcher = KnowledgeWatcher(chatbot, KNOWLEDGE_BASE_PATH)
+knowledge_watcher.start()
+os.register_at_fork(after_in_child=knowledge_watcher.start)
+
+class TenantRegistry:
+    """Chatbots for the tenants in CHAT_TENANTS_DIR, loaded on first use.
+
+    Each tenant gets its own Knowledge snapshot (intent automaton, indexes,
+    response table and a smaller response cache). At most max_loaded are
+    kept, in LRU order, and tenants unused for idle_ttl seconds are dropped,
+    so idle brands cost no memory. A tenant whose file changed is dropped
+    and reloaded on its next request. Concurrent first requests for a tenant
+    share one load.
+    """
+
+    NAME_RE = re.compile(r'[a-z0-9][a-z0-9_-]{0,62}')
+
+    def __init__(self, directory=CHAT_TENANTS_DIR, max_loaded=CHAT_TENANTS_MAX_LOADED,
+                 idle_ttl=CHAT_TENANT_IDLE_TTL, cache_size=CHAT_TENANT_CACHE_SIZE):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self.idle_ttl = idle_ttl
+        self.cache_size = cache_size
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._loads = SingleFlight(timeout=30)
+        self._names = frozenset()
+        self._listed = None
+
+    def names(self):
+        """Tenants with a knowledge base file; the directory is listed at most every poll interval"""
+        now = time.monotonic()
+        if self._listed is None or now - self._listed >= max(CHAT_KB_POLL_INTERVAL, 1):
+            try:
+                files = os.listdir(self.directory)
+            except OSError:
+                files = []
+            self._names = frozenset(name[:-5] for name in files
+                                    if name.endswith('.json') and self.NAME_RE.fullmatch(name[:-5]))
+            self._listed = now
+        return self._names
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.json')
+
+    def get(self, name):
+        """The tenant's chatbot, loading it if needed; None for an unknown tenant"""
+        if name not in self.names():
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            entry = self._loaded.get(name)
+            if entry is not None:
+                self._loaded.move_to_end(name)
+                entry[1] = now
+        if entry is not None and now - entry[2] >= CHAT_KB_POLL_INTERVAL > 0:
+            entry[2] = now
+            try:
+                changed = file_stamp(self.path(name)) != entry[0].knowledge.version
+            except OSError:
+                changed = True
+            if changed:
+                self.evict(name)
+                entry = None
+        if entry is None:
+            try:
+                bot = self._loads.do(name, lambda: self.load(name))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.error(f"Tenant '{name}' failed to load: {e}")
+                return None
+            return bot
+        return entry[0]
+
+    def load(self, name):
+        knowledge = Knowledge.from_file(self.path(name), self.cache_size)
+        bot = AdvancedChatbot(knowledge, tenant=name)
+        now = time.monotonic()
+        with self._lock:
+            self._loaded[name] = [bot, now, now]
+            self._loaded.move_to_end(name)
+            while len(self._loaded) > self.max_loaded:
+                evicted, _ = self._loaded.popitem(last=False)
+                logging.info(f"Tenant '{evicted}' unloaded (over {self.max_loaded} loaded)")
+            self._sweep(now)
+        logging.info(f"Tenant '{name}' loaded from {self.path(name)}")
+        return bot
+
+    def _sweep(self, now):
+        # Entries are in LRU order, so the idle ones are at the front; the lock is held
+        while self._loaded:
+            oldest, entry = next(iter(self._loaded.items()))
+            if now - entry[1] < self.idle_ttl:
+                break
+            del self._loaded[oldest]
+            logging.info(f"Tenant '{oldest}' unloaded (idle)")
+
+    def evict(self, name):
+        with self._lock:
+            self._loaded.pop(name, None)
+
+    def loaded(self):
+        with self._lock:
+            self._sweep(time.monotonic())
+            return list(self._loaded)
+
+tenants = TenantRegistry()
+METRICS.collectors.append(lambda intent_masks: [('chat_tenants_loaded', '', len(tenants.loaded()))])
+
+def select_bot(tenant=None, host=''):
+    """Chatbot answering a request: the tenant named in the path, else the tenant named
+    by the Host header's first label, else the default one. None for an unknown path tenant."""
+    if tenant is not None:
+        return tenants.get(tenant)
+    if host:
+        label = host.split('.', 1)[0].split(':', 1)[0].lower()
+        if label in tenants.names():
+            bot = tenants.get(label)
+            if bot is not None:
+                return bot
+    return chatbot
+
+# Per-session conversation memory
+conversations = ConversationStore()
+METRICS.collectors.append(lambda intent_masks: [('chat_conversations', '', len(conversations))])
+
+# Request handlers shared by the Flask routes below and the ASGI app in asgi.py.
+# Each takes the decoded JSON request body, the conversation's session id
+# (None for stateless calls) and the request's Accept-Encoding header, and
+# returns (status code, body, extra response headers).
+
+EMPTY_MESSAGE_ERROR = json_body({"success": False, "error": "Message cannot be empty."})
+MESSAGE_TOO_LONG_ERROR = json_body({"success": False, "error": f"Message cannot be longer than {CHAT_MAX_MESSAGE_CHARS} characters."})
+BODY_TOO_LARGE_ERROR = json_body({"success": False, "error": f"Request body cannot be larger than {CHAT_MAX_BODY_BYTES} bytes."})
+TOO_MANY_REQUESTS_ERROR = json_body({"success": False, "error": "Too many requests. Please slow down and try again."})
+SERVER_BUSY_ERROR = json_body({"success": False, "error": "The assistant is busy right now. Please try again shortly."})
+UNKNOWN_TENANT_ERROR = json_body({"success": False, "error": "Unknown assistant."})
+CLEAR_PAYLOAD = json_body({"success": True, "response": "Conversation cleared. Hello! I'm your ECO Matrix AI Assistant. How can I help you today?"})
+# The default greeting names the ECO Matrix assistant; tenants get a neutral one
+TENANT_CLEAR_PAYLOAD = json_body({"success": True, "response": "Conversation cleared. How can I help you today?"})
+
+def request_message(data):
+    """Extract the stripped user message from a request body"""
+    message = data.get('message') if isinstance(data, dict) else None
+    return message.strip() if isinstance(message, str) else ''
+
+def request_fields(user_message, mask, plan, bot):
+    fields = {
+        "message": user_message[:CHAT_LOG_MESSAGE_CHARS],
+        "intents": bot.intent_matcher.intents_for(mask) or ['general'],
+        "response_id": plan.id,
     }
-
-    function addMessage(role, content) {
-      const messageDiv = document.createElement('div');
-      messageDiv.className = `message ${role}-message`;
-
-      const messageHeader = document.createElement('div');
-      messageHeader.className = 'message-header';
-      messageHeader.textContent = role === 'user' ? 'You:' : 'ECO Matrix AI:';
-
-      const messageContent = document.createElement('div');
-      messageContent.className = 'message-content';
-      messageContent.innerHTML = formatMessage(content);
-
-      messageDiv.appendChild(messageHeader);
-      messageDiv.appendChild(messageContent);
-      chatMessages.appendChild(messageDiv);
-      chatMessages.scrollTop = chatMessages.scrollHeight;
-    }
-
-    async function sendMessage(message) {
-      if (isLoading || !message.trim()) return;
-
-      isLoading = true;
-      loading.style.display = 'block';
-      sendButton.disabled = true;
-
-      addMessage('user', message);
-      messageInput.value = '';
-
-      try {
-        const response = await fetch('/chat', {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-          },
-          body: JSON.stringify({ message: message })
-        });
-
-        const data = await response.json();
-
-        if (response.ok && data.success) {
-          addMessage('bot', data.response);
-        } else {
-          addMessage('bot', data.error || 'Sorry, I encountered an error. Please try again.');
-        }
-      } catch (error) {
-        console.error('Error:', error);
-        addMessage('bot', 'Sorry, I encountered a connection error. Please try again.');
-      } finally {
-        isLoading = false;
-        loading.style.display = 'none';
-        sendButton.disabled = false;
-        messageInput.focus();
-      }
-    }
-
-    messageForm.addEventListener('submit', function (e) {
-      e.preventDefault();
-      const message = messageInput.value.trim();
-      if (message && !isLoading) {
-        sendMessage(message);
-      }
-    });
-
-    messageInput.addEventListener('keypress', function (e) {
-      if (e.key === 'Enter' && !e.shiftKey) {
-        e.preventDefault();
-        const message = messageInput.value.trim();
-        if (message && !isLoading) {
-          sendMessage(message);
-        }
-      }
-    });
-
-    function sendQuickMessage(msg) {
-      if (!isLoading) {
-        messageInput.value = msg;
-        sendMessage(msg);
-      }
-    }
-
-    async function clearConversation() {
-      if (confirm('Are you sure you want to clear the conversation?')) {
-        try {
-          await fetch('/clear', {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-              'Accept': 'application/json'
-            }
-          });
-          chatMessages.innerHTML = '';
-          addMessage('bot', 'Hello! I\'m your ECO Matrix AI Assistant. How can I help you today?');
-        } catch {
-          chatMessages.innerHTML = '';
-          addMessage('bot', 'Hello! I\'m your ECO Matrix AI Assistant. How can I help you today?');
-        }
-      }
-    }
-
-    document.addEventListener('DOMContentLoaded', () => {
-      addMessage('bot', 'Hello! I\'m your ECO Matrix AI Assistant. How can I help you today?');
-      messageInput.focus();
-    });
-  </script>
-</body>
-</html>
-"""
+    if bot.tenant is not None:
+        fields["tenant"] = bot.tenant
+    return fields
+
+def conversation_key(session_id, bot):
+    """Tenants keep separate conversations even when one browser talks to several"""
+    return session_id if bot.tenant is None else f'{bot.tenant}:{session_id}'
+
+def record_route(route, bot):
+    return route if bot.tenant is None else f'/t/{bot.tenant}{route}'
+
+def converse(user_message, session_id, bot):
+    """Resolve a message in the context of its session and remember the turn"""
+    # One snapshot throughout, so the remembered masks match its intent table
+    knowledge = bot.knowledge
+    if session_id is None:
+        return bot.resolve(user_message, knowledge=knowledge)
+    key = conversation_key(session_id, bot)
+    previous_mask = conversations.context_mask(key, knowledge.version, knowledge.social_mask)
+    mask, plan = bot.resolve(user_message, previous_mask, knowledge)
+    conversations.record(key, mask, user_message, knowledge.version)
+    return mask, plan
+
+def handle_chat(data, session_id=None, accept_encoding='', bot=None):
+    started = time.perf_counter()
+    bot = bot or chatbot
+    user_message = request_message(data)
+    if not user_message:
+        log_request('chat', started, status=400)
+        return 400, EMPTY_MESSAGE_ERROR, {}
+    if len(user_message) > CHAT_MAX_MESSAGE_CHARS:
+        log_request('chat', started, status=413)
+        return 413, MESSAGE_TOO_LONG_ERROR, {}
+    if TRAFFIC_RECORDER is not None:
+        TRAFFIC_RECORDER.record(record_route('/chat', bot), user_message, session_id)
+    mask, plan = converse(user_message, session_id, bot)
+    body, headers = plan.chat_body(accept_encoding)
+    log_request('chat', started, status=200, **request_fields(user_message, mask, plan, bot))
+    return 200, body, headers
+
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def handle_chat_stream(data, session_id=None, accept_encoding='', bot=None):
+    """Like handle_chat, but a successful body is an uncompressed iterator of server-sent events"""
+    started = time.perf_counter()
+    bot = bot or chatbot
+    user_message = request_message(data)
+    if not user_message:
+        log_request('chat_stream', started, status=400)
+        return 400, EMPTY_MESSAGE_ERROR, {}
+    if len(user_message) > CHAT_MAX_MESSAGE_CHARS:
+        log_request('chat_stream', started, status=413)
+        return 413, MESSAGE_TOO_LONG_ERROR, {}
+    if TRAFFIC_RECORDER is not None:
+        TRAFFIC_RECORDER.record(record_route('/chat/stream', bot), user_message, session_id)
+    mask, plan = converse(user_message, session_id, bot)
+    sections = plan.render_sections()
+    log_request('chat_stream', started, status=200, **request_fields(user_message, mask, plan, bot))
+
+    def events():
+        # One event per section so the page can render each as it arrives
+        for section in sections:
+            yield sse_event('section', {"text": section}).encode('utf-8')
+        yield sse_event('done', {"success": True}).encode('utf-8')
+
+    return 200, events(), STREAM_HEADERS
+
+def handle_chat_batch(data, session_id=None, accept_encoding='', bot=None):
+    started = time.perf_counter()
+    bot = bot or chatbot
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return 400, json_body({"success": False, "error": "Messages must be a non-empty list."}), {}
+    if len(messages) > CHAT_BATCH_MAX_MESSAGES:
+        return 413, json_body({"success": False, "error": f"At most {CHAT_BATCH_MAX_MESSAGES} messages per batch."}), {}
+    messages = [message.strip() if isinstance(message, str) else '' for message in messages]
+    valid = [message for message in messages if message and len(message) <= CHAT_MAX_MESSAGE_CHARS]
+    plans = iter(bot.plan_responses(valid))
+    # Each result is the exact body /chat would return for that message
+    results = []
+    for message in messages:
+        if not message:
+            results.append(EMPTY_MESSAGE_ERROR)
+            continue
+        if len(message) > CHAT_MAX_MESSAGE_CHARS:
+            results.append(MESSAGE_TOO_LONG_ERROR)
+            continue
+        plan = next(plans)
+        results.append(plan.payload if plan.payload is not None else chat_payload(plan.render()))
+    log_request('chat_batch', started, status=200, messages=len(messages))
+    body, headers = encode_body(b'{"success":true,"results":[' + b','.join(results) + b']}', accept_encoding)
+    return 200, body, headers
+
+def handle_clear(data, session_id=None, accept_encoding='', bot=None):
+    started = time.perf_counter()
+    bot = bot or chatbot
+    if session_id is not None:
+        conversations.clear(conversation_key(session_id, bot))
+    log_request('clear', started, status=200)
+    return 200, CLEAR_PAYLOAD if bot.tenant is None else TENANT_CLEAR_PAYLOAD, {}
+
+# Routes that run the chat pipeline, and so go through admission control
+ADMITTED_ROUTES = frozenset(['/chat', '/chat/stream', '/chat/batch',
+                             '/t/<tenant>/chat', '/t/<tenant>/chat/stream', '/t/<tenant>/chat/batch'])
+
+rate_limiter = RateLimiter()
+load_shedder = LoadShedder()
+
+if CHAT_RATE_LIMIT > 0 and not CHAT_CLIENT_HEADER:
+    logging.warning("Rate limiting by peer address: behind a proxy or load balancer every user shares its "
+                    "address, so set CHAT_CLIENT_HEADER to the header carrying the client's")
+
+def request_cost(data):
+    """Rate limit tokens a chat request spends: one per message of a batch"""
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if isinstance(messages, list) and messages:
+        return min(len(messages), CHAT_BATCH_MAX_MESSAGES)
+    return 1
+
+def admit(client, cost=1):
+    """Admission control for a chat request: None if admitted (call release when done),
+    otherwise the (status, body, headers) rejection to send at once"""
+    retry_after = rate_limiter.allow(client, cost)
+    if retry_after:
+        METRICS.inc('chat_rejected_total', 'reason="rate_limit"')
+        return 429, TOO_MANY_REQUESTS_ERROR, {'Retry-After': str(ceil(retry_after))}
+    reason = load_shedder.enter()
+    if reason is not None:
+        METRICS.inc('chat_rejected_total', f'reason="{reason}"')
+        return 503, SERVER_BUSY_ERROR, {'Retry-After': '1'}
+    return None
+
+def release(seconds):
+    load_shedder.exit(seconds)
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def handle_metrics():
+    return 200, METRICS.render().encode('utf-8')
+
+def record_request(route, status, seconds):
+    """Count one answered HTTP request and its latency"""
+    METRICS.observe('chat_request_duration_seconds', f'route="{route}"', seconds)
+    METRICS.inc('chat_requests_total', f'route="{route}",status="{status}"')
+
+# Built static assets, loaded into memory once
+ASSETS = load_assets(ASSET_DIST_DIR)
+
+def render_index_page():
+    """Render the landing page once into a CachedBody; its output doesn't depend on the request"""
+    with app.test_request_context('/'):
+        html = render_template(INDEX_TEMPLATE).encode('utf-8')
+    # Revalidated on every visit, which costs a 304 while the page is unchanged
+    return CachedBody(html, 'text/html; charset=utf-8', 'no-cache', compressed_variants(html))
+
+INDEX_PAGE = render_index_page()
+
+def refresh_index_page(knowledge=None):
+    global INDEX_PAGE
+    INDEX_PAGE = render_index_page()
+
+# Re-render alongside each knowledge base reload
+knowledge_watcher.listeners.append(refresh_index_page)
+
+def handle_index(accept_encoding='', if_none_match=''):
+    """Serve the prerendered landing page: (status, body, headers)"""
+    return INDEX_PAGE.respond(accept_encoding, if_none_match)
+
+def handle_asset(filename, accept_encoding='', if_none_match=''):
+    """Serve a fingerprinted asset from memory: (status, body, headers)"""
+    asset = ASSETS.get(filename)
+    if asset is None:
+        return 404, b'Not Found', {'Content-Type': 'text/plain'}
+    return asset.respond(accept_encoding, if_none_match)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+app.config['MAX_CONTENT_LENGTH'] = CHAT_MAX_BODY_BYTES
+
+def client_address():
+    """Address the rate limit is keyed on"""
+    if CHAT_CLIENT_HEADER:
+        return request.headers.get(CHAT_CLIENT_HEADER) or request.remote_addr
+    return request.remote_addr
+
+@app.before_request
+def admission_control():
+    g.admitted = False
+    if request.url_rule is not None and request.url_rule.rule in ADMITTED_ROUTES:
+        rejection = admit(client_address(), request_cost(request.get_json(force=True, silent=True)))
+        if rejection is not None:
+            status, body, headers = rejection
+            return app.response_class(body, status=status, headers=headers, mimetype='application/json')
+        g.admitted = True
+
+@app.teardown_request
+def finish_admission(exc):
+    if g.get('admitted'):
+        release(time.perf_counter() - g.request_started)
+
+@app.before_request
+def select_tenant():
+    # After admission control: loading a tenant's knowledge base is the expensive part
+    g.bot = chatbot
+    if request.url_rule is not None and request.url_rule.rule not in ('/', '/metrics', '/static/dist/<path:filename>'):
+        g.bot = select_bot((request.view_args or {}).get('tenant'), request.host)
+        if g.bot is None:
+            return app.response_class(UNKNOWN_TENANT_ERROR, status=404, mimetype='application/json')
+
+@app.errorhandler(413)
+def body_too_large(error):
+    return app.response_class(BODY_TOO_LARGE_ERROR, status=413, mimetype='application/json')
+
+@app.after_request
+def record_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    record_request(route, response.status_code, time.perf_counter() - g.request_started)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    status, body = handle_metrics()
+    return app.response_class(body, status=status, content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/static/dist/<path:filename>')
+def asset(filename):
+    status, body, headers = handle_asset(filename, request.headers.get('Accept-Encoding', ''),
+                                         request.headers.get('If-None-Match', ''))
+    return app.response_class(body, status=status, headers=headers)
 
 @app.route('/')
 def index():
-    return render_template('index.html', html_content=HTML_TEMPLATE)
+    status, body, headers = handle_index(request.headers.get('Accept-Encoding', ''),
+                                         request.headers.get('If-None-Match', ''))
+    return app.response_class(body, status=status, headers=headers)
+
+def session_id():
+    """Conversation id kept in the signed Flask session cookie"""
+    sid = session.get('sid')
+    if sid is None:
+        sid = session['sid'] = secrets.token_urlsafe(12)
+    return sid
 
 @app.route('/chat', methods=['POST'])
-def chat():
-    data = request.get_json(force=True)
-    user_message = data.get('message', '').strip()
-    if not user_message:
-        return jsonify({"success": False, "error": "Message cannot be empty."}), 400
-    response = chatbot.generate_response(user_message)
-    logging.info(f"User: {user_message}")
-    logging.info(f"Bot: {response}")
-    return jsonify({"success": True, "response": response})
+@app.route('/t/<tenant>/chat', methods=['POST'])
+def chat(tenant=None):
+    status, body, headers = handle_chat(request.get_json(force=True), session_id(),
+                                        request.headers.get('Accept-Encoding', ''), g.bot)
+    return app.response_class(body, status=status, headers=headers, mimetype='application/json')
+
+@app.route('/chat/stream', methods=['POST'])
+@app.route('/t/<tenant>/chat/stream', methods=['POST'])
+def chat_stream(tenant=None):
+    status, body, headers = handle_chat_stream(request.get_json(force=True), session_id(), '', g.bot)
+    if status != 200:
+        return app.response_class(body, status=status, headers=headers, mimetype='application/json')
+    return app.response_class(body, headers=headers, mimetype='text/event-stream')
+
+@app.route('/chat/batch', methods=['POST'])
+@app.route('/t/<tenant>/chat/batch', methods=['POST'])
+def chat_batch(tenant=None):
+    status, body, headers = handle_chat_batch(request.get_json(force=True), None,
+                                              request.headers.get('Accept-Encoding', ''), g.bot)
+    return app.response_class(body, status=status, headers=headers, mimetype='application/json')
 
 @app.route('/clear', methods=['POST'])
-def clear_conversation():
-    logging.info("Conversation cleared by user.")
-    return jsonify({"success": True, "response": "Conversation cleared. Hello! I'm your ECO Matrix AI Assistant. How can I help you today?"})
+@app.route('/t/<tenant>/clear', methods=['POST'])
+def clear_conversation(tenant=None):
+    status, body, headers = handle_clear(request.get_json(force=True, silent=True), session.get('sid'), '', g.bot)
+    return app.response_class(body, status=status, headers=headers, mimetype='application/json')
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,181 @@
+"""Replay recorded chat traffic against the app and report latency.
+
+Reads a JSONL recording written by the server when CHAT_RECORD_PATH is set
+(one {"ts", "route", "session", "message"} object per line) and sends the
+same requests at the recorded pace, or scaled by --speed. By default the
+app runs in this process behind the Flask test client; --url sends real
+HTTP requests to a running server instead. Each recorded session replays
+with its own cookie, so follow-up questions see their conversation.
+
+    python replay.py traffic.jsonl                       # in-process, original pace
+    python replay.py traffic.jsonl --speed 10            # ten times faster
+    python replay.py traffic.jsonl --speed 0             # as fast as possible
+    python replay.py traffic.jsonl --url http://127.0.0.1:5000 --concurrency 32
+
+Run servers under test without rate limiting (CHAT_RATE_LIMIT unset or 0):
+all replayed requests come from one address.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from urllib.parse import urlsplit
+
+def load_recording(path, limit=None):
+    """Recorded requests sorted by time; lines that don't parse are skipped"""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and isinstance(entry.get('message'), str):
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry.get('ts', 0))
+    return entries[:limit] if limit else entries
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+class TestClientTarget:
+    """Sends requests to the app in this process through Flask test clients, one per session"""
+
+    def __init__(self):
+        # Recording the replay itself, or rate limiting it, would skew what we measure
+        os.environ['CHAT_RECORD_PATH'] = ''
+        os.environ.setdefault('CHAT_RATE_LIMIT', '0')
+        os.environ.setdefault('CHAT_KB_POLL_INTERVAL', '0')
+        import main
+        self.app = main.app
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def client(self, session):
+        if session is None:
+            return self.app.test_client()
+        with self.lock:
+            client = self.clients.get(session)
+            if client is None:
+                client = self.clients[session] = self.app.test_client()
+            return client
+
+    def send(self, route, session, body):
+        response = self.client(session).post(route, data=body, content_type='application/json')
+        # Drain streamed bodies so the whole answer is included in the timing
+        response.get_data()
+        return response.status_code
+
+class HTTPTarget:
+    """Sends requests to a running server, one keep-alive connection per worker thread"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.local = threading.local()
+        self.cookies = {}
+        self.lock = threading.Lock()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        return conn
+
+    def send(self, route, session, body):
+        headers = {'Content-Type': 'application/json'}
+        if session is not None:
+            with self.lock:
+                cookie = self.cookies.get(session)
+            if cookie:
+                headers['Cookie'] = cookie
+        conn = self.connection()
+        try:
+            conn.request('POST', route, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            raise
+        set_cookie = response.getheader('Set-Cookie')
+        if session is not None and set_cookie:
+            with self.lock:
+                self.cookies[session] = set_cookie.split(';', 1)[0]
+        return response.status
+
+def replay(entries, target, speed=1.0, concurrency=16):
+    """Send entries on their recorded schedule; returns per-request (status, latency, lag) results"""
+    results = []
+    lock = threading.Lock()
+
+    def send(entry, scheduled):
+        lag = time.perf_counter() - scheduled
+        started = time.perf_counter()
+        try:
+            status = target.send(entry.get('route', '/chat'), entry.get('session'),
+                                 json.dumps({"message": entry['message']}).encode('utf-8'))
+        except Exception:
+            status = None
+        latency = time.perf_counter() - started
+        with lock:
+            results.append((status, latency, lag))
+
+    first_ts = entries[0].get('ts', 0) if entries else 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        begin = time.perf_counter()
+        for entry in entries:
+            scheduled = begin + ((entry.get('ts', first_ts) - first_ts) / speed if speed > 0 else 0)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, entry, scheduled if speed > 0 else time.perf_counter())
+    return results, time.perf_counter() - begin
+
+def report(results, elapsed, recorded_span):
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(latency * 1000 for status, latency, _ in results)
+    lags = sorted(lag * 1000 for _, _, lag in results)
+    errors = sum(count for status, count in statuses.items() if status is None or status >= 400)
+    print(f"requests     {len(results)} in {elapsed:.2f}s (recorded over {recorded_span:.2f}s)")
+    print(f"throughput   {len(results) / elapsed if elapsed else 0:.1f} req/s")
+    print(f"errors       {errors}")
+    print("status       " + ', '.join(f"{status or 'failed'}: {count}" for status, count in
+                                      sorted(statuses.items(), key=lambda item: item[0] or 0)))
+    print("latency ms   " + '  '.join(f"{name} {percentile(latencies, fraction):.2f}" for name, fraction in
+                                      (('p50', 0.5), ('p90', 0.9), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))))
+    print(f"send lag ms  p50 {percentile(lags, 0.5):.2f}  p99 {percentile(lags, 0.99):.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording', nargs='?', default='traffic.jsonl', help='JSONL recording (default traffic.jsonl)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay rate relative to the recording; 0 sends as fast as possible (default 1)')
+    parser.add_argument('--url', help='base URL of a running server; the app is run in-process if omitted')
+    parser.add_argument('--concurrency', type=int, default=16, help='requests in flight at most (default 16)')
+    parser.add_argument('--limit', type=int, help='only replay the first N requests')
+    args = parser.parse_args(argv)
+
+    entries = load_recording(args.recording, args.limit)
+    if not entries:
+        print(f"No requests found in {args.recording}")
+        return 1
+    target = HTTPTarget(args.url) if args.url else TestClientTarget()
+    results, elapsed = replay(entries, target, args.speed, args.concurrency)
+    report(results, elapsed, entries[-1].get('ts', 0) - entries[0].get('ts', 0))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
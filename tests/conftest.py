@@ -0,0 +1,62 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+# The app is a flat set of modules at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class Clock:
+    """Stands in for main's time module: monotonic() only moves when advanced"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze main's monotonic clock; move it with clock.advance(seconds)"""
+    import main
+
+    fake = Clock()
+    monkeypatch.setattr(main, 'time', fake)
+    return fake
+
+@pytest.fixture
+def asgi():
+    """Send one HTTP request through asgi.app: asgi(method, path, body, headers) -> (status, headers, body)"""
+    import asgi as asgi_module
+
+    def call(method, path, body=b'', headers=(), client=('127.0.0.1', 50000)):
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            'client': client,
+        }
+        pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return pending.pop() if pending else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asgi_module.app(scope, receive, send))
+        start = sent[0]
+        response_headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in start['headers']}
+        return start['status'], response_headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+    return call
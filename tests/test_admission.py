@@ -0,0 +1,160 @@
+"""Admission control: size limits, per-client token buckets and load shedding."""
+import json
+import os
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+def post_json(client, path, data, **kwargs):
+    return client.post(path, data=json.dumps(data), content_type='application/json', **kwargs)
+
+def rejected(reason):
+    return main.METRICS.counters.get(('chat_rejected_total', f'reason="{reason}"'), 0)
+
+def test_oversized_body_gets_413(client):
+    response = post_json(client, '/chat', {"message": 'a' * main.CHAT_MAX_BODY_BYTES})
+    assert response.status_code == 413
+    assert response.data == main.BODY_TOO_LARGE_ERROR
+
+@pytest.mark.parametrize('declared', [True, False])
+def test_oversized_body_gets_413_over_asgi(asgi, declared):
+    body = json.dumps({"message": 'a' * main.CHAT_MAX_BODY_BYTES}).encode('utf-8')
+    headers = [('Content-Length', str(len(body)))] if declared else []
+    status, _, payload = asgi('POST', '/chat', body, headers)
+    assert status == 413
+    assert payload == main.BODY_TOO_LARGE_ERROR
+
+def test_long_message_gets_413(client):
+    response = post_json(client, '/chat', {"message": 'a' * (main.CHAT_MAX_MESSAGE_CHARS + 1)})
+    assert response.status_code == 413
+    assert response.data == main.MESSAGE_TOO_LONG_ERROR
+    assert post_json(client, '/chat', {"message": 'a' * main.CHAT_MAX_MESSAGE_CHARS}).status_code == 200
+
+def test_rate_limit_is_off_by_default():
+    limiter = main.RateLimiter(rate=0)
+    assert all(limiter.allow('client') == 0 for _ in range(1000))
+    assert len(limiter) == 0
+
+def test_bucket_refills_at_the_rate(clock):
+    limiter = main.RateLimiter(rate=2, burst=2)
+    assert limiter.allow('a') == 0
+    assert limiter.allow('a') == 0
+    assert limiter.allow('a') == pytest.approx(0.5)
+    clock.advance(0.5)
+    assert limiter.allow('a') == 0
+    clock.advance(60)
+    # Never more than burst saved up
+    assert [limiter.allow('a') for _ in range(3)][2] > 0
+
+def test_batch_leaves_the_bucket_in_debt(clock):
+    limiter = main.RateLimiter(rate=1, burst=5)
+    assert limiter.allow('a', cost=20) == 0
+    # 5 - 20 = -15 tokens: 16 seconds until the next whole one
+    assert limiter.allow('a') == pytest.approx(16)
+    clock.advance(15.5)
+    assert limiter.allow('a') == pytest.approx(0.5)
+    clock.advance(0.5)
+    assert limiter.allow('a') == 0
+
+def test_clients_are_dropped_least_recently_seen_first(clock):
+    limiter = main.RateLimiter(rate=1, burst=1, max_clients=2)
+    assert limiter.allow('a') == 0
+    assert limiter.allow('b') == 0
+    # A rejected request still counts as 'a' being seen
+    assert limiter.allow('a') > 0
+    assert limiter.allow('c') == 0
+    assert len(limiter) == 2
+    # 'b' was dropped, so it starts over with a full bucket
+    assert limiter.allow('b') == 0
+    assert limiter.allow('c') > 0
+
+def test_rate_limited_requests_get_429(client, clock, monkeypatch):
+    monkeypatch.setattr(main, 'rate_limiter', main.RateLimiter(rate=1, burst=1))
+    before = rejected('rate_limit')
+    assert post_json(client, '/chat', {"message": "hello"}).status_code == 200
+    response = post_json(client, '/chat', {"message": "hello"})
+    assert response.status_code == 429
+    assert response.data == main.TOO_MANY_REQUESTS_ERROR
+    assert response.headers['Retry-After'] == '1'
+    assert rejected('rate_limit') == before + 1
+
+def test_batch_costs_one_token_per_message(client, clock, monkeypatch):
+    monkeypatch.setattr(main, 'rate_limiter', main.RateLimiter(rate=1, burst=1))
+    assert post_json(client, '/chat/batch', {"messages": ["hi", "price", "bye", "email"]}).status_code == 200
+    response = post_json(client, '/chat', {"message": "hello"})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '4'
+    assert main.request_cost({"messages": ["a"] * (main.CHAT_BATCH_MAX_MESSAGES + 10)}) == main.CHAT_BATCH_MAX_MESSAGES
+    assert main.request_cost(None) == 1
+
+def test_clients_are_told_apart_by_the_configured_header(client, clock, monkeypatch):
+    monkeypatch.setattr(main, 'rate_limiter', main.RateLimiter(rate=1, burst=1))
+    monkeypatch.setattr(main, 'CHAT_CLIENT_HEADER', 'X-Real-IP')
+    assert post_json(client, '/chat', {"message": "hi"}, headers={'X-Real-IP': '10.0.0.1'}).status_code == 200
+    assert post_json(client, '/chat', {"message": "hi"}, headers={'X-Real-IP': '10.0.0.2'}).status_code == 200
+    assert post_json(client, '/chat', {"message": "hi"}, headers={'X-Real-IP': '10.0.0.1'}).status_code == 429
+
+def test_rate_limited_requests_get_429_over_asgi(asgi, clock, monkeypatch):
+    monkeypatch.setattr(main, 'rate_limiter', main.RateLimiter(rate=1, burst=1))
+    assert asgi('POST', '/chat/batch', b'{"messages": ["hi", "bye"]}')[0] == 200
+    status, headers, payload = asgi('POST', '/chat', b'{"message": "hi"}')
+    assert status == 429
+    assert headers['retry-after'] == '2'
+    assert payload == main.TOO_MANY_REQUESTS_ERROR
+    # Only chat routes are admitted
+    assert asgi('POST', '/clear', b'')[0] == 200
+
+def test_shedder_caps_requests_in_flight():
+    shedder = main.LoadShedder(max_in_flight=2, latency_ms=0)
+    assert shedder.enter() is None
+    assert shedder.enter() is None
+    assert shedder.enter() == 'in_flight'
+    shedder.exit(0.01)
+    assert shedder.enter() is None
+
+def test_shedder_sheds_a_growing_share_by_latency(monkeypatch):
+    shedder = main.LoadShedder(max_in_flight=0, latency_ms=10, alpha=1)
+    assert shedder.enter() is None
+    shedder.exit(0.015)
+    # 1.5 times the threshold: half of the requests are shed
+    monkeypatch.setattr(main.random, 'random', lambda: 0.4)
+    assert shedder.enter() == 'latency'
+    monkeypatch.setattr(main.random, 'random', lambda: 0.6)
+    assert shedder.enter() is None
+    shedder.exit(1.0)
+    # Far over the threshold, one request in ten still gets through
+    monkeypatch.setattr(main.random, 'random', lambda: 0.95)
+    assert shedder.enter() is None
+
+def test_overloaded_process_answers_503(client, monkeypatch):
+    shedder = main.LoadShedder(max_in_flight=1, latency_ms=0)
+    monkeypatch.setattr(main, 'load_shedder', shedder)
+    before = rejected('in_flight')
+    shedder.enter()
+    response = post_json(client, '/chat', {"message": "hi"})
+    assert response.status_code == 503
+    assert response.data == main.SERVER_BUSY_ERROR
+    assert response.headers['Retry-After'] == '1'
+    assert rejected('in_flight') == before + 1
+    shedder.exit(0.001)
+    assert post_json(client, '/chat', {"message": "hi"}).status_code == 200
+    # Admitted requests are released when they finish
+    assert shedder.in_flight == 0
+
+def test_overloaded_process_answers_503_over_asgi(asgi, monkeypatch):
+    shedder = main.LoadShedder(max_in_flight=1, latency_ms=0)
+    monkeypatch.setattr(main, 'load_shedder', shedder)
+    shedder.enter()
+    status, headers, _ = asgi('POST', '/chat', b'{"message": "hi"}')
+    assert (status, headers['retry-after']) == (503, '1')
+    shedder.exit(0.001)
+    assert asgi('POST', '/chat', b'{"message": "hi"}')[0] == 200
+    assert shedder.in_flight == 0
@@ -0,0 +1,107 @@
+"""ASGI app smoke test: every route through asgi.app with raw scopes, no server."""
+import asyncio
+import json
+import os
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import asgi as asgi_module
+import main
+
+def post(asgi, path, data, headers=()):
+    return asgi('POST', path, json.dumps(data).encode('utf-8'), list(headers))
+
+def session_cookie(headers):
+    cookie = headers['set-cookie']
+    assert cookie.startswith(asgi_module.SESSION_COOKIE + '=') and 'HttpOnly' in cookie
+    return cookie.split(';', 1)[0]
+
+def test_index(asgi):
+    status, headers, body = asgi('GET', '/')
+    assert status == 200
+    assert headers['content-type'] == 'text/html; charset=utf-8'
+    assert body == main.INDEX_PAGE.variants['identity']
+    assert asgi('POST', '/')[0] == 405
+
+def test_conversation_follows_the_cookie(asgi):
+    status, headers, body = post(asgi, '/chat', {"message": "What does it cost?"})
+    assert status == 200 and headers['content-type'] == 'application/json'
+    pricing = json.loads(body)['response']
+    cookie = session_cookie(headers)
+    status, headers, body = post(asgi, '/chat', {"message": "tell me more"}, [('Cookie', cookie)])
+    assert 'set-cookie' not in headers
+    assert json.loads(body)['response'] == pricing
+    # /clear forgets the conversation
+    status, _, body = post(asgi, '/clear', {}, [('Cookie', cookie)])
+    assert status == 200 and json.loads(body)['success'] is True
+    _, _, body = post(asgi, '/chat', {"message": "tell me more"}, [('Cookie', cookie)])
+    assert json.loads(body)['response'] != pricing
+
+def test_chat_errors(asgi):
+    assert asgi('POST', '/chat', b'{not json')[0] == 400
+    status, _, body = post(asgi, '/chat', {"message": "   "})
+    assert status == 400 and body == main.EMPTY_MESSAGE_ERROR
+    # /clear doesn't need a body
+    assert asgi('POST', '/clear', b'')[0] == 200
+
+def test_stream(asgi):
+    status, headers, body = post(asgi, '/chat/stream', {"message": "hi, what is your email and price?"})
+    assert status == 200 and headers['content-type'] == 'text/event-stream; charset=utf-8'
+    session_cookie(headers)
+    assert body.count(b'event: section\n') == 3
+    assert body.endswith(b'event: done\ndata: {"success": true}\n\n')
+
+def test_batch(asgi):
+    status, headers, body = post(asgi, '/chat/batch', {"messages": ["What does it cost?", ""]})
+    assert status == 200 and 'set-cookie' not in headers
+    results = json.loads(body)['results']
+    assert results[0] == json.loads(main.chatbot.resolve('What does it cost?')[1].payload)
+    assert results[1] == json.loads(main.EMPTY_MESSAGE_ERROR)
+
+def test_metrics_use_the_flask_route_labels(asgi):
+    post(asgi, '/chat', {"message": "hello"})
+    asgi('GET', '/nowhere')
+    status, headers, body = asgi('GET', '/metrics')
+    assert status == 200 and headers['content-type'] == main.METRICS_CONTENT_TYPE
+    assert b'chat_requests_total{route="/chat",status="200"}' in body
+    assert b'chat_requests_total{route="unmatched",status="404"}' in body
+
+@pytest.mark.parametrize('method, path, status', [
+    ('GET', '/nowhere', 404),
+    ('GET', '/chat', 405),
+    ('PUT', '/chat/batch', 405),
+    ('GET', '/static/../main.py', 404),
+    ('GET', '/static/missing.css', 404),
+    ('POST', '/t/acme', 404),
+])
+def test_unknown_routes(asgi, method, path, status):
+    assert asgi(method, path)[0] == status
+
+def test_client_going_away_gets_no_response():
+    sent = []
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/chat', 'headers': [], 'client': ('127.0.0.1', 1)}
+    asyncio.run(asgi_module.app(scope, receive, send))
+    assert sent == []
+
+def test_lifespan():
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_module.app({'type': 'lifespan'}, receive, send))
+    assert sent == [{'type': 'lifespan.startup.complete'}, {'type': 'lifespan.shutdown.complete'}]
@@ -0,0 +1,53 @@
+"""/chat/batch: one /chat result per message, in order, within the batch limits."""
+import json
+import os
+import random
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+MESSAGES = ['hello', 'What does it cost?', 'zzz qqq', 'Where are you located', 'What does it cost?',
+            'how do I email you', 'bye']
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+def test_results_match_chat_in_order(client):
+    random.seed(11)
+    response = client.post('/chat/batch', json={"messages": MESSAGES})
+    assert response.status_code == 200
+    results = json.loads(response.data)['results']
+    random.seed(11)
+    assert results == [json.loads(main.handle_chat({"message": message})[1]) for message in MESSAGES]
+
+def test_bad_messages_fail_alone():
+    long_message = 'a' * (main.CHAT_MAX_MESSAGE_CHARS + 1)
+    status, body, _ = main.handle_chat_batch({"messages": ['hello', '   ', 7, long_message, 'bye']})
+    assert status == 200
+    results = json.loads(body)['results']
+    assert results[1] == results[2] == json.loads(main.EMPTY_MESSAGE_ERROR)
+    assert results[3] == json.loads(main.MESSAGE_TOO_LONG_ERROR)
+    assert results[0]['success'] and results[4]['success']
+
+@pytest.mark.parametrize('data', [{}, {"messages": []}, {"messages": "hello"}, [], None])
+def test_batch_without_messages_gets_400(data):
+    status, body, _ = main.handle_chat_batch(data)
+    assert status == 400
+    assert json.loads(body) == {"success": False, "error": "Messages must be a non-empty list."}
+
+def test_too_many_messages_get_413(client, monkeypatch):
+    monkeypatch.setattr(main, 'CHAT_BATCH_MAX_MESSAGES', 3)
+    assert client.post('/chat/batch', json={"messages": ['hi'] * 3}).status_code == 200
+    response = client.post('/chat/batch', json={"messages": ['hi'] * 4})
+    assert response.status_code == 413
+    assert json.loads(response.data)['error'] == "At most 3 messages per batch."
+
+def test_large_batches_are_compressed(client):
+    response = client.post('/chat/batch', json={"messages": MESSAGES}, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
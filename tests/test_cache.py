@@ -0,0 +1,70 @@
+"""Response cache: LRU and TTL eviction, hit and miss counts, normalised keys."""
+import os
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+def counts():
+    return {name: main.METRICS.counters.get((f'chat_cache_{name}_total', ''), 0)
+            for name in ['hits', 'misses', 'evictions']}
+
+def counted(change):
+    """What change() added to the cache counters"""
+    before = counts()
+    change()
+    after = counts()
+    return {name: after[name] - before[name] for name in after}
+
+def test_least_recently_used_entry_is_evicted():
+    cache = main.ResponseCache(max_size=2, ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    assert counted(lambda: cache.put('c', 3)) == {'hits': 0, 'misses': 0, 'evictions': 1}
+    assert cache.keys() == ['a', 'c']
+    assert cache.get('b') is None
+    assert cache.stats() == {"size": 2, "max_size": 2}
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = main.ResponseCache(max_size=8, ttl=60)
+    cache.put('a', 1)
+    clock.advance(30)
+    cache.put('b', 2)
+    clock.advance(30)
+    assert cache.get('a') == 1
+    clock.advance(1)
+    assert cache.keys() == ['b']
+    assert counted(lambda: cache.get('a')) == {'hits': 0, 'misses': 1, 'evictions': 1}
+    assert cache.stats()["size"] == 1
+    # Hits don't extend the TTL; a new put does
+    cache.put('b', 3)
+    clock.advance(59)
+    assert cache.get('b') == 3
+
+def test_hits_and_misses_are_counted():
+    cache = main.ResponseCache(max_size=8, ttl=60)
+
+    def use():
+        cache.get('a')
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('a')
+
+    assert counted(use) == {'hits': 2, 'misses': 1, 'evictions': 0}
+
+def test_zero_size_disables_the_cache():
+    cache = main.ResponseCache(max_size=0)
+    cache.put('a', 1)
+    assert counted(lambda: cache.get('a')) == {'hits': 0, 'misses': 0, 'evictions': 0}
+    assert cache.keys() == []
+
+def test_equivalent_queries_share_one_entry():
+    bot = main.AdvancedChatbot(main.Knowledge.from_file(main.KNOWLEDGE_BASE_PATH))
+    queries = ['What does it cost?', 'what does it cost', '  WHAT   does it COST!!', 'What, does it cost?']
+    entries = []
+    changes = counted(lambda: entries.extend(bot.resolve(query) for query in queries))
+    assert changes == {'hits': 3, 'misses': 1, 'evictions': 0}
+    assert all(entry is entries[0] for entry in entries)
+    assert bot.response_cache.keys() == ['what does it cost']
@@ -0,0 +1,78 @@
+"""The trained intent classifier: persistence, bit layout and its place behind the keywords."""
+import os
+import zlib
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+np = pytest.importorskip('numpy')
+
+from test_intents import CORPUS
+
+DIMS = 4096
+
+def tiny_model():
+    """Predicts pricing for queries with "much" and contact for ones with "reach";
+    its first intent isn't in the knowledge base"""
+    intents = ['retired', 'pricing', 'contact']
+    weights = np.zeros((DIMS, len(intents)), dtype=np.float32)
+    for word, column in [('much', 1), ('reach', 2)]:
+        weights[zlib.crc32(('w:' + word).encode('utf-8')) % DIMS, column] = 200
+    return main.IntentClassifier(intents, weights, bias=[-10, -10, -10], thresholds=[0.5, 0.5, 0.9])
+
+@pytest.fixture
+def knowledge(monkeypatch):
+    monkeypatch.setattr(main, 'INTENT_MODEL', tiny_model())
+    return main.Knowledge.from_file(main.KNOWLEDGE_BASE_PATH)
+
+def test_save_and_load_round_trip(tmp_path):
+    model = tiny_model()
+    path = str(tmp_path / 'intent_model.npz')
+    model.save(path)
+    loaded = main.IntentClassifier.load(path)
+    assert loaded.intents == model.intents and loaded.dims == DIMS
+    for name in ['weights', 'bias', 'thresholds']:
+        assert np.array_equal(getattr(loaded, name), getattr(model, name))
+    token_lists = [['how', 'much', 'is', 'it'], ['reach', 'you'], []]
+    assert loaded.masks(token_lists) == model.masks(token_lists) == [0b10, 0b100, 0]
+    assert main.load_intent_model(path).intents == model.intents
+
+def test_unreadable_model_is_ignored(tmp_path):
+    path = tmp_path / 'intent_model.npz'
+    path.write_bytes(b'not a model')
+    assert main.load_intent_model(str(path)) is None
+    assert main.load_intent_model(str(tmp_path / 'missing.npz')) is None
+
+def test_bind_answers_in_the_matchers_bit_order():
+    matcher = main.chatbot.knowledge.intent_matcher
+    bound = tiny_model().bind(matcher.intents)
+    assert bound.intents == ['pricing', 'contact']
+    assert bound.bits == [matcher.mask_for(['pricing']), matcher.mask_for(['contact'])]
+    assert bound.masks([['how', 'much', 'is', 'it']]) == [matcher.mask_for(['pricing'])]
+
+def test_classifier_only_sees_queries_without_keywords(knowledge, monkeypatch):
+    asked = []
+    masks = knowledge.classifier.masks
+    monkeypatch.setattr(knowledge.classifier, 'masks', lambda token_lists: asked.extend(token_lists) or masks(token_lists))
+    token_lists = [['what', 'is', 'the', 'price'], ['how', 'much', 'is', 'it'], ['how', 'much', 'to', 'email', 'you']]
+    matcher = knowledge.intent_matcher
+    assert knowledge.intent_masks(token_lists) == [matcher.mask_for(['pricing']), matcher.mask_for(['pricing']),
+                                                   matcher.mask_for(['contact'])]
+    assert asked == [['how', 'much', 'is', 'it']]
+
+def test_keyword_hits_are_unchanged_with_a_model_loaded(knowledge):
+    plain = main.chatbot.knowledge
+    for entry in CORPUS:
+        tokens = plain.spelling.correct_tokens(main.chatbot.tokenize(entry['query']))
+        keyword_mask = plain.intent_masks([tokens])[0]
+        if keyword_mask:
+            assert knowledge.intent_masks([tokens]) == [keyword_mask], entry['query']
+
+def test_paraphrases_are_answered(knowledge):
+    bot = main.AdvancedChatbot(knowledge)
+    assert bot.extract_intent('how much is it') == ['pricing']
+    assert main.chatbot.extract_intent('how much is it') == ['general']
@@ -0,0 +1,233 @@
+"""Singleflight: concurrent identical computations run once."""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+def coalesced():
+    return main.METRICS.counters.get(('chat_coalesced_total', ''), 0)
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+class SlowCall:
+    """A computation that blocks until released, counting its calls"""
+
+    def __init__(self, result='leader', error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def test_waiters_get_the_leaders_result():
+    flight = main.SingleFlight(timeout=5)
+    slow = SlowCall(result=object())
+    results = []
+    before = coalesced()
+    threads = run_threads([lambda: results.append(flight.do('key', slow))])
+    assert slow.started.wait(5)
+    threads += run_threads([lambda: results.append(flight.do('key', slow))] * 8)
+    wait_until(lambda: coalesced() == before + 8)
+    slow.release.set()
+    for thread in threads:
+        thread.join()
+    assert slow.calls == 1
+    assert len(results) == 9 and all(result is slow.result for result in results)
+    # The call is forgotten once done
+    assert flight.do('key', lambda: 'again') == 'again'
+
+def test_other_keys_are_not_held_up():
+    flight = main.SingleFlight(timeout=5)
+    slow = SlowCall()
+    threads = run_threads([lambda: flight.do('slow', slow)])
+    assert slow.started.wait(5)
+    assert flight.do('fast', lambda: 'fast') == 'fast'
+    slow.release.set()
+    threads[0].join()
+
+def test_waiter_computes_itself_after_the_timeout():
+    flight = main.SingleFlight(timeout=5)
+    slow = SlowCall()
+    threads = run_threads([lambda: flight.do('key', slow)])
+    assert slow.started.wait(5)
+    started = time.monotonic()
+    assert flight.do('key', lambda: 'waiter', timeout=0.05) == 'waiter'
+    assert 0.05 <= time.monotonic() - started < 2
+    slow.release.set()
+    threads[0].join()
+
+def test_waiters_compute_themselves_when_the_leader_fails():
+    flight = main.SingleFlight(timeout=5)
+    slow = SlowCall(error=RuntimeError('leader failed'))
+    errors = []
+    results = []
+
+    def lead():
+        try:
+            flight.do('key', slow)
+        except RuntimeError as e:
+            errors.append(e)
+
+    before = coalesced()
+    threads = run_threads([lead])
+    assert slow.started.wait(5)
+    threads += run_threads([lambda: results.append(flight.do('key', lambda: 'waiter'))] * 3)
+    wait_until(lambda: coalesced() == before + 3)
+    slow.release.set()
+    for thread in threads:
+        thread.join()
+    assert [str(e) for e in errors] == ['leader failed']
+    assert results == ['waiter'] * 3
+
+def test_identical_queries_are_answered_once():
+    bot = main.AdvancedChatbot(main.Knowledge.from_file(main.KNOWLEDGE_BASE_PATH))
+    compute_entry = bot.compute_entry
+    calls = []
+
+    def slow_compute_entry(*args):
+        calls.append(args[1])
+        time.sleep(0.2)
+        return compute_entry(*args)
+
+    bot.compute_entry = slow_compute_entry
+    answers = []
+    threads = run_threads([lambda: answers.append(bot.resolve('What does it cost?'))] * 8)
+    for thread in threads:
+        thread.join()
+    assert calls == ['what does it cost']
+    assert len({id(plan) for _, plan in answers}) == 1
+
+def test_async_waiters_get_the_leaders_result():
+    flight = main.AsyncSingleFlight(timeout=5)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return object()
+
+    async def run():
+        return await asyncio.gather(*(flight.do('key', slow) for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight._calls == {}
+
+def test_async_waiter_computes_itself_after_the_timeout():
+    flight = main.AsyncSingleFlight(timeout=5)
+
+    async def slow():
+        await asyncio.sleep(1)
+        return 'leader'
+
+    async def fast():
+        return 'waiter'
+
+    async def run():
+        leader = asyncio.create_task(flight.do('key', slow))
+        await asyncio.sleep(0)
+        waiter = await flight.do('key', fast, timeout=0.01)
+        leader.cancel()
+        return waiter
+
+    assert asyncio.run(run()) == 'waiter'
+
+def test_async_waiters_compute_themselves_when_the_leader_fails():
+    flight = main.AsyncSingleFlight(timeout=5)
+
+    async def failing():
+        await asyncio.sleep(0.02)
+        raise RuntimeError('leader failed')
+
+    async def own():
+        return 'waiter'
+
+    async def run():
+        leader = asyncio.create_task(flight.do('key', failing))
+        await asyncio.sleep(0)
+        waiters = [flight.do('key', own) for _ in range(3)]
+        return await asyncio.gather(leader, *waiters, return_exceptions=True)
+
+    leader, *waiters = asyncio.run(run())
+    assert isinstance(leader, RuntimeError)
+    assert waiters == ['waiter'] * 3
+
+def test_cancelled_async_waiter_leaves_the_leader_running():
+    flight = main.AsyncSingleFlight(timeout=5)
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return 'leader'
+
+    async def run():
+        leader = asyncio.create_task(flight.do('key', slow))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do('key', slow))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(run()) == 'leader'
+
+def test_identical_asgi_batches_share_one_computation(monkeypatch):
+    import asgi
+
+    calls = []
+    plan_responses = main.chatbot.plan_responses
+
+    def slow_plan_responses(queries, knowledge=None):
+        calls.append(queries)
+        time.sleep(0.2)
+        return plan_responses(queries, knowledge)
+
+    monkeypatch.setattr(main.chatbot, 'plan_responses', slow_plan_responses)
+    body = b'{"messages": ["hi", "what does it cost"]}'
+
+    async def request():
+        scope = {'type': 'http', 'method': 'POST', 'path': '/chat/batch', 'headers': [], 'client': ('127.0.0.1', 1)}
+        pending = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            return pending.pop() if pending else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi.app(scope, receive, send)
+        return sent[0]['status'], sent[1]['body']
+
+    async def run():
+        return await asyncio.gather(*(request() for _ in range(4)))
+
+    responses = asyncio.run(run())
+    assert len(calls) == 1
+    assert len(set(responses)) == 1 and responses[0][0] == 200
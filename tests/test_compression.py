@@ -0,0 +1,90 @@
+"""/chat Content-Encoding negotiation: compressed when large enough and accepted."""
+import gzip
+import json
+import os
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+BEST = 'br' if main.brotli is not None else 'gzip'
+
+FIXED = 'What does it cost, and how do I email you?'
+VARIED = 'hi, what is your email and price?'
+SMALL = 'Where are you located'
+
+def decoded(body, coding):
+    if coding == 'gzip':
+        return gzip.decompress(body)
+    if coding == 'br':
+        return main.brotli.decompress(body)
+    return body
+
+@pytest.mark.parametrize('accept_encoding, size, coding', [
+    ('gzip, br', main.CHAT_COMPRESS_MIN_BYTES, BEST),
+    ('gzip, br', main.CHAT_COMPRESS_MIN_BYTES - 1, 'identity'),
+    ('', 10 ** 6, 'identity'),
+    ('gzip', 10 ** 6, 'gzip'),
+    ('br;q=0, gzip;q=0.5', 10 ** 6, 'gzip'),
+    ('gzip;q=0, deflate', 10 ** 6, 'identity'),
+    ('identity', 10 ** 6, 'identity'),
+    ('*', 10 ** 6, BEST),
+    ('GZIP', 10 ** 6, 'gzip'),
+])
+def test_pick_encoding(accept_encoding, size, coding):
+    assert main.pick_encoding(accept_encoding, size) == coding
+
+def test_brotli_is_skipped_without_the_package(monkeypatch):
+    monkeypatch.setattr(main, 'brotli', None)
+    assert main.pick_encoding('br', 10 ** 6) == 'identity'
+    assert main.pick_encoding('br, gzip', 10 ** 6) == 'gzip'
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+@pytest.mark.parametrize('query', [FIXED, VARIED])
+@pytest.mark.parametrize('accept_encoding', ['gzip', 'br', 'gzip, br'])
+def test_large_answers_are_compressed(client, query, accept_encoding):
+    response = client.post('/chat', json={"message": query}, headers={'Accept-Encoding': accept_encoding})
+    coding = response.headers.get('Content-Encoding')
+    assert coding == main.pick_encoding(accept_encoding, main.CHAT_COMPRESS_MIN_BYTES)
+    assert 'Accept-Encoding' in response.vary
+    body = decoded(response.data, coding)
+    assert len(body) >= main.CHAT_COMPRESS_MIN_BYTES and len(response.data) < len(body)
+    assert json.loads(body)['success'] is True
+
+def test_small_answers_are_sent_as_they_are(client):
+    response = client.post('/chat', json={"message": SMALL}, headers={'Accept-Encoding': 'gzip, br'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+    assert len(response.data) < main.CHAT_COMPRESS_MIN_BYTES
+    assert json.loads(response.data)['success'] is True
+
+def test_fixed_answers_are_compressed_once(monkeypatch):
+    _, plan = main.chatbot.resolve(FIXED)
+    assert plan.payload is not None
+    first, headers = plan.chat_body('gzip')
+    assert headers == {'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'}
+    monkeypatch.setattr(main, 'compress', lambda body, coding: pytest.fail('compressed again'))
+    again, _ = plan.chat_body('gzip')
+    assert again is first
+    assert gzip.decompress(first) == plan.payload
+
+def test_varied_answers_are_compressed_each_time():
+    _, plan = main.chatbot.resolve(VARIED)
+    assert plan.payload is None
+    body, headers = plan.chat_body('gzip')
+    assert headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(body))['response'] in [plan.render() for _ in range(50)]
+
+def test_chat_is_compressed_over_asgi(asgi):
+    status, headers, body = asgi('POST', '/chat', json.dumps({"message": FIXED}).encode('utf-8'),
+                                 [('Accept-Encoding', 'gzip')])
+    assert status == 200
+    assert headers['content-encoding'] == 'gzip' and headers['vary'] == 'Accept-Encoding'
+    assert headers['content-length'] == str(len(body))
+    assert json.loads(gzip.decompress(body))['success'] is True
@@ -0,0 +1,74 @@
+"""Conversation memory: packed turns per session within a memory budget."""
+import os
+import zlib
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+VERSION = ('v', 1)
+
+def store_for(sessions, **kwargs):
+    """A store whose memory budget holds that many full sessions"""
+    probe = main.ConversationStore(**kwargs)
+    store = main.ConversationStore(max_bytes=probe.session_bytes() * sessions, **kwargs)
+    assert store.max_sessions == sessions
+    return store
+
+def test_turns_are_packed_masks_and_checksums():
+    store = main.ConversationStore()
+    store.record('s', 0b101, 'What does it cost?', VERSION)
+    turn, = store.turns('s', VERSION)
+    assert turn >> 32 == 0b101
+    assert turn & 0xFFFFFFFF == zlib.crc32(b'What does it cost?')
+
+def test_budget_evicts_least_recently_used_sessions(clock):
+    store = store_for(3)
+    for session in ['a', 'b', 'c']:
+        store.record(session, 1, 'hi', VERSION)
+        clock.advance(1)
+    store.record('a', 2, 'again', VERSION)
+    store.record('d', 1, 'hi', VERSION)
+    assert len(store) == 3
+    assert store.turns('b', VERSION) == ()
+    assert [len(store.turns(session, VERSION)) for session in ['a', 'c', 'd']] == [2, 1, 1]
+
+def test_budget_covers_at_least_one_session():
+    assert main.ConversationStore(max_bytes=0).max_sessions == 1
+
+def test_idle_sessions_expire(clock):
+    store = main.ConversationStore(idle_ttl=60)
+    store.record('old', 0b10, 'hi', VERSION)
+    clock.advance(59)
+    assert store.context_mask('old', VERSION) == 0b10
+    store.record('new', 0b10, 'hi', VERSION)
+    clock.advance(1)
+    # Expired turns are never read, and are dropped on the next write
+    assert store.context_mask('old', VERSION) == 0
+    assert len(store) == 2
+    store.record('new', 0b10, 'hi', VERSION)
+    assert len(store) == 1
+
+def test_clear_forgets_the_session():
+    store = main.ConversationStore()
+    store.record('a', 0b10, 'hi', VERSION)
+    store.record('b', 0b10, 'hi', VERSION)
+    store.clear('a')
+    store.clear('unknown')
+    assert store.turns('a', VERSION) == ()
+    assert store.context_mask('b', VERSION) == 0b10
+
+def test_only_the_last_turns_are_kept():
+    store = main.ConversationStore(max_turns=3)
+    for mask in range(1, 6):
+        store.record('s', mask, f'message {mask}', VERSION)
+    assert [turn >> 32 for turn in store.turns('s', VERSION)] == [3, 4, 5]
+
+def test_context_skips_turns_with_only_skipped_intents():
+    store = main.ConversationStore()
+    store.record('s', 0b100, 'pricing', VERSION)
+    store.record('s', 0b001, 'thanks', VERSION)
+    store.record('s', 0, 'tell me more', VERSION)
+    assert store.context_mask('s', VERSION) == 0b001
+    assert store.context_mask('s', VERSION, skip_mask=0b001) == 0b100
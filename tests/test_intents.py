@@ -0,0 +1,49 @@
+"""Intent detection against the original substring matcher's results.
+
+intent_corpus.jsonl holds queries with the intents the app detects today.
+Entries where that differs from the original substring matcher also carry
+its result ("baseline") and the reason ("note"): a keyword that only
+occurred inside another word ("hi" in "which"), or an inflected keyword the
+substring scan couldn't see.
+"""
+import json
+import os
+
+import pytest
+
+# Keyword matching only: a trained model in the working tree would change the answers
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_corpus.jsonl')
+
+with open(CORPUS_PATH, encoding='utf-8') as f:
+    CORPUS = [json.loads(line) for line in f]
+
+def test_corpus_matches():
+    mismatches = [(entry['query'], entry['intents'], main.chatbot.extract_intent(entry['query']))
+                  for entry in CORPUS if main.chatbot.extract_intent(entry['query']) != entry['intents']]
+    assert mismatches == []
+
+def test_corpus_differences_are_explained():
+    for entry in CORPUS:
+        if 'baseline' in entry:
+            assert entry['baseline'] != entry['intents']
+            assert entry['note'].startswith(('keyword only inside another word', 'inflected keyword'))
+
+@pytest.mark.parametrize('query, intent', [
+    ('Is it costly?', 'pricing'),
+    ('I emailed you yesterday', 'contact'),
+    ('I am contacting you about pricing', 'contact'),
+    ('What are your prices?', 'pricing'),
+    ('compared with spreadsheets', 'comparison'),
+    ('energy efficiencies', 'energy'),
+])
+def test_inflected_keywords(query, intent):
+    assert intent in main.chatbot.extract_intent(query)
+
+@pytest.mark.parametrize('query', ['which one', 'his history', 'this is hilarious', 'high performance'])
+def test_keywords_inside_other_words(query):
+    assert 'greeting' not in main.chatbot.extract_intent(query)
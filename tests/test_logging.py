@@ -0,0 +1,97 @@
+"""Request logging: one sampled record per request, queued and written in batches."""
+import io
+import json
+import logging
+import os
+import queue
+import time
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+def make_record(msg, **fields):
+    record = logging.LogRecord('chat.requests', logging.INFO, __file__, 0, msg, None, None)
+    record.fields = fields
+    return record
+
+class CountingStream(io.StringIO):
+    writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+@pytest.fixture
+def dropped(monkeypatch):
+    monkeypatch.setattr(main.DroppingQueueHandler, 'dropped', 0)
+
+def test_full_queue_drops_records_without_blocking(dropped):
+    handler = main.DroppingQueueHandler(queue.Queue(2))
+    started = time.monotonic()
+    for i in range(5):
+        handler.handle(make_record(f'record {i}'))
+    assert time.monotonic() - started < 1
+    assert handler.queue.qsize() == 2
+    assert main.DroppingQueueHandler.dropped == 3
+    # Records are queued as they are, to be formatted by the writer thread
+    assert handler.queue.get_nowait().msg == 'record 0'
+
+def test_writer_writes_in_batches(dropped):
+    log_queue = queue.Queue()
+    for i in range(5):
+        log_queue.put(make_record(f'record {i}', n=i))
+    stream = CountingStream()
+    writer = main.BatchingLogWriter(log_queue, stream, main.JSONFormatter(), batch_size=2, flush_interval=0.01)
+    writer.start()
+    writer.stop()
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line['msg'], line['n'], line['logger']) for line in lines] == [(f'record {i}', i, 'chat.requests') for i in range(5)]
+    assert stream.writes == 3
+
+def test_writer_reports_dropped_records(dropped):
+    stream = io.StringIO()
+    writer = main.BatchingLogWriter(queue.Queue(), stream, main.JSONFormatter())
+    main.DroppingQueueHandler.dropped = 3
+    writer._write([make_record('kept')])
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line['msg'] for line in lines] == ['kept', 'Dropped 3 log records (queue full)']
+    assert lines[1]['level'] == 'WARNING'
+    assert main.DroppingQueueHandler.dropped == 0
+
+def test_unformattable_record_is_replaced():
+    stream = io.StringIO()
+    writer = main.BatchingLogWriter(queue.Queue(), stream, main.JSONFormatter())
+    writer._write([logging.LogRecord('chat', logging.INFO, __file__, 0, '%d', ('x',), None)])
+    assert json.loads(stream.getvalue())['level'] == 'ERROR'
+
+@pytest.fixture
+def logged(monkeypatch):
+    """Events log_request passes on to the request logger"""
+    events = []
+    monkeypatch.setattr(main.REQUEST_LOG, 'info', lambda event, extra: events.append((event, extra['fields'])))
+    return events
+
+def test_requests_are_sampled(logged, monkeypatch):
+    monkeypatch.setattr(main, 'CHAT_LOG_SAMPLE_RATE', 0.25)
+    draws = iter([0.1, 0.3, 0.24, 0.9])
+    monkeypatch.setattr(main.random, 'random', lambda: next(draws))
+    for i in range(4):
+        main.log_request('chat', time.perf_counter(), n=i)
+    assert [fields['n'] for _, fields in logged] == [0, 2]
+
+def test_every_request_is_logged_by_default(logged, monkeypatch):
+    monkeypatch.setattr(main.random, 'random', lambda: pytest.fail('sampled at rate 1.0'))
+    main.log_request('chat', time.perf_counter() - 0.5, status=200)
+    (event, fields), = logged
+    assert event == 'chat' and fields['status'] == 200 and fields['latency_ms'] >= 500
+
+def test_clear_latency_covers_the_whole_request(logged, monkeypatch):
+    monkeypatch.setattr(main.conversations, 'clear', lambda key: time.sleep(0.05))
+    status, _, _ = main.handle_clear({}, 'session')
+    assert status == 200
+    (event, fields), = logged
+    assert event == 'clear' and fields['latency_ms'] >= 50
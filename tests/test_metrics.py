@@ -0,0 +1,109 @@
+"""Metrics: Prometheus exposition and merging the snapshots of several processes."""
+import json
+import os
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+BUCKETS = len(main.LATENCY_BUCKETS)
+
+def test_exposition_format():
+    metrics = main.Metrics(directory=None)
+    metrics.inc('chat_requests_total', 'route="/chat",status="200"', 3)
+    metrics.inc('chat_fallback_total')
+    metrics.observe('chat_request_duration_seconds', 'route="/chat"', 0.003)
+    metrics.observe('chat_request_duration_seconds', 'route="/chat"', 2.0)
+    metrics.collectors.append(lambda intent_masks: [('chat_cache_entries', '', 7)])
+    lines = metrics.render().splitlines()
+    assert lines[:3] == [
+        '# HELP chat_request_duration_seconds Time to answer an HTTP request, by route.',
+        '# TYPE chat_request_duration_seconds histogram',
+        'chat_request_duration_seconds_bucket{route="/chat",le="1e-05"} 0',
+    ]
+    assert 'chat_request_duration_seconds_bucket{route="/chat",le="0.0025"} 0' in lines
+    assert 'chat_request_duration_seconds_bucket{route="/chat",le="0.005"} 1' in lines
+    assert 'chat_request_duration_seconds_bucket{route="/chat",le="1.0"} 1' in lines
+    assert 'chat_request_duration_seconds_bucket{route="/chat",le="+Inf"} 2' in lines
+    assert 'chat_request_duration_seconds_sum{route="/chat"} 2.003' in lines
+    assert 'chat_request_duration_seconds_count{route="/chat"} 2' in lines
+    assert 'chat_requests_total{route="/chat",status="200"} 3' in lines
+    assert lines[lines.index('# TYPE chat_fallback_total counter') + 1] == 'chat_fallback_total 1'
+    assert lines[lines.index('# TYPE chat_cache_entries gauge') + 1] == 'chat_cache_entries 7'
+    # Metrics with nothing recorded are left out
+    assert not any('chat_cache_hits_total' in line for line in lines)
+
+def test_metrics_endpoint():
+    client = main.app.test_client()
+    client.post('/chat', json={"message": "hello"})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type == main.METRICS_CONTENT_TYPE
+    assert b'# TYPE chat_requests_total counter' in response.data
+    assert b'chat_requests_total{route="/chat",status="200"} ' in response.data
+
+def snapshot(counter, gauge, bucket):
+    """A process snapshot with one counter, one gauge and one histogram observation"""
+    counts = [0] * (BUCKETS + 3)
+    counts[bucket] = 1
+    counts[-2] = main.LATENCY_BUCKETS[bucket]
+    counts[-1] = 1
+    return {'samples': {'chat_fallback_total': {'': counter}, 'chat_conversations': {'': gauge}},
+            'histograms': {'chat_stage_duration_seconds': {'stage="match"': counts}}}
+
+def write_snapshot(directory, name, data):
+    with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+        json.dump(data, f)
+
+@pytest.fixture
+def shared(tmp_path):
+    write_snapshot(str(tmp_path), 101, snapshot(2, 5, 0))
+    write_snapshot(str(tmp_path), 102, snapshot(3, 7, 1))
+    return main.Metrics(directory=str(tmp_path))
+
+def test_processes_are_merged(shared):
+    shared.inc('chat_fallback_total')
+    merged = shared.collect()
+    assert merged['samples']['chat_fallback_total'] == {'': 6}
+    # Gauges of live processes add up too: entries held server-wide
+    assert merged['samples']['chat_conversations'] == {'': 12}
+    counts = merged['histograms']['chat_stage_duration_seconds']['stage="match"']
+    assert counts[:2] == [1, 1] and counts[-1] == 2
+    assert 'chat_fallback_total 6' in shared.render().splitlines()
+
+def test_exited_processes_are_archived(shared, tmp_path):
+    shared.archive_process(101)
+    shared.archive_process(102)
+    assert sorted(os.listdir(tmp_path)) == ['archive.json']
+    merged = shared.collect()
+    # Counters and histograms survive the process; its gauges don't
+    assert merged['samples']['chat_fallback_total'] == {'': 5}
+    assert 'chat_conversations' not in merged['samples']
+    assert merged['histograms']['chat_stage_duration_seconds']['stage="match"'][-1] == 2
+    shared.clear_directory()
+    assert os.listdir(tmp_path) == []
+
+def test_unreadable_snapshots_are_skipped(shared, tmp_path):
+    (tmp_path / '103.json').write_text('{"samples": ')
+    assert shared.collect()['samples']['chat_fallback_total'] == {'': 5}
+
+def test_snapshots_are_written_at_most_every_interval(tmp_path, clock):
+    metrics = main.Metrics(directory=str(tmp_path), flush_interval=5)
+    path = tmp_path / f'{os.getpid()}.json'
+    metrics.inc('chat_fallback_total')
+    assert not path.exists()
+    clock.advance(5)
+    metrics.inc('chat_fallback_total')
+    assert json.loads(path.read_text())['samples']['chat_fallback_total'] == {'': 2}
+    metrics.inc('chat_fallback_total')
+    assert json.loads(path.read_text())['samples']['chat_fallback_total'] == {'': 2}
+
+def test_forked_process_starts_from_zero():
+    metrics = main.Metrics(directory=None)
+    metrics.inc('chat_fallback_total')
+    metrics.pid = -1
+    metrics.inc('chat_fallback_total')
+    assert metrics.counters == {('chat_fallback_total', ''): 1}
@@ -0,0 +1,134 @@
+"""Traffic recording and replay: anonymised, per-session sampled JSONL, replayed in-process."""
+import json
+import logging
+import os
+import queue
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+import replay
+
+@pytest.mark.parametrize('message, expected', [
+    ('mail me at jane.doe+chat@example.co.uk please', 'mail me at ' + 'x' * len('jane.doe+chat@example.co.uk') + ' please'),
+    ('call +351 912 345 678 today', 'call +000 000 000 000 today'),
+    ('or (555) 123-4567', 'or (000) 000-0000'),
+    ('two: a@b.io, 555.123.4567', 'two: xxxxxx, 000.000.0000'),
+    ('pricing for 2024 and version 1.2', 'pricing for 2024 and version 1.2'),
+    ('', ''),
+])
+def test_anonymise(message, expected):
+    assert main.anonymise(message) == expected
+    assert len(main.anonymise(message)) == len(message)
+
+@pytest.fixture
+def recording(tmp_path):
+    return str(tmp_path / 'traffic.jsonl')
+
+def recorded(recorder):
+    recorder.start()
+    recorder.stop()
+    recorder.stream.close()
+    with open(recorder.stream.name, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_requests_are_recorded_anonymised(recording):
+    recorder = main.TrafficRecorder(recording, sample_rate=1.0, salt='salt')
+    recorder.record('/chat', 'my email is a@b.io', 'session-1')
+    recorder.record('/chat/stream', 'tell me more', 'session-1')
+    recorder.record('/t/acme/chat', 'hi', None)
+    entries = recorded(recorder)
+    assert [(entry['route'], entry['message']) for entry in entries] == [
+        ('/chat', 'my email is xxxxxx'), ('/chat/stream', 'tell me more'), ('/t/acme/chat', 'hi')]
+    assert entries[0]['session'] == entries[1]['session'] != 'session-1'
+    assert len(entries[0]['session']) == 16
+    assert entries[2]['session'] is None
+    assert all(isinstance(entry['ts'], float) for entry in entries)
+
+def test_session_hashes_depend_on_the_salt(recording):
+    hashes = []
+    for salt in ['one', 'one', 'two']:
+        recorder = main.TrafficRecorder(recording, salt=salt)
+        recorder.record('/chat', 'hi', 'session-1')
+        hashes.append(recorder.queue.get_nowait()['session'])
+        recorder.stream.close()
+    assert hashes[0] == hashes[1] != hashes[2]
+
+def test_sampling_keeps_conversations_whole(recording):
+    recorder = main.TrafficRecorder(recording, sample_rate=0.5, salt='salt')
+    for turn in range(3):
+        for session in range(200):
+            recorder.record('/chat', f'turn {turn}', f'session-{session}')
+    entries = recorded(recorder)
+    turns = {}
+    for entry in entries:
+        turns.setdefault(entry['session'], []).append(entry['message'])
+    assert 60 < len(turns) < 140
+    assert all(messages == ['turn 0', 'turn 1', 'turn 2'] for messages in turns.values())
+
+def test_requests_without_a_session_are_sampled_one_by_one(recording, monkeypatch):
+    recorder = main.TrafficRecorder(recording, sample_rate=0.5)
+    draws = iter([0.2, 0.7, 0.49])
+    monkeypatch.setattr(main.random, 'random', lambda: next(draws))
+    for message in ['a', 'b', 'c']:
+        recorder.record('/chat', message)
+    assert [entry['message'] for entry in recorded(recorder)] == ['a', 'c']
+
+def test_full_queue_drops_requests(recording, caplog):
+    recorder = main.TrafficRecorder(recording)
+    recorder.queue = queue.Queue(1)
+    for message in ['a', 'b', 'c']:
+        recorder.record('/chat', message, 's')
+    assert recorder.dropped == 2
+    with caplog.at_level(logging.WARNING):
+        assert [entry['message'] for entry in recorded(recorder)] == ['a']
+    assert 'Traffic recorder dropped 2 requests (queue full)' in caplog.messages
+    assert recorder.dropped == 0
+
+def test_chat_requests_are_recorded(recording, monkeypatch):
+    recorder = main.TrafficRecorder(recording, salt='salt')
+    monkeypatch.setattr(main, 'TRAFFIC_RECORDER', recorder)
+    main.handle_chat({"message": "What does it cost?"}, 'session-1')
+    main.handle_chat({"message": ""}, 'session-1')
+    entry, = recorded(recorder)
+    assert entry['route'] == '/chat' and entry['message'] == 'What does it cost?'
+
+@pytest.mark.parametrize('values, fraction, expected', [
+    ([15, 20, 35, 40, 50], 0.05, 15),
+    ([15, 20, 35, 40, 50], 0.3, 20),
+    ([15, 20, 35, 40, 50], 0.4, 20),
+    ([15, 20, 35, 40, 50], 0.5, 35),
+    ([15, 20, 35, 40, 50], 1.0, 50),
+    (list(range(1, 101)), 0.99, 99),
+    (list(range(1, 101)), 0.95, 95),
+    (list(range(1, 11)), 0.9, 9),
+    (list(range(1, 11)), 0.0, 1),
+    ([7], 0.5, 7),
+    ([], 0.5, 0.0),
+])
+def test_nearest_rank_percentile(values, fraction, expected):
+    assert replay.percentile(values, fraction) == expected
+
+def test_recordings_load_in_time_order(recording):
+    with open(recording, 'w', encoding='utf-8') as f:
+        f.write('{"ts": 3, "route": "/chat", "session": null, "message": "third"}\n')
+        f.write('not json\n')
+        f.write('{"ts": 1, "route": "/chat", "session": null, "message": "first"}\n')
+        f.write('{"ts": 2, "message": 42}\n')
+        f.write('[]\n')
+        f.write('{"ts": 2, "route": "/chat", "session": null, "message": "second"}\n')
+    assert [entry['message'] for entry in replay.load_recording(recording)] == ['first', 'second', 'third']
+    assert [entry['message'] for entry in replay.load_recording(recording, limit=2)] == ['first', 'second']
+
+def test_recording_replays_in_process(recording):
+    recorder = main.TrafficRecorder(recording, salt='salt')
+    for message, session in [('What does it cost?', 'a'), ('tell me more', 'a'), ('hi', 'b'), ('', 'b')]:
+        recorder.record('/chat', message, session)
+    recorder.record('/chat/stream', 'Where are you located', 'b')
+    recorded(recorder)
+    results, elapsed = replay.replay(replay.load_recording(recording), replay.TestClientTarget(), speed=0, concurrency=2)
+    assert sorted(status for status, _, _ in results) == [200, 200, 200, 200, 400]
+    assert elapsed > 0 and all(latency >= 0 for _, latency, _ in results)
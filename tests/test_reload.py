@@ -0,0 +1,194 @@
+"""Knowledge base hot reload: snapshots are built aside and swapped in whole."""
+import copy
+import itertools
+import json
+import os
+import threading
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+with open(main.KNOWLEDGE_BASE_PATH, encoding='utf-8') as f:
+    BASE_DATA = json.load(f)
+
+# Modification times of the files written here: each write gets its own
+# version, however coarse the file system's clock
+STAMPS = itertools.count(10 ** 18, 1000)
+
+def write_kb(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    stamp = next(STAMPS)
+    os.utime(path, ns=(stamp, stamp))
+
+@pytest.fixture
+def kb_path(tmp_path):
+    path = str(tmp_path / 'knowledge_base.json')
+    write_kb(path, BASE_DATA)
+    return path
+
+@pytest.fixture
+def bot(kb_path):
+    return main.AdvancedChatbot(main.Knowledge.from_file(kb_path))
+
+def edited(change):
+    data = copy.deepcopy(BASE_DATA)
+    change(data)
+    return data
+
+def test_reload_keeps_hot_queries_cached(kb_path, bot):
+    for query in ['How much does it cost?', 'Where are you located', 'hello there']:
+        bot.resolve(query)
+    old_keys = bot.response_cache.keys()
+    write_kb(kb_path, edited(lambda data: data['fallback'].update(menu='New menu')))
+    assert main.KnowledgeWatcher(bot, kb_path).check()
+    keys = bot.response_cache.keys()
+    # Same queries, most recently used last, as in the old cache
+    assert keys[-len(old_keys):] == old_keys
+    assert set(keys) >= {bot.preprocess_query(query) for query in main.QUICK_QUESTIONS}
+
+def counter(name, labels=''):
+    return main.METRICS.counters.get((name, labels), 0)
+
+def test_warming_records_no_metrics(kb_path, bot):
+    bot.resolve('How much does it cost?')
+    misses = counter('chat_cache_misses_total')
+    write_kb(kb_path, BASE_DATA)
+    assert main.KnowledgeWatcher(bot, kb_path).check()
+    assert counter('chat_cache_misses_total') == misses
+    assert not any(version == bot.knowledge.version for version, _ in main.METRICS.intent_masks)
+
+def test_warming_stops_at_the_cache_size(kb_path):
+    bot = main.AdvancedChatbot(main.Knowledge.from_file(kb_path, cache_size=3))
+    bot.warm(['one', 'two', 'three', 'four', 'two'])
+    assert bot.response_cache.keys() == ['three', 'four', 'two']
+
+def reversed_intents(data):
+    data['intents'] = dict(reversed(list(data['intents'].items())))
+
+def test_follow_ups_ignore_turns_of_another_version(kb_path, bot):
+    pricing = main.converse('What does it cost?', 'reordered', bot)[1]
+    assert main.converse('tell me more', 'reordered', bot)[1] is pricing
+    main.converse('What does it cost?', 'reordered', bot)
+    write_kb(kb_path, edited(reversed_intents))
+    assert main.KnowledgeWatcher(bot, kb_path).check()
+    # The remembered mask's bits now stand for other intents: it is not used
+    mask, plan = main.converse('tell me more', 'reordered', bot)
+    assert mask == 0 and plan.sections != pricing.sections
+    main.converse('What does it cost?', 'reordered', bot)
+    assert main.converse('tell me more', 'reordered', bot)[1].sections == pricing.sections
+
+def test_turns_of_another_version_are_replaced():
+    store = main.ConversationStore()
+    store.record('s', 0b10, 'old', ('v', 1))
+    assert store.context_mask('s', ('v', 2)) == 0
+    store.record('s', 0b100, 'new', ('v', 2))
+    assert len(store.turns('s', ('v', 2))) == 1
+    assert store.context_mask('s', ('v', 1)) == 0
+    assert store.context_mask('s', ('v', 2)) == 0b100
+
+def test_intent_counts_keep_their_names_across_a_reload(kb_path, bot):
+    pricing = counter('chat_intents_total', 'intent="pricing"')
+    bot.resolve('What does it cost?')
+    old_version = bot.knowledge.version
+    write_kb(kb_path, edited(reversed_intents))
+    assert main.KnowledgeWatcher(bot, kb_path).check()
+    # The old version's counts became named counters before its intent table went away
+    assert counter('chat_intents_total', 'intent="pricing"') == pricing + 1
+    assert not any(version == old_version for version, _ in main.METRICS.intent_masks)
+    bot.resolve('What is the price?')
+    samples = bot.collect_metrics(dict(main.METRICS.intent_masks))
+    assert ('chat_intents_total', 'intent="pricing"', 1) in samples
+
+def marked(marker):
+    """The base knowledge with every response text ending in marker"""
+    def mark(data):
+        for section in data['responses']:
+            section['variants'] = [variant + marker for variant in section['variants']]
+        data['fallback']['menu'] += marker
+    return edited(mark)
+
+def test_unchanged_file_is_not_reloaded(kb_path, bot):
+    knowledge = bot.knowledge
+    assert not main.KnowledgeWatcher(bot, kb_path).check()
+    assert bot.knowledge is knowledge
+
+def test_edited_file_is_swapped_in(kb_path, bot):
+    watcher = main.KnowledgeWatcher(bot, kb_path)
+    published = []
+    watcher.listeners.append(published.append)
+    write_kb(kb_path, marked(' [new]'))
+    # Nothing changes until the watcher looks
+    assert not bot.generate_response('What does it cost?').endswith(' [new]')
+    assert watcher.check()
+    assert bot.generate_response('What does it cost?').endswith(' [new]')
+    assert published == [bot.knowledge]
+    assert bot.knowledge.version == main.file_stamp(kb_path)
+
+@pytest.mark.parametrize('content', [
+    '{"knowledge_base": ',
+    '[]',
+    json.dumps(edited(lambda data: data.pop('fallback'))),
+    json.dumps(edited(lambda data: data['responses'][0].update(intents=['no_such_intent']))),
+    json.dumps(edited(lambda data: data['intents'].update(pricing='price'))),
+])
+def test_broken_file_keeps_the_old_version(kb_path, bot, monkeypatch, content):
+    knowledge = bot.knowledge
+    answer = bot.generate_response('What does it cost?')
+    with open(kb_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.utime(kb_path, ns=(next(STAMPS),) * 2)
+    watcher = main.KnowledgeWatcher(bot, kb_path)
+    assert not watcher.check()
+    assert bot.knowledge is knowledge
+    assert bot.generate_response('What does it cost?') == answer
+    assert watcher.failed_stamp == main.file_stamp(kb_path)
+
+    # The same broken file isn't loaded again on every poll...
+    loads = []
+    monkeypatch.setattr(main.Knowledge, 'from_file', classmethod(lambda cls, path: loads.append(path)))
+    assert not watcher.check()
+    assert loads == []
+    monkeypatch.undo()
+    # ...but a fixed one is
+    write_kb(kb_path, marked(' [fixed]'))
+    assert watcher.check()
+    assert bot.generate_response('What does it cost?').endswith(' [fixed]')
+
+def test_missing_file_keeps_the_old_version(kb_path, bot):
+    knowledge = bot.knowledge
+    os.remove(kb_path)
+    assert not main.KnowledgeWatcher(bot, kb_path).check()
+    assert bot.knowledge is knowledge
+
+def test_answers_never_mix_versions(kb_path, bot):
+    versions = {' [A]': marked(' [A]'), ' [B]': marked(' [B]')}
+    write_kb(kb_path, versions[' [A]'])
+    watcher = main.KnowledgeWatcher(bot, kb_path)
+    watcher.check()
+    # Three sections, and a fallback answer
+    queries = ['hi, what is your email and price?', 'zzz qqq']
+    answers = []
+    done = threading.Event()
+
+    def ask():
+        while not done.is_set():
+            for query in queries:
+                answers.append(bot.generate_response(query))
+
+    asker = threading.Thread(target=ask)
+    asker.start()
+    try:
+        for marker in [' [B]', ' [A]'] * 10:
+            write_kb(kb_path, versions[marker])
+            assert watcher.check()
+    finally:
+        done.set()
+        asker.join()
+    assert answers
+    for answer in answers:
+        assert len([marker for marker in versions if marker in answer]) == 1, answer
@@ -0,0 +1,101 @@
+"""The response table against the original chain of per-intent sections."""
+import itertools
+import os
+import random
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+# The original get_contextual_response: each section with the intents that
+# trigger it, in answer order
+BASELINE_SECTIONS = [
+    ('greeting',),
+    ('services',),
+    ('product', 'technical'),
+    ('company',),
+    ('contact',),
+    ('energy',),
+    ('benefits',),
+    ('pricing',),
+    ('farewell',),
+]
+
+KNOWLEDGE = main.chatbot.knowledge
+INTENTS = KNOWLEDGE.intent_matcher.intents
+TABLE = KNOWLEDGE.response_table
+
+def variants(section_intents):
+    for intents, section_variants in KNOWLEDGE.response_sections:
+        if intents == section_intents:
+            return section_variants
+    raise KeyError(section_intents)
+
+def baseline_response(intents):
+    """What the original if-chain answered for intents (None: the fallback)"""
+    responses = []
+    for section_intents in BASELINE_SECTIONS:
+        if any(intent in intents for intent in section_intents):
+            section_variants = variants(section_intents)
+            responses.append(random.choice(section_variants) if len(section_variants) > 1 else section_variants[0])
+    return "\n\n".join(responses) if responses else None
+
+def rendered(plan, seed):
+    random.seed(seed)
+    return plan.render() if plan is not None else None
+
+def expected(intents, seed):
+    random.seed(seed)
+    return baseline_response(intents)
+
+def test_baseline_sections_cover_the_knowledge_base():
+    assert sorted(intents for intents, _ in KNOWLEDGE.response_sections) == sorted(BASELINE_SECTIONS)
+
+@pytest.mark.parametrize('intent', INTENTS)
+def test_single_intents_match_the_baseline(intent):
+    for seed in range(3):
+        assert rendered(TABLE.plan(KNOWLEDGE.intent_matcher.mask_for([intent])), seed) == expected([intent], seed)
+
+def test_single_intent_queries_match_the_baseline():
+    for intent, keywords in KNOWLEDGE.intent_keywords.items():
+        if expected([intent], 0) is None:
+            continue
+        random.seed(0)
+        answer = main.chatbot.generate_response(keywords[0])
+        assert answer == expected(main.chatbot.extract_intent(keywords[0]), 0)
+
+@pytest.mark.parametrize('size', [2, 3, len(INTENTS)])
+def test_combined_intents_match_the_baseline(size):
+    for intents in itertools.combinations(INTENTS, size):
+        mask = KNOWLEDGE.intent_matcher.mask_for(intents)
+        assert rendered(TABLE.plan(mask), 7) == expected(intents, 7), intents
+
+def test_every_combination_is_precomputed():
+    for size in range(1, len(INTENTS) + 1):
+        for intents in itertools.combinations(INTENTS, size):
+            fired = TABLE.fired(KNOWLEDGE.intent_matcher.mask_for(intents))
+            assert not fired or TABLE.plans[fired] is TABLE.plan(KNOWLEDGE.intent_matcher.mask_for(intents))
+    assert TABLE.complete
+
+def test_lookups_never_change_the_table():
+    plans = dict(TABLE.plans)
+    for mask in range(1 << len(INTENTS)):
+        TABLE.plan(mask)
+        TABLE.fired(mask)
+    main.chatbot.collect_metrics({(KNOWLEDGE.version, mask): 1 for mask in range(64)})
+    assert TABLE.plans == plans
+
+def test_oversized_tables_build_the_rest_per_call(monkeypatch):
+    monkeypatch.setattr(main.ResponseTable, 'MAX_PLANS', 20)
+    table = main.ResponseTable(KNOWLEDGE.intent_matcher, KNOWLEDGE.response_sections)
+    assert len(table.plans) == 20 and not table.complete
+    # The single-intent plans come first
+    assert all(mask in table.plans for mask in table.section_masks if mask)
+    everything = KNOWLEDGE.intent_matcher.all_mask
+    assert table.fired(everything) not in table.plans
+    random.seed(3)
+    assert table.plan(everything).render() == expected(INTENTS, 3)
+    assert len(table.plans) == 20
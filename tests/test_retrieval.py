@@ -0,0 +1,73 @@
+"""BM25 fallback ranking against a plain-Python reference implementation."""
+import os
+import random
+import re
+from math import log
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+np = pytest.importorskip('numpy')
+
+def reference_scores(texts, query, k1=1.2, b=0.75):
+    """Okapi BM25 with the non-negative idf, written out term by term"""
+    docs = [re.findall(r'[^\W_]+', ' '.join(text)) for text in texts]
+    average_length = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in query:
+            containing = sum(term in other for other in docs)
+            if not containing:
+                continue
+            idf = log(1 + (len(docs) - containing + 0.5) / (containing + 0.5))
+            tf = doc.count(term)
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / average_length))
+        scores.append(score)
+    return scores
+
+TEXTS = [
+    ('pricing', 'plans start at ten euros per month'),
+    ('contact', 'email us or call us any day'),
+    ('energy', 'energy savings and energy reports for every site'),
+    ('company', 'founded in lisbon'),
+]
+
+def test_hand_computed_score():
+    retriever = main.KnowledgeRetriever(TEXTS)
+    # "energy" is in one of four entries: three times (key included) among its 9 terms; 7.25 on average
+    idf = log(1 + 3.5 / 1.5)
+    expected = idf * 3 * 2.2 / (3 + 1.2 * (0.25 + 0.75 * 9 / 7.25))
+    assert retriever.score_many([['energy']])[0].tolist() == pytest.approx([0, 0, expected, 0])
+
+def test_scores_match_the_reference():
+    texts = main.chatbot.knowledge.knowledge_index.texts
+    retriever = main.KnowledgeRetriever(texts)
+    vocabulary = sorted(retriever.vocabulary)
+    rng = random.Random(5)
+    queries = [rng.sample(vocabulary, rng.randint(1, 6)) + ['unknownword'] for _ in range(50)]
+    queries.append(['energy', 'energy'])
+    scores = retriever.score_many(queries)
+    for query, row in zip(queries, scores):
+        assert row.tolist() == pytest.approx(reference_scores(texts, query), rel=1e-9, abs=1e-12)
+
+def test_top_k_ranks_by_score_then_kb_order():
+    texts = TEXTS + [('savings', 'energy savings')]
+    retriever = main.KnowledgeRetriever(texts)
+    reference = reference_scores(texts, ['savings', 'month'])
+    expected = sorted((entry for entry in range(len(texts)) if reference[entry] > 0), key=lambda entry: (-reference[entry], entry))
+    assert [entry for entry, _ in retriever.top_k(['savings', 'month'])] == expected[:3]
+    assert retriever.top_k(['nothing']) == []
+    # Equal scores keep knowledge base order
+    twins = main.KnowledgeRetriever([('a', 'same words'), ('b', 'other'), ('c', 'same words')])
+    assert [entry for entry, _ in twins.top_k(['same'])] == [0, 2]
+
+def test_batches_score_like_single_queries():
+    retriever = main.KnowledgeRetriever(TEXTS)
+    queries = [['energy'], [], ['email', 'month'], ['nothing']]
+    batched = retriever.top_k_many(queries, chunk_size=3)
+    assert batched == [retriever.top_k(query) for query in queries]
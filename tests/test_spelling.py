@@ -0,0 +1,55 @@
+"""Typo correction: misspelt keywords are fixed, real English words are left alone."""
+import os
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+@pytest.mark.parametrize('word', ['contracts', 'teach', 'beach', 'coast', 'prize', 'pools'])
+def test_common_words_are_not_corrected(word):
+    assert main.chatbot.knowledge.spelling.correct(word) is None
+    assert main.chatbot.extract_intent(word) == ['general']
+
+def test_real_words_add_no_intent():
+    assert main.chatbot.extract_intent('Do you review contracts?') == ['general']
+
+@pytest.mark.parametrize('word, intent', [
+    ('pricng', 'pricing'),
+    ('contcat', 'contact'),
+    ('compnay', 'company'),
+    ('platfrom', 'product'),
+    ('benifits', 'benefits'),
+    ('optimzation', 'energy'),
+    ('subscripton', 'pricing'),
+])
+def test_typos_are_corrected(word, intent):
+    assert main.chatbot.extract_intent(word) == [intent]
+
+@pytest.mark.parametrize('word, intent', [
+    ('cosst', 'pricing'),
+    ('emial', 'contact'),
+    ('toool', 'product'),
+    ('phnoe', 'contact'),
+])
+def test_common_slips_in_short_words_are_corrected(word, intent):
+    assert main.chatbot.extract_intent(word) == [intent]
+
+@pytest.mark.parametrize('word', ['brice', 'toole', 'prise', 'ricing', 'savas'])
+def test_short_words_are_not_taken_for_other_words(word):
+    # A replaced, added or missing first letter in a short word is more often another word than a typo
+    assert main.chatbot.knowledge.spelling.correct(word) is None
+    assert main.chatbot.extract_intent(word) == ['general']
+
+def test_common_words_file_matches_its_generator():
+    import build_common_words
+
+    with open(main.COMMON_WORDS_PATH, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    header = [line for line in lines if line.startswith('#')]
+    words = [line for line in lines if not line.startswith('#')]
+    assert '\n'.join(header) + '\n' == build_common_words.HEADER.format(top=25000)
+    assert words == sorted(set(words)) and frozenset(words) == main.COMMON_WORDS
+    assert all(main.SpellingIndex.MIN_LENGTH <= len(word) <= main.SpellingIndex.MAX_LENGTH for word in words)
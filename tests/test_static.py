@@ -0,0 +1,118 @@
+"""The landing page and fingerprinted assets: ETags, 304s and encoding negotiation."""
+import gzip
+import json
+import os
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+def decoded(body, coding):
+    if coding == 'gzip':
+        return gzip.decompress(body)
+    if coding == 'br':
+        return main.brotli.decompress(body)
+    return body
+
+PAGE = main.INDEX_PAGE.variants['identity']
+
+@pytest.mark.parametrize('accept_encoding, coding', [
+    ('', None),
+    ('gzip', 'gzip'),
+    ('gzip, deflate, br', 'br' if main.brotli is not None else 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('gzip;q=0', None),
+    ('*', 'br' if main.brotli is not None else 'gzip'),
+    ('deflate', None),
+])
+def test_index_picks_the_best_accepted_encoding(client, accept_encoding, coding):
+    response = client.get('/', headers={'Accept-Encoding': accept_encoding})
+    assert response.status_code == 200
+    assert response.headers.get('Content-Encoding') == coding
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert response.headers['Content-Type'] == 'text/html; charset=utf-8'
+    assert response.headers['ETag'] == main.INDEX_PAGE.etags[coding or 'identity']
+    assert decoded(response.data, coding) == PAGE
+
+def test_each_encoding_has_its_own_etag():
+    etags = main.INDEX_PAGE.etags
+    assert len(set(etags.values())) == len(etags)
+    assert etags['gzip'] == etags['identity'][:-1] + '-gzip"'
+
+@pytest.mark.parametrize('if_none_match', ['{etag}', 'W/{etag}', '"other", {etag}', '*'])
+def test_unchanged_index_gets_304(client, if_none_match):
+    etag = main.INDEX_PAGE.etags['gzip']
+    response = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': if_none_match.format(etag=etag)})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert 'Content-Encoding' not in response.headers
+
+def test_etag_of_another_encoding_gets_the_page(client):
+    response = client.get('/', headers={'If-None-Match': main.INDEX_PAGE.etags['gzip']})
+    assert response.status_code == 200 and response.data == PAGE
+
+def write_asset_build(directory, name, body):
+    """A build_assets.py output directory with one asset and its compressed variants"""
+    with open(os.path.join(directory, name), 'wb') as f:
+        f.write(body)
+    with open(os.path.join(directory, name + '.gz'), 'wb') as f:
+        f.write(gzip.compress(body, mtime=0))
+    if main.brotli is not None:
+        with open(os.path.join(directory, name + '.br'), 'wb') as f:
+            f.write(main.brotli.compress(body))
+    with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'app.css': name}, f)
+
+CSS = b'body{margin:0}' * 100
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    write_asset_build(str(tmp_path), 'app.0123abcd.css', CSS)
+    loaded = main.load_assets(str(tmp_path))
+    monkeypatch.setattr(main, 'ASSETS', loaded)
+    return loaded
+
+@pytest.mark.parametrize('accept_encoding', ['', 'gzip', 'br, gzip'])
+def test_assets_are_served_from_memory(client, assets, accept_encoding):
+    response = client.get('/static/dist/app.0123abcd.css', headers={'Accept-Encoding': accept_encoding})
+    coding = response.headers.get('Content-Encoding')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == main.IMMUTABLE_CACHE_CONTROL
+    assert response.headers['Content-Type'] == 'text/css; charset=utf-8'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert decoded(response.data, coding) == CSS
+    expected = {'': None, 'gzip': 'gzip', 'br, gzip': 'br' if main.brotli is not None else 'gzip'}
+    assert coding == expected[accept_encoding]
+
+def test_unchanged_asset_gets_304(client, assets):
+    etag = assets['app.0123abcd.css'].etags['identity']
+    response = client.get('/static/dist/app.0123abcd.css', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+
+def test_unknown_asset_gets_404(client, assets):
+    assert client.get('/static/dist/app.ffffffff.css').status_code == 404
+
+def test_missing_build_serves_no_assets(tmp_path):
+    assert main.load_assets(str(tmp_path)) == {}
+
+def test_head_over_asgi_sends_only_headers(asgi):
+    status, headers, body = asgi('HEAD', '/', headers=[('Accept-Encoding', 'gzip')])
+    assert status == 200 and body == b''
+    assert headers['content-length'] == str(len(main.INDEX_PAGE.variants['gzip']))
+    assert headers['etag'] == main.INDEX_PAGE.etags['gzip']
+
+def test_index_over_asgi(asgi):
+    status, headers, body = asgi('GET', '/', headers=[('Accept-Encoding', 'gzip')])
+    assert status == 200 and gzip.decompress(body) == PAGE
+    assert headers['content-encoding'] == 'gzip' and headers['vary'] == 'Accept-Encoding'
+    status, _, body = asgi('GET', '/', headers=[('Accept-Encoding', 'gzip'), ('If-None-Match', headers['etag'])])
+    assert status == 304 and body == b''
@@ -0,0 +1,67 @@
+"""/chat/stream: the answer as server-sent events, one per section."""
+import json
+import os
+import random
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+QUERY = 'hi, what is your email and price?'
+
+def parse_events(body):
+    """(event, data) pairs of an event stream, checking each event's framing"""
+    text = body.decode('utf-8')
+    assert text.endswith('\n\n')
+    events = []
+    for block in text[:-2].split('\n\n'):
+        event_line, data_line = block.split('\n')
+        assert event_line.startswith('event: ') and data_line.startswith('data: ')
+        events.append((event_line[len('event: '):], json.loads(data_line[len('data: '):])))
+    return events
+
+def test_sse_event_framing():
+    event = main.sse_event('section', {"text": "two\n\nparagraphs"})
+    assert event == 'event: section\ndata: {"text": "two\\n\\nparagraphs"}\n\n'
+    assert parse_events(event.encode('utf-8')) == [('section', {"text": "two\n\nparagraphs"})]
+
+def test_each_section_is_its_own_chunk():
+    random.seed(2)
+    status, chunks, headers = main.handle_chat_stream({"message": QUERY})
+    assert status == 200
+    assert headers == main.STREAM_HEADERS
+    events = [parse_events(chunk) for chunk in chunks]
+    assert all(len(chunk_events) == 1 for chunk_events in events)
+    sections = [data['text'] for (event, data), in events[:-1]]
+    assert events[-1] == [('done', {"success": True})]
+    random.seed(2)
+    assert '\n\n'.join(sections) == json.loads(main.handle_chat({"message": QUERY})[1])['response']
+    assert len(sections) == 3
+
+def test_stream_over_flask():
+    response = main.app.test_client().post('/chat/stream', json={"message": QUERY})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert 'Content-Encoding' not in response.headers
+    events = parse_events(response.data)
+    assert [event for event, _ in events] == ['section'] * 3 + ['done']
+
+def test_stream_over_asgi(asgi):
+    status, headers, body = asgi('POST', '/chat/stream', json.dumps({"message": QUERY}).encode('utf-8'),
+                                 [('Accept-Encoding', 'gzip')])
+    assert status == 200
+    assert headers['content-type'] == 'text/event-stream; charset=utf-8'
+    assert headers['x-accel-buffering'] == 'no'
+    assert 'content-encoding' not in headers
+    assert [event for event, _ in parse_events(body)] == ['section'] * 3 + ['done']
+
+@pytest.mark.parametrize('message, status', [('', 400), ('a' * (main.CHAT_MAX_MESSAGE_CHARS + 1), 413)])
+def test_rejected_messages_get_a_json_error(message, status):
+    response = main.app.test_client().post('/chat/stream', json={"message": message})
+    assert response.status_code == status
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.data)['success'] is False
@@ -0,0 +1,126 @@
+"""Tenants: per-brand knowledge bases loaded on demand and routed by path or Host."""
+import copy
+import json
+import os
+
+import pytest
+
+os.environ['CHAT_INTENT_MODEL'] = ''
+os.environ['CHAT_RECORD_PATH'] = ''
+
+import main
+
+with open(main.KNOWLEDGE_BASE_PATH, encoding='utf-8') as f:
+    BASE_DATA = json.load(f)
+
+def write_tenant(directory, name, marker, stamp=10 ** 18):
+    """A copy of the default knowledge base whose answers end in marker"""
+    data = copy.deepcopy(BASE_DATA)
+    for section in data['responses']:
+        section['variants'] = [variant + marker for variant in section['variants']]
+    path = os.path.join(directory, name + '.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.utime(path, ns=(stamp, stamp))
+
+@pytest.fixture
+def registry(tmp_path, clock):
+    for name in ['acme', 'globex', 'initech']:
+        write_tenant(str(tmp_path), name, f' [{name}]')
+    return main.TenantRegistry(str(tmp_path), max_loaded=2, idle_ttl=60, cache_size=16)
+
+def test_tenants_are_loaded_on_first_use(registry, monkeypatch):
+    loads = []
+    load = registry.load
+    monkeypatch.setattr(registry, 'load', lambda name: loads.append(name) or load(name))
+    assert registry.names() == {'acme', 'globex', 'initech'}
+    assert registry.loaded() == []
+    bot = registry.get('acme')
+    assert bot.tenant == 'acme' and bot.response_cache.max_size == 16
+    assert bot.generate_response('What does it cost?').endswith(' [acme]')
+    assert registry.get('acme') is bot
+    assert loads == ['acme'] and registry.loaded() == ['acme']
+
+def test_idle_tenants_are_unloaded(registry, clock):
+    registry.get('acme')
+    clock.advance(30)
+    registry.get('globex')
+    clock.advance(31)
+    assert registry.loaded() == ['globex']
+    clock.advance(30)
+    assert registry.loaded() == []
+
+def test_least_recently_used_tenant_is_unloaded_over_the_limit(registry):
+    acme = registry.get('acme')
+    registry.get('globex')
+    assert registry.get('acme') is acme
+    registry.get('initech')
+    assert registry.loaded() == ['acme', 'initech']
+
+def test_edited_tenant_is_reloaded(registry, clock, tmp_path):
+    bot = registry.get('acme')
+    write_tenant(str(tmp_path), 'acme', ' [acme v2]', stamp=10 ** 18 + 1000)
+    # The file is looked at again once the poll interval has passed
+    assert registry.get('acme') is bot
+    clock.advance(main.CHAT_KB_POLL_INTERVAL + 1)
+    reloaded = registry.get('acme')
+    assert reloaded is not bot
+    assert reloaded.generate_response('What does it cost?').endswith(' [acme v2]')
+
+@pytest.mark.parametrize('name', ['nobody', 'Acme', '../acme', ''])
+def test_unknown_tenants_are_not_found(registry, name):
+    assert registry.get(name) is None
+    assert registry.loaded() == []
+
+def test_vocabulary_is_shared_between_tenants(registry):
+    acme = registry.get('acme').knowledge
+    globex = registry.get('globex').knowledge
+    # Both were parsed from their own files, yet hold the same string objects
+    globex_words = {word: word for word in globex.knowledge_index.postings}
+    assert acme.knowledge_index.postings.keys() == globex_words.keys()
+    assert all(globex_words[word] is word for word in acme.knowledge_index.postings)
+    assert all(a is b for a, b in zip(acme.intent_matcher.intents, globex.intent_matcher.intents))
+
+@pytest.fixture
+def routed(registry, monkeypatch):
+    monkeypatch.setattr(main, 'tenants', registry)
+    return registry
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+def answer(response):
+    return json.loads(response.data)['response']
+
+def test_path_selects_the_tenant(routed, client):
+    response = client.post('/t/globex/chat', json={"message": "What does it cost?"})
+    assert response.status_code == 200
+    assert answer(response).endswith(' [globex]')
+
+def test_host_selects_the_tenant(routed, client):
+    response = client.post('/chat', json={"message": "What does it cost?"}, headers={'Host': 'initech.example.com:8080'})
+    assert answer(response).endswith(' [initech]')
+    # The path wins over the host
+    response = client.post('/t/acme/chat', json={"message": "What does it cost?"}, headers={'Host': 'initech.example.com'})
+    assert answer(response).endswith(' [acme]')
+
+def test_other_hosts_get_the_default_assistant(routed, client):
+    response = client.post('/chat', json={"message": "What does it cost?"}, headers={'Host': 'www.example.com'})
+    assert response.status_code == 200
+    assert not answer(response).endswith(']')
+    assert routed.loaded() == []
+
+def test_unknown_path_tenant_gets_404(routed, client):
+    response = client.post('/t/nobody/chat', json={"message": "What does it cost?"})
+    assert response.status_code == 404
+    assert response.data == main.UNKNOWN_TENANT_ERROR
+
+def test_tenants_are_routed_over_asgi(routed, asgi):
+    body = json.dumps({"message": "What does it cost?"}).encode('utf-8')
+    status, _, payload = asgi('POST', '/t/globex/chat', body)
+    assert status == 200 and json.loads(payload)['response'].endswith(' [globex]')
+    status, _, payload = asgi('POST', '/chat', body, [('Host', 'acme.example.com')])
+    assert status == 200 and json.loads(payload)['response'].endswith(' [acme]')
+    status, _, payload = asgi('POST', '/t/nobody/chat', body)
+    assert status == 404 and payload == main.UNKNOWN_TENANT_ERROR
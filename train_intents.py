@@ -0,0 +1,144 @@
+"""Train the intent classifier the app uses when intent_model.npz exists.
+
+Reads labelled messages from a JSONL file, one {"text": ..., "intents":
+[...]} object per line (an empty list marks a message with no intent), and
+fits one logistic regression per intent over the hashed n-gram features of
+main.IntentClassifier, by full-batch gradient descent in NumPy. A holdout
+share of the data picks each intent's probability threshold (the one with
+the best F1, never below --min-threshold) and is scored with it; the final
+model is then refit on all of the data.
+
+    python train_intents.py                                  # intents_sample.jsonl -> intent_model.candidate.npz
+    python train_intents.py labelled.jsonl --output model.npz --dims 16384
+
+The app only asks the classifier about messages with no keyword from
+knowledge_base.json, so thresholds are better set high than low. The model
+is written next to, not over, the one the app loads: check the holdout
+scores, then rename it to intent_model.npz (or point CHAT_INTENT_MODEL at
+it) and restart the app.
+"""
+import argparse
+import json
+import random
+import sys
+
+import numpy as np
+
+from main import TOKEN_RE, IntentClassifier
+
+def load_examples(path):
+    """(tokens, intents) pairs; lines that don't parse are skipped"""
+    examples = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and isinstance(entry.get('text'), str):
+                examples.append((TOKEN_RE.findall(entry['text'].lower()), list(entry.get('intents') or [])))
+    return examples
+
+def feature_matrix(token_lists, dims):
+    """Dense (examples, dims) matrix with the same feature weights the app scores with"""
+    matrix = np.zeros((len(token_lists), dims), dtype=np.float32)
+    for row, tokens in enumerate(token_lists):
+        features = IntentClassifier.hashed_features(tokens, dims)
+        if features:
+            np.add.at(matrix[row], features, len(features) ** -0.5)
+    return matrix
+
+def label_matrix(label_lists, intents):
+    labels = np.zeros((len(label_lists), len(intents)), dtype=np.float32)
+    for row, names in enumerate(label_lists):
+        for name in names:
+            labels[row, intents.index(name)] = 1.0
+    return labels
+
+def fit(features, labels, epochs, learning_rate, l2):
+    """Weights and biases minimising the mean logistic loss plus an L2 penalty (Adam updates).
+
+    Each intent's positives weigh as much in total as its negatives, or the
+    rarer intents would hardly ever clear their thresholds.
+    """
+    positives = labels.sum(axis=0)
+    positive_weight = np.where(positives > 0, (len(labels) - positives) / np.maximum(positives, 1), 1.0)
+    example_weights = np.where(labels > 0, positive_weight, 1.0).astype(np.float32)
+    weights = np.zeros((features.shape[1], labels.shape[1]), dtype=np.float32)
+    bias = np.zeros(labels.shape[1], dtype=np.float32)
+    moments = [[np.zeros_like(weights), np.zeros_like(weights)], [np.zeros_like(bias), np.zeros_like(bias)]]
+    for step in range(1, epochs + 1):
+        probabilities = 1.0 / (1.0 + np.exp(-(features @ weights + bias)))
+        error = example_weights * (probabilities - labels) / len(features)
+        gradients = (features.T @ error + l2 * weights, error.sum(axis=0))
+        for param, gradient, moment in zip((weights, bias), gradients, moments):
+            moment[0] = 0.9 * moment[0] + 0.1 * gradient
+            moment[1] = 0.999 * moment[1] + 0.001 * gradient * gradient
+            param -= learning_rate * (moment[0] / (1 - 0.9 ** step)) / (np.sqrt(moment[1] / (1 - 0.999 ** step)) + 1e-8)
+    return weights, bias
+
+def precision_recall(predicted, actual):
+    true_positives = float(np.sum(predicted & actual))
+    precision = true_positives / max(np.sum(predicted), 1)
+    recall = true_positives / max(np.sum(actual), 1)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+def tune_thresholds(probabilities, labels, min_threshold):
+    """Per intent, the threshold in [min_threshold, 0.95] with the best F1 (the lowest on ties)"""
+    candidates = np.round(np.arange(min_threshold, 0.951, 0.05), 2)
+    thresholds = []
+    for column in range(labels.shape[1]):
+        actual = labels[:, column] > 0
+        scores = [precision_recall(probabilities[:, column] >= threshold, actual)[2] for threshold in candidates]
+        thresholds.append(candidates[int(np.argmax(scores))])
+    return np.array(thresholds, dtype=np.float32)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data', nargs='?', default='intents_sample.jsonl', help='labelled JSONL (default intents_sample.jsonl)')
+    parser.add_argument('--output', default='intent_model.candidate.npz',
+                        help='model file to write (default intent_model.candidate.npz)')
+    parser.add_argument('--dims', type=int, default=1 << 14, help='hashed feature dimensions (default 16384)')
+    parser.add_argument('--epochs', type=int, default=300, help='gradient steps (default 300)')
+    parser.add_argument('--learning-rate', type=float, default=0.05, help='Adam step size (default 0.05)')
+    parser.add_argument('--l2', type=float, default=1e-4, help='L2 penalty on the weights (default 1e-4)')
+    parser.add_argument('--holdout', type=float, default=0.2, help='share of examples kept for tuning thresholds (default 0.2)')
+    parser.add_argument('--min-threshold', type=float, default=0.5, help='lowest threshold an intent may get (default 0.5)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    examples = load_examples(args.data)
+    if not examples:
+        print(f"No labelled messages found in {args.data}")
+        return 1
+    intents = sorted({name for _, names in examples for name in names})
+    random.Random(args.seed).shuffle(examples)
+    features = feature_matrix([tokens for tokens, _ in examples], args.dims)
+    labels = label_matrix([names for _, names in examples], intents)
+
+    split = len(examples) - int(len(examples) * args.holdout)
+    if 0 < split < len(examples):
+        weights, bias = fit(features[:split], labels[:split], args.epochs, args.learning_rate, args.l2)
+        model = IntentClassifier(intents, weights, bias, np.full(len(intents), args.min_threshold))
+        probabilities = model.probabilities([tokens for tokens, _ in examples[split:]])
+        thresholds = tune_thresholds(probabilities, labels[split:], args.min_threshold)
+        predicted = probabilities >= thresholds
+        actual = labels[split:] > 0
+        print(f"holdout of {len(examples) - split} messages:")
+        print(f"{'intent':<14} {'threshold':>9} {'precision':>9} {'recall':>7} {'f1':>6}")
+        for column, intent in enumerate(intents):
+            precision, recall, f1 = precision_recall(predicted[:, column], actual[:, column])
+            print(f"{intent:<14} {thresholds[column]:>9.2f} {precision:>9.2f} {recall:>7.2f} {f1:>6.2f}")
+        precision, recall, f1 = precision_recall(predicted, actual)
+        print(f"{'all':<14} {'':>9} {precision:>9.2f} {recall:>7.2f} {f1:>6.2f}")
+    else:
+        thresholds = np.full(len(intents), args.min_threshold, dtype=np.float32)
+
+    weights, bias = fit(features, labels, args.epochs, args.learning_rate, args.l2)
+    IntentClassifier(intents, weights, bias, thresholds).save(args.output)
+    print(f"Wrote {args.output}: {len(intents)} intents, {len(examples)} messages, {args.dims} dims")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())